@@ -1,15 +1,21 @@
+import logging
 import os
 from typing import TypeVar
 
 import numpy as np
-import requests
 from keras.preprocessing import image
 import keras
 from langchain.agents import tool
 from langchain.pydantic_v1 import BaseModel, Field
 from langchain_core.prompts import PromptTemplate
 
+from InferenceServer import InferenceServer
 from RetrievalGraph import RetrievalGraph
+from WeatherClient import WeatherClient
+from WeatherSummary import summarize as summarize_weather
+import ZoneCalculators
+
+log = logging.getLogger(__name__)
 
 # Type variable for PIL image
 ImageBin = TypeVar('PIL.Image.Image')
@@ -31,6 +37,7 @@ class PImage(BaseModel):
 class Location(BaseModel):
     latitude: str = Field(..., description="The latitude of the location to get the weather for")
     longitude: str = Field(..., description="The longitude of the location to get the weather for")
+    raw: bool = Field(False, description="Return the full hourly weatherapi.com response instead of the daily summary")
 
 
 class ImageNumpy(BaseModel):
@@ -51,8 +58,8 @@ class Guidance(BaseModel):
     guidance: str = Field(..., description="Guidance to give in your response for the topic")
 
 
-# Load environment variable for weather API
-weather_api_key = os.getenv("WEATHER_API_KEY")
+# Weather API client (WEATHER_API_KEY), forecasts are cached per geohash tile
+weather_client = WeatherClient.from_env()
 
 # Load models
 reconstructed_model_soybean_leaf = keras.models.load_model("models/leaf.soybean.mobilenetv3large.keras")
@@ -60,24 +67,27 @@ reconstructed_model_cotton_leaf = keras.models.load_model("models/leaf.cotton.mo
 reconstructed_model_corn_leaf = keras.models.load_model("models/leaf.corn.mobilenetv3large.keras")
 reconstructed_model_insect = keras.models.load_model("models/insect.mobilenetv3large.keras")
 
+# Concurrent classification requests are batched per model, see InferenceServer.py
+inference = InferenceServer.from_env()
+inference.register("soybean_leaf", reconstructed_model_soybean_leaf)
+inference.register("cotton_leaf", reconstructed_model_cotton_leaf)
+inference.register("corn_leaf", reconstructed_model_corn_leaf)
+inference.register("insect", reconstructed_model_insect)
+
 retrieval_graph = RetrievalGraph()
 
 #@tool(args_schema=PImage)
 def predict_soybean_leaf_disease(img):
     """ Tell whether the soybean leaf has a disease or is healthy """
     #img = image.load_img(image_path, target_size=(224, 224))
-    x = image.img_to_array(img)
-    x = np.expand_dims(x, axis=0)
-    classes = reconstructed_model_soybean_leaf.predict(x)
+    classes = inference.predict("soybean_leaf", image.img_to_array(img))
     class_labels = ["Caterpillar", "Diabrotica speciosa", "Healthy"]
     return class_labels[np.argmax(classes)]
 
 #@tool(args_schema=PImage)
 def predict_cotton_leaf_disease(img):
     """ Tell whether the cotton leaf has a disease or is healthy """
-    x = image.img_to_array(img)
-    x = np.expand_dims(x, axis=0)
-    classes = reconstructed_model_cotton_leaf.predict(x)
+    classes = inference.predict("cotton_leaf", image.img_to_array(img))
     class_labels = ["Bacterial blight", "Curl Virus", "Fussarium Wilt", "Healthy"]
     return class_labels[np.argmax(classes)]
 
@@ -85,33 +95,30 @@ def predict_cotton_leaf_disease(img):
 #@tool(args_schema=PImage)
 def predict_corn_leaf_disease(img):
     """ Tell whether the corn leaf has a disease or is healthy """
-    print("Predicting corn leaf disease", img, type(img))
-    x = image.img_to_array(img)
-    x = np.expand_dims(x, axis=0)
-    classes = reconstructed_model_corn_leaf.predict(x)
+    classes = inference.predict("corn_leaf", image.img_to_array(img))
     class_labels = ["Blight", "Common Rust", "Gray Leaf Spot","Healthy"]
     return class_labels[np.argmax(classes)]
 
 #@tool(args_schema=PImage)
 def predict_insect(img):
     """ Find out the insect in the image """
-    print("Predicting insect", img, type(img))
-    x = image.img_to_array(img)
-    x = np.expand_dims(x, axis=0)
-    classes = reconstructed_model_insect.predict(x)
+    classes = inference.predict("insect", image.img_to_array(img))
     class_labels = ["Ant", "Bee", "Beetle", "Caterpillar", "Earthworm", "Earwig", "Grasshopper", "Moth", "Slug", "Snail", "Wasp", "Weevil"]
     return class_labels[np.argmax(classes)]
 
 
 @tool(args_schema=Location)
-def get_weather_data(latitude, longitude):
+def get_weather_data(latitude, longitude, raw=False):
     """
     Get the weather data for a given location latitude and longitude.
     """
-    latlong = latitude+","+longitude
-    url = f"http://api.weatherapi.com/v1/forecast.json?key={weather_api_key}&q={latlong}&days=7"
-    response = requests.get(url)
-    return response.json()
+    payload = weather_client.forecast(latitude, longitude)
+    return payload if raw else summarize_weather(payload)
+
+
+async def aget_weather_data(latitude, longitude, raw=False):
+    payload = await weather_client.aforecast(latitude, longitude)
+    return payload if raw else summarize_weather(payload)
 
 
 @tool
@@ -128,14 +135,7 @@ def calculate_water_needed(field_moisture, desired_moisture, rainfall_expected,
     Returns:
         float: Amount of water needed to reach the desired moisture level (gallons)
     """
-
-    # Convert rainfall from inches to gallons per acre
-    rainfall_gallons = rainfall_expected * 27154 * field_area
-
-    # Calculate the amount of water needed to reach the desired moisture level
-    water_needed = ((desired_moisture - field_moisture) / 100) * field_area * 27154 - rainfall_gallons
-
-    return water_needed
+    return float(ZoneCalculators.water_needed(field_moisture, desired_moisture, rainfall_expected, field_area))
 
 
 @tool
@@ -151,9 +151,7 @@ def increase_ph(current_ph, desired_ph, soil_area_acres):
     Returns:
         float: Amount of lime needed (tons)
     """
-    ph_increase = desired_ph - current_ph
-    lime_needed = ph_increase * soil_area_acres * 4840 / 1000 * 40
-    return lime_needed
+    return float(ZoneCalculators.lime_needed(current_ph, desired_ph, soil_area_acres))
 
 
 @tool
@@ -169,9 +167,7 @@ def decrease_ph(current_ph, desired_ph, soil_area_acres):
     Returns:
         float: Amount of aluminum sulfate needed (pounds)
     """
-    ph_decrease = current_ph - desired_ph
-    aluminum_sulfate_needed = ph_decrease * soil_area_acres * 43560 / 10 * 2
-    return aluminum_sulfate_needed
+    return float(ZoneCalculators.aluminum_sulfate_needed(current_ph, desired_ph, soil_area_acres))
 
 
 @tool(args_schema=CropQuestion)
@@ -190,6 +186,10 @@ def fertilizer_to_add(crop_question, crop):
     return retrieval_graph.invoke(crop_question, crop)
 
 
+async def aask_crop_guide(crop_question, crop):
+    return await retrieval_graph.ainvoke(crop_question, crop)
+
+
 class CropDisease(BaseModel):
     crop: str = Field(..., description="Crop to protect")
     disease_name: str = Field(..., description="Name of the disease")
@@ -198,10 +198,7 @@ class CropDisease(BaseModel):
     irrigation_plan: str = Field(..., description="Irrigation plan recommendation")
 
 
-@tool(args_schema=CropDisease)
-def tackle_disease(crop, disease_name, moisture, weather, irrigation_plan):
-    """Get insights on how to address disease for a given crop"""
-
+def disease_question(crop, disease_name, moisture, weather, irrigation_plan):
     prompt_template = PromptTemplate.from_template(
         """
         You are an agricultural disease management expert is a professional with specialized knowledge in entomology, 
@@ -223,12 +220,23 @@ def tackle_disease(crop, disease_name, moisture, weather, irrigation_plan):
             - Where to get the pesticides from
         """
     )
-    question = prompt_template.format(crop=crop, disease=disease_name, moisture=moisture, weather=weather, irrigation_plan=irrigation_plan)
+    return prompt_template.format(crop=crop, disease=disease_name, moisture=moisture, weather=weather, irrigation_plan=irrigation_plan)
+
+
+@tool(args_schema=CropDisease)
+def tackle_disease(crop, disease_name, moisture, weather, irrigation_plan):
+    """Get insights on how to address disease for a given crop"""
+    question = disease_question(crop, disease_name, moisture, weather, irrigation_plan)
 
-    print("Tackling disease", question, crop)
+    log.info("Tackling disease %s on %s", disease_name, crop)
     return retrieval_graph.invoke(question, crop)
 
 
+async def atackle_disease(crop, disease_name, moisture, weather, irrigation_plan):
+    question = disease_question(crop, disease_name, moisture, weather, irrigation_plan)
+    return await retrieval_graph.ainvoke(question, crop)
+
+
 class CropInsect(BaseModel):
     crop: str = Field(..., description="Crop to protect")
     insect_name: str = Field(..., description="Name of the disease")
@@ -237,10 +245,7 @@ class CropInsect(BaseModel):
     irrigation_plan: str = Field(..., description="Irrigation plan recommendation")
 
 
-@tool(args_schema=CropInsect)
-def tackle_insect(crop, insect_name, moisture, weather, irrigation_plan):
-    """Get insights on how to address insect for a given crop"""
-
+def insect_question(crop, insect_name, moisture, weather, irrigation_plan):
     prompt_template = PromptTemplate.from_template(
         """
         You are an agricultural pest management expert is a professional with specialized knowledge in entomology, 
@@ -263,8 +268,28 @@ def tackle_insect(crop, insect_name, moisture, weather, irrigation_plan):
                 - Give the websites where the farmer can buy the pesticides
         """
     )
-    question = prompt_template.format(crop=crop, insect_name=insect_name, moisture=moisture, weather=weather,
-                                      irrigation_plan=irrigation_plan)
+    return prompt_template.format(crop=crop, insect_name=insect_name, moisture=moisture, weather=weather,
+                                  irrigation_plan=irrigation_plan)
+
+
+@tool(args_schema=CropInsect)
+def tackle_insect(crop, insect_name, moisture, weather, irrigation_plan):
+    """Get insights on how to address insect for a given crop"""
+    question = insect_question(crop, insect_name, moisture, weather, irrigation_plan)
+
+    log.info("Tackling insect %s on %s", insect_name, crop)
+    return retrieval_graph.invoke(question, crop)
+
+
+async def atackle_insect(crop, insect_name, moisture, weather, irrigation_plan):
+    question = insect_question(crop, insect_name, moisture, weather, irrigation_plan)
+    return await retrieval_graph.ainvoke(question, crop)
+
 
-    print("Tackling insect", question, crop)
-    return retrieval_graph.invoke(question, crop)
\ No newline at end of file
+# Async counterparts used by tool.ainvoke (the agent's async path). The calculators have none, they are cheap
+# and langchain runs them in an executor.
+get_weather_data.coroutine = aget_weather_data
+get_crop_info.coroutine = aask_crop_guide
+fertilizer_to_add.coroutine = aask_crop_guide
+tackle_disease.coroutine = atackle_disease
+tackle_insect.coroutine = atackle_insect
@@ -0,0 +1,122 @@
+import hashlib
+import re
+import threading
+
+import numpy as np
+
+from SingleFlight import SingleFlight
+import Telemetry
+
+
+def normalize(value):
+    """ Normalized form of a tool argument for cache keys """
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value.strip().lower())
+    if isinstance(value, float):
+        return round(value, 4)
+    return value
+
+
+class AssessmentCaches:
+    """
+    Weather, retrieval and classification caches shared by the assessments of many fields.
+
+    Weather is keyed by the location rounded to region_precision decimals (0.1 degree is ~10 km) and whether
+    the raw forecast or the summary was asked for, so fields in the same region share one forecast. Retrieval tool answers are keyed by tool and normalized arguments, so
+    fields with the same crop and problem share them. Classifications are keyed by the image pixels.
+    Concurrent lookups of the same key are coalesced into one call, from sync and async callers alike.
+    """
+
+    RETRIEVAL_TOOLS = {"get_crop_info", "fertilizer_to_add", "tackle_insect", "tackle_disease"}
+
+    def __init__(self, region_precision=1):
+        self.region_precision = region_precision
+        self.values = {}
+        self.in_flight = SingleFlight()
+        self.lock = threading.Lock()
+        self.stats = {kind: {"hits": 0, "misses": 0} for kind in ("weather", "retrieval", "classification")}
+
+    def _lookup(self, kind, key):
+        """ (hit, value) of a cached key, a hit is counted """
+        with self.lock:
+            hit = key in self.values
+            if hit:
+                self.stats[kind]["hits"] += 1
+            value = self.values.get(key)
+        if hit:
+            Telemetry.cache_lookup(f"assessment_{kind}", True)
+        return hit, value
+
+    def _store(self, key, value):
+        with self.lock:
+            self.values[key] = value
+        return value
+
+    def _computed(self, kind, coalesced):
+        with self.lock:
+            self.stats[kind]["hits" if coalesced else "misses"] += 1
+        Telemetry.cache_lookup(f"assessment_{kind}", coalesced)
+
+    def get_or_compute(self, kind, key, compute):
+        key = (kind,) + key
+        hit, value = self._lookup(kind, key)
+        if hit:
+            return value
+
+        def compute_and_store():
+            with self.lock:
+                if key in self.values:  # finished between our lookup and taking ownership
+                    return self.values[key]
+            return self._store(key, compute())
+
+        value, coalesced = self.in_flight.call(key, compute_and_store)
+        self._computed(kind, coalesced)
+        return value
+
+    async def aget_or_compute(self, kind, key, acompute):
+        """ Async get_or_compute, acompute is a coroutine function """
+        key = (kind,) + key
+        hit, value = self._lookup(kind, key)
+        if hit:
+            return value
+
+        async def compute_and_store():
+            with self.lock:
+                if key in self.values:
+                    return self.values[key]
+            return self._store(key, await acompute())
+
+        value, coalesced = await self.in_flight.acall(key, compute_and_store)
+        self._computed(kind, coalesced)
+        return value
+
+    def tool_key(self, name, args):
+        """ Cache kind and key of a tool call, None for tools that are not worth caching """
+        if name == "get_weather_data":
+            return "weather", (round(float(args["latitude"]), self.region_precision),
+                               round(float(args["longitude"]), self.region_precision), bool(args.get("raw", False)))
+        if name in self.RETRIEVAL_TOOLS:
+            return "retrieval", (name,) + tuple(sorted((k, normalize(v)) for k, v in args.items()))
+        return None
+
+    def call_tool(self, name, args, invoke):
+        key = self.tool_key(name, args)
+        if key is None:
+            return invoke()
+        return self.get_or_compute(key[0], key[1], invoke)
+
+    async def acall_tool(self, name, args, ainvoke):
+        """ Async call_tool, coalesced with concurrent sync and async calls of the same key """
+        key = self.tool_key(name, args)
+        if key is None:
+            return await ainvoke()
+        return await self.aget_or_compute(key[0], key[1], ainvoke)
+
+    def classify(self, model_name, img, predict):
+        pixels = np.asarray(img)
+        key = (model_name, hashlib.sha1(pixels.tobytes()).hexdigest(), pixels.shape)
+        return self.get_or_compute("classification", key, lambda: predict(img))
+
+    def report(self):
+        return {kind: {**counts, "hit_rate": round(counts["hits"] / max(1, counts["hits"] + counts["misses"]), 3)}
+                for kind, counts in self.stats.items()}
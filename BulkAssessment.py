@@ -0,0 +1,161 @@
+import argparse
+import csv
+import json
+import os
+import pprint
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from AssessmentCaches import AssessmentCaches
+import Telemetry
+
+FIELD_COLUMNS = {
+    "latitude": float, "longitude": float, "crop": str, "soil_ph": float, "soil_moisture": float,
+    "area_acres": float, "insect_image": str, "leaf_image": str,
+}
+# Columns passed to get_insights, a missing one takes get_insights' default
+INSIGHT_COLUMNS = ["latitude", "longitude", "crop", "soil_ph", "soil_moisture", "area_acres"]
+
+
+def load_fields(path):
+    """
+    Fields to assess from a CSV (with a header row) or JSONL file. Columns: field_id, latitude, longitude,
+    crop, soil_ph, soil_moisture, area_acres, insect_image, leaf_image. field_id defaults to the row number.
+
+    Missing or empty columns are left out of the field so get_insights' defaults apply. A value that is not
+    a number where one is expected marks the field with an "error" instead.
+    """
+    with open(path, newline="") as f:
+        rows = [json.loads(line) for line in f if line.strip()] if path.endswith(".jsonl") else list(csv.DictReader(f))
+    for number, row in enumerate(rows):
+        field = {"field_id": str(row.get("field_id") or number)}
+        for column, cast in FIELD_COLUMNS.items():
+            value = row.get(column)
+            if isinstance(value, str):
+                value = value.strip()
+            if value in (None, ""):
+                continue
+            try:
+                field[column] = cast(value)
+            except (TypeError, ValueError):
+                field["error"] = f"Invalid {column}: {value!r}"
+        yield field
+
+
+def completed_fields(output_path):
+    """ Field ids already assessed successfully in an earlier run, the output file is the checkpoint """
+    done = set()
+    if os.path.exists(output_path):
+        with open(output_path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # partially written line of an interrupted run
+                if "error" not in result:
+                    done.add(result["field_id"])
+    return done
+
+
+class BulkAssessment:
+    """
+    Nightly assessments for many fields.
+
+    Fields run with bounded concurrency and share weather, retrieval and classification caches, so fields in
+    the same region growing the same crop reuse each other's data. Results are appended to a JSONL file as
+    they finish; re-running with the same output file skips fields that already succeeded.
+    """
+
+    def __init__(self, pf=None, concurrency=8, caches=None, mode=None):
+        if pf is None:
+            import PrecisionFarming
+            pf = PrecisionFarming.PrecisionFarming()
+        self.pf = pf
+        self.concurrency = concurrency
+        self.caches = caches or AssessmentCaches()
+        self.mode = mode
+        self.timings = {"load_images": [], "assessment": [], "field": []}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def load_image(path):
+        if not path:
+            return None
+        from keras.preprocessing import image
+        return image.load_img(path, target_size=(224, 224))
+
+    def assess(self, field):
+        start = time.perf_counter()
+        insect = self.load_image(field.get("insect_image"))
+        leaf = self.load_image(field.get("leaf_image"))
+        loaded = time.perf_counter()
+        insights = self.pf.get_insights(
+            **{column: field[column] for column in INSIGHT_COLUMNS if column in field}, insect=insect, leaf=leaf,
+            mode=self.mode, caches=self.caches, field_id=field["field_id"])
+        done = time.perf_counter()
+        with self.lock:
+            self.timings["load_images"].append(loaded - start)
+            self.timings["assessment"].append(done - loaded)
+            self.timings["field"].append(done - start)
+        return insights
+
+    def run(self, input_path, output_path):
+        done = completed_fields(output_path)
+        counts = {"assessed": 0, "failed": 0, "skipped": 0}
+        slots = threading.BoundedSemaphore(self.concurrency * 2)  # bounds fields held in memory
+        start = time.perf_counter()
+
+        with open(output_path, "a") as output, ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            def write(result, outcome):
+                with self.lock:
+                    output.write(json.dumps(result) + "\n")
+                    output.flush()
+                    counts[outcome] += 1
+
+            def process(field):
+                try:
+                    result = {"field_id": field["field_id"], "insights": self.assess(field)}
+                    outcome = "assessed"
+                except Exception as e:
+                    result = {"field_id": field["field_id"], "error": f"{type(e).__name__}: {e}"}
+                    outcome = "failed"
+                finally:
+                    slots.release()
+                write(result, outcome)
+
+            for field in load_fields(input_path):
+                if field["field_id"] in done:
+                    counts["skipped"] += 1
+                    continue
+                if "error" in field:
+                    write({"field_id": field["field_id"], "error": field["error"]}, "failed")
+                    continue
+                slots.acquire()
+                executor.submit(process, field)
+
+        return self.report(counts, time.perf_counter() - start)
+
+    def report(self, counts, wall_seconds):
+        stages = {}
+        for stage, values in self.timings.items():
+            if values:
+                ordered = sorted(values)
+                stages[stage] = {"mean_s": round(statistics.mean(values), 3),
+                                 "p50_s": round(ordered[len(ordered) // 2], 3),
+                                 "p95_s": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3)}
+        return {**counts, "wall_seconds": round(wall_seconds, 2),
+                "fields_per_minute": round(counts["assessed"] * 60 / wall_seconds, 2) if wall_seconds else 0.0,
+                "stages": stages, "caches": self.caches.report()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assess many fields from a CSV or JSONL file")
+    parser.add_argument("fields", help="CSV or JSONL file of fields")
+    parser.add_argument("output", help="JSONL file results are appended to, also used to resume")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=["agent", "prefetch"], default=None)
+    args = parser.parse_args()
+    Telemetry.configure_logging()
+    pprint.pprint(BulkAssessment(concurrency=args.concurrency, mode=args.mode).run(args.fields, args.output))
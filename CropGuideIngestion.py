@@ -0,0 +1,307 @@
+import glob
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+
+
+def sha256(data):
+    if isinstance(data, str):
+        data = data.encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+class IngestionManifest:
+    """
+    Record of what is already in the vector store.
+
+    files:  guide path -> hash of the PDF bytes
+    pages:  "<guide path>#<page>" -> hash of the page text
+    chunks: "<guide path>#<page>" -> ids of the chunks uploaded for that page (ids are content hashes)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files, self.pages, self.chunks = {}, {}, {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.files, self.pages, self.chunks = data["files"], data["pages"], data["chunks"]
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"files": self.files, "pages": self.pages, "chunks": self.chunks}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def pages_of(self, source):
+        return [key for key in self.pages if key.rsplit("#", 1)[0] == source]
+
+    def forget_page(self, page_key):
+        self.pages.pop(page_key, None)
+        return self.chunks.pop(page_key, [])
+
+
+def upsert_documents(vector_store, documents, ids):
+    """ Add documents under fixed ids, so re-running with the same chunks does not duplicate them """
+    if not documents:
+        return
+    if type(vector_store).__name__ == "AzureSearch":
+        vector_store.add_texts([d.page_content for d in documents], [d.metadata for d in documents], keys=ids)
+    else:
+        vector_store.add_documents(documents, ids=ids)
+
+
+def delete_documents(vector_store, ids):
+    if ids:
+        vector_store.delete(ids=ids)
+
+
+class StageStats:
+    """ Items processed and busy time of one ingestion stage """
+
+    def __init__(self, name, unit):
+        self.name, self.unit = name, unit
+        self.items = 0
+        self.seconds = 0.0
+
+    def add(self, items, seconds):
+        self.items += items
+        self.seconds += seconds
+
+    def report(self, wall_seconds):
+        return {
+            "stage": self.name,
+            self.unit: self.items,
+            "busy_seconds": round(self.seconds, 3),
+            f"{self.unit}_per_sec": round(self.items / wall_seconds, 2) if wall_seconds else 0.0,
+        }
+
+
+def parse_guide(source, known_hash=None):
+    """
+    Process pool worker: hash a guide and, if it changed, parse it into pages.
+
+    Returns (source, file_hash, pages, seconds). pages is None when the guide is unchanged.
+    """
+    start = time.perf_counter()
+    with open(source, "rb") as f:
+        file_hash = sha256(f.read())
+    pages = None if file_hash == known_hash else PyPDFLoader(source).load()
+    return source, file_hash, pages, time.perf_counter() - start
+
+
+class CropGuideIngestion:
+    """
+    Incremental ingestion of the crop guides in Guides/ into a vector store.
+
+    Only pages whose text changed are re-split, and only chunks that are not already in the store are
+    embedded and uploaded. Chunks of pages (or whole guides) that disappeared are deleted. Running it twice
+    in a row is a no-op.
+
+    The work is a three stage pipeline: guides are parsed in a process pool, pages are split as each guide
+    arrives, and chunks flow through a bounded queue of batches to an upload thread, so the corpus is never
+    held in memory as a whole. With an EmbeddingUploader the upload thread embeds and uploads the chunks
+    itself, with batching, throttling, retries and a resumable checkpoint.
+    """
+
+    def __init__(self, text_splitter, manifest_path, guides_dir="Guides", prepare_chunks=None,
+                 workers=None, batch_size=64, queue_size=8, uploader=None):
+        self.text_splitter = text_splitter
+        self.manifest = IngestionManifest(manifest_path)
+        self.guides_dir = guides_dir
+        self.prepare_chunks = prepare_chunks  # e.g. filter_complex_metadata for Chroma
+        self.workers = workers or os.cpu_count() or 1  # the ProcessPoolExecutor default
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.uploader = uploader  # EmbeddingUploader, otherwise the vector store embeds and uploads itself
+
+    def guides(self):
+        return sorted(glob.glob(os.path.join(self.guides_dir, "*.pdf")))
+
+    @staticmethod
+    def crop_of(source):
+        return os.path.splitext(os.path.basename(source))[0]
+
+    def split_page(self, page_key, page):
+        """ Split one page into chunks with ids derived from their position and content """
+        page.metadata["crop"] = self.crop_of(page.metadata["source"])
+        chunks = self.text_splitter.split_documents([page])
+        if self.prepare_chunks:
+            chunks = self.prepare_chunks(chunks)
+        ids = [sha256(f"{page_key}:{i}:{chunk.page_content}")[:32] for i, chunk in enumerate(chunks)]
+        return chunks, ids
+
+    def diff_page(self, page_key, page, stats):
+        """ New chunks and stale chunk ids of a page, the manifest is updated to the page's new state """
+        page_hash = sha256(page.page_content)
+        if self.manifest.pages.get(page_key) == page_hash:
+            stats["pages_unchanged"] += 1
+            return [], []
+
+        chunks, ids = self.split_page(page_key, page)
+        old_ids = set(self.manifest.chunks.get(page_key, []))
+        new = [(chunk, chunk_id) for chunk, chunk_id in zip(chunks, ids) if chunk_id not in old_ids]
+        stale = sorted(old_ids - set(ids))
+
+        self.manifest.pages[page_key] = page_hash
+        self.manifest.chunks[page_key] = ids
+        stats["pages_changed"] += 1
+        stats["chunks_added"] += len(new)
+        stats["chunks_deleted"] += len(stale)
+        return new, stale
+
+    def _queued_chunks(self, vector_store, batches, upload_stats):
+        """ Chunks from the queue as (id, text, metadata), deletions are applied on the way """
+        while True:
+            item = batches.get()
+            if item is None:
+                return
+            operation, payload = item
+            if operation == "delete":
+                delete_documents(vector_store, payload)
+                continue
+            upload_stats.add(len(payload), 0)
+            for chunk, chunk_id in payload:
+                yield chunk_id, chunk.page_content, chunk.metadata
+
+    def _upload_worker(self, vector_store, batches, upload_stats, errors):
+        start = time.perf_counter()
+        try:
+            chunks = self._queued_chunks(vector_store, batches, upload_stats)
+            if self.uploader is not None:
+                self.uploader.upload(chunks)
+            else:
+                batch = []
+                for chunk in chunks:
+                    batch.append(chunk)
+                    if len(batch) == self.batch_size:
+                        self._upsert(vector_store, batch)
+                        batch = []
+                self._upsert(vector_store, batch)
+        except Exception as e:
+            errors.append(e)
+            while batches.get() is not None:
+                pass  # drain the queue so the producer never blocks
+        upload_stats.add(0, time.perf_counter() - start)
+
+    @staticmethod
+    def _upsert(vector_store, batch):
+        if batch:
+            ids, texts, metadatas = map(list, zip(*batch))
+            upsert_documents(vector_store, [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)], ids)
+
+    def _put(self, batches, item, uploader, errors):
+        while True:
+            if errors:
+                raise errors[0]
+            if not uploader.is_alive():
+                raise RuntimeError("Upload stage stopped unexpectedly")
+            try:
+                batches.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def _parse(self, executor, guides):
+        """
+        Parse results in completion order, with at most 2 x workers guides in flight so parsed pages don't
+        pile up in memory ahead of the uploader. A future is dropped as soon as its result is handed out.
+        """
+        remaining = iter(guides)
+        in_flight = set()
+        while True:
+            for source in remaining:
+                in_flight.add(executor.submit(parse_guide, source, self.manifest.files.get(source)))
+                if len(in_flight) >= 2 * self.workers:
+                    break
+            if not in_flight:
+                return
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            while done:
+                yield done.pop().result()
+
+    def sync(self, vector_store):
+        stats = {"guides_unchanged": 0, "pages_unchanged": 0, "pages_changed": 0, "pages_removed": 0,
+                 "chunks_added": 0, "chunks_deleted": 0}
+        parse_stats = StageStats("parse", "pages")
+        split_stats = StageStats("split", "chunks")
+        upload_stats = StageStats("upload", "chunks")
+        guides = self.guides()
+        wall_start = time.perf_counter()
+
+        batches = queue.Queue(maxsize=self.queue_size)
+        errors = []
+        uploader = threading.Thread(target=self._upload_worker, args=(vector_store, batches, upload_stats, errors),
+                                    daemon=True)
+        uploader.start()
+        pending = []
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                for source, file_hash, pages, parse_seconds in self._parse(executor, guides):
+                    if pages is None:
+                        stats["guides_unchanged"] += 1
+                        continue
+                    parse_stats.add(len(pages), parse_seconds)
+
+                    start = time.perf_counter()
+                    seen, stale = set(), []
+                    for page in pages:
+                        page_key = f"{source}#{page.metadata['page']}"
+                        seen.add(page_key)
+                        new, page_stale = self.diff_page(page_key, page, stats)
+                        split_stats.add(len(new), 0)
+                        pending.extend(new)
+                        stale.extend(page_stale)
+                        while len(pending) >= self.batch_size:
+                            self._put(batches, ("upsert", pending[:self.batch_size]), uploader, errors)
+                            pending = pending[self.batch_size:]
+
+                    for page_key in set(self.manifest.pages_of(source)) - seen:
+                        removed = self.manifest.forget_page(page_key)
+                        stale.extend(removed)
+                        stats["pages_removed"] += 1
+                        stats["chunks_deleted"] += len(removed)
+                    if stale:
+                        self._put(batches, ("delete", stale), uploader, errors)
+                    split_stats.add(0, time.perf_counter() - start)
+                    self.manifest.files[source] = file_hash
+
+            for source in set(self.manifest.files) - set(guides):
+                stale = []
+                for page_key in self.manifest.pages_of(source):
+                    removed = self.manifest.forget_page(page_key)
+                    stale.extend(removed)
+                    stats["pages_removed"] += 1
+                    stats["chunks_deleted"] += len(removed)
+                if stale:
+                    self._put(batches, ("delete", stale), uploader, errors)
+                del self.manifest.files[source]
+
+            if pending:
+                self._put(batches, ("upsert", pending), uploader, errors)
+        finally:
+            batches.put(None)
+            uploader.join()
+
+        if errors:
+            raise errors[0]
+        self.manifest.save()
+        if self.uploader is not None:
+            self.uploader.checkpoint.clear()  # the manifest now covers everything that was uploaded
+            stats["uploader"] = dict(self.uploader.stats)
+
+        wall_seconds = time.perf_counter() - wall_start
+        stats["wall_seconds"] = round(wall_seconds, 3)
+        stats["stages"] = [s.report(wall_seconds) for s in (parse_stats, split_stats, upload_stats)]
+        return stats
@@ -1,3 +1,4 @@
+import pprint
 import re
 
 from bs4 import BeautifulSoup
@@ -8,6 +9,9 @@ from langchain_community.vectorstores import Chroma
 from langchain_community.vectorstores.utils import filter_complex_metadata
 from langchain_openai import OpenAIEmbeddings
 
+from CropGuideIngestion import CropGuideIngestion
+from EmbeddingUploader import EmbeddingUploader, chroma_upload_fn
+
 
 class CropVectorStore:
     def bs4_extractor(self, html: str) -> str:
@@ -15,33 +19,24 @@ class CropVectorStore:
         return re.sub(r"\n\n+", "\n\n", soup.text).strip()
 
     def create_vector_store(self):
-        loader = PyPDFLoader("Guides/soybean.pdf") #RecursiveUrlLoader("https://soybeans.ces.ncsu.edu/", extractor=self.bs4_extractor)
-        docs = loader.load()
-        print("sybeans.ces.ncsu.edu", len(docs))
-        loader = PyPDFLoader("Guides/corn.pdf") #RecursiveUrlLoader("https://corn.ces.ncsu.edu/", extractor=self.bs4_extractor)
-        docs = docs + loader.load()
-        print("sybeans.ces.ncsu.edu + corn.ces.ncsu.edu", len(docs))
-        loader = PyPDFLoader("Guides/cotton.pdf") #RecursiveUrlLoader("https://cotton.ces.ncsu.edu/", extractor=self.bs4_extractor)
-        docs = docs + loader.load()
-        print("sybeans.ces.ncsu.edu + corn.ces.ncsu.edu + cottton.ces.ncsu.edu", len(docs))
-        for document in docs:
-            document.metadata["crop"] = document.metadata["source"].split("/")[1].split(".")[0]
-
-        print(docs[0].metadata, type(docs[0]))
         text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
             chunk_size=1024, chunk_overlap=128
         )
-        doc_splits = text_splitter.split_documents(docs)
-        print("Splits done...", len(doc_splits))
 
         # Add to vectorDB
+        embeddings = OpenAIEmbeddings()
         vector_store = Chroma(
             collection_name="agriculture",
-            embedding_function=OpenAIEmbeddings(),
+            embedding_function=embeddings,
             persist_directory="./chroma_langchain_db",  # Where to save data locally, remove if not neccesary
         )
 
-        vector_store.add_documents(filter_complex_metadata(doc_splits))
+        # Only new or changed pages of the guides are split, embedded and uploaded
+        uploader = EmbeddingUploader(embeddings.embed_documents, chroma_upload_fn(vector_store),
+                                     checkpoint_path="./chroma_langchain_db/upload.checkpoint")
+        ingestion = CropGuideIngestion(text_splitter, manifest_path="./chroma_langchain_db/manifest.json",
+                                       prepare_chunks=filter_complex_metadata, uploader=uploader)
+        pprint.pprint(ingestion.sync(vector_store))
         vector_store.persist()
         print("Vectorstore created...")
 
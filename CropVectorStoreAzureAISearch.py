@@ -1,4 +1,5 @@
 import os
+import pprint
 
 from langchain_community.vectorstores.azuresearch import AzureSearch
 from langchain_openai import AzureOpenAIEmbeddings, OpenAIEmbeddings
@@ -9,7 +10,6 @@ openai_api_version = "2023-05-15"
 model = "text-embedding-ada-002"
 vector_store_address = os.getenv("AZURE_SEARCH_ENDPOINT")
 vector_store_password = os.getenv("AZURE_SEARCH_ADMIN_KEY")
-print(vector_store_password)
 embeddings: OpenAIEmbeddings = OpenAIEmbeddings(
     openai_api_key=openai_api_key, openai_api_version=openai_api_version, model=model
 )
@@ -22,22 +22,24 @@ vector_store: AzureSearch = AzureSearch(
     embedding_function=embeddings.embed_query,
 )
 
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import CharacterTextSplitter
 
-loader = PyPDFLoader("Guides/corn.pdf")
-documents = loader.load()
-loader = PyPDFLoader("Guides/cotton.pdf")
-documents = documents + loader.load()
-loader = PyPDFLoader("Guides/soybean.pdf")
-documents = documents + loader.load()
-
-for document in documents:
-    document.metadata["crop"] = document.metadata["source"].split("/")[1].split(".")[0]
-
-text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-docs = text_splitter.split_documents(documents)
-
-print(len(docs))
-
-vector_store.add_documents(documents=docs)
\ No newline at end of file
+from CropGuideIngestion import CropGuideIngestion
+from EmbeddingUploader import EmbeddingUploader, azure_search_upload_fn
+
+if __name__ == "__main__":
+    # Guard needed since guides are parsed in a process pool
+    text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
+    uploader = EmbeddingUploader(
+        embeddings.embed_documents,
+        azure_search_upload_fn(vector_store_address, index_name, vector_store_password),
+        batch_size=int(os.getenv("EMBED_BATCH_SIZE", "64")),
+        max_concurrency=int(os.getenv("EMBED_CONCURRENCY", "4")),
+        tokens_per_minute=int(os.getenv("EMBED_TOKENS_PER_MINUTE", "1000000")),
+        checkpoint_path=os.getenv("CROP_GUIDE_CHECKPOINT", ".cache/crop_guide_upload.checkpoint"),
+    )
+    ingestion = CropGuideIngestion(text_splitter,
+                                   manifest_path=os.getenv("CROP_GUIDE_MANIFEST", ".cache/crop_guide_manifest.json"),
+                                   workers=int(os.getenv("INGESTION_WORKERS", os.cpu_count() or 1)),
+                                   uploader=uploader)
+    pprint.pprint(ingestion.sync(vector_store))
@@ -0,0 +1,100 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from SingleFlight import SingleFlight
+import Telemetry
+
+
+class DiskCache:
+    """
+    Small TTL cache persisted in SQLite so that it survives restarts and is shared between processes.
+
+    get_or_compute() also coalesces concurrent callers asking for the same key: only the first one runs
+    the (slow) compute function, the rest wait on its result. Values rejected by its cacheable predicate
+    (errors, empty answers) are handed to the waiting callers but not stored.
+    """
+
+    def __init__(self, path, ttl_seconds=3600, namespace="default"):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.namespace = namespace
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "computed": 0}
+        self._lock = threading.Lock()
+        self._in_flight = SingleFlight()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "namespace TEXT, key TEXT, value TEXT, expires REAL, PRIMARY KEY (namespace, key))"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        """ Cached value for a key, or None when missing or expired """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl_seconds=None):
+        expires = time.time() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), expires),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        """ Drop every entry of this namespace """
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+            self._conn.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+            self._conn.commit()
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get_or_compute(self, key, compute, cacheable=None):
+        value = self.get(key)
+        if value is not None:
+            self._count("hits")
+            Telemetry.cache_lookup(self.namespace, True)
+            return value
+
+        def compute_and_store():
+            # Another caller may have finished the same key between our lookup and taking ownership
+            value = self.get(key)
+            if value is None:
+                value = compute()
+                self._count("computed")
+                if cacheable is None or cacheable(value):
+                    self.set(key, value)
+            return value
+
+        value, coalesced = self._in_flight.call(key, compute_and_store)
+        self._count("coalesced" if coalesced else "misses")
+        # A coalesced caller is served without its own upstream call, it counts as a hit
+        Telemetry.cache_lookup(self.namespace, coalesced)
+        return value
+
+    def hit_rate(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        return (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
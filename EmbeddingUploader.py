@@ -0,0 +1,229 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Connection failures and timeouts of the clients in use, openai's APITimeoutError is an APIConnectionError
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)
+try:
+    import openai
+    TRANSIENT_ERRORS += (openai.APIConnectionError,)
+except ImportError:
+    pass
+try:
+    from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+    TRANSIENT_ERRORS += (ServiceRequestError, ServiceResponseError)
+except ImportError:
+    pass
+
+
+def status_code(error):
+    """ HTTP status of an exception raised by openai, requests or azure-core, if there is one """
+    code = getattr(error, "status_code", None)
+    if code is None:
+        code = getattr(getattr(error, "response", None), "status_code", None)
+    return code
+
+
+def retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    return status_code(error) in RETRYABLE_STATUS
+
+
+def count_tokens(texts):
+    """ Token count used for throttling, tiktoken when available otherwise ~4 characters per token """
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return sum(len(encoding.encode(t)) for t in texts)
+    except Exception:  # not installed, or the encoding cannot be downloaded (offline)
+        return sum(len(t) for t in texts) // 4 + len(texts)
+
+
+class TokenBucket:
+    """ Thread-safe token bucket refilled at tokens_per_minute """
+
+    def __init__(self, tokens_per_minute):
+        self.capacity = tokens_per_minute
+        self.tokens = tokens_per_minute
+        self.rate = tokens_per_minute / 60.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens):
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class UploadCheckpoint:
+    """ Append-only file of chunk ids that were embedded and uploaded, so a failed run can resume """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    self.done.update(json.loads(line))
+
+    def record(self, ids):
+        with self.lock:
+            self.done.update(ids)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(list(ids)) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def clear(self):
+        with self.lock:
+            self.done = set()
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class EmbeddingUploader:
+    """
+    Embedding and upload stage of the crop guide ingestion.
+
+    Chunks are embedded and uploaded in batches of batch_size with at most max_concurrency batches in flight.
+    Embedding requests are throttled to tokens_per_minute, 429/5xx and connection errors are retried with
+    exponential backoff, and every uploaded batch is checkpointed so a failed run resumes where it stopped.
+
+    embed_fn(texts) -> vectors and upload_fn(ids, texts, vectors, metadatas) are plain callables, which keeps
+    the stage testable against a local fake server (see FakeServices.py).
+    """
+
+    def __init__(self, embed_fn, upload_fn, batch_size=64, max_concurrency=4, tokens_per_minute=1_000_000,
+                 max_retries=6, base_delay=1.0, max_delay=60.0, checkpoint_path=None, on_embedded=None):
+        self.embed_fn = embed_fn
+        self.upload_fn = upload_fn
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(tokens_per_minute)
+        self.checkpoint = UploadCheckpoint(checkpoint_path)
+        self.on_embedded = on_embedded  # callback(ids, texts, vectors, metadatas), e.g. a snapshot writer
+        self.stats = {"batches": 0, "chunks": 0, "skipped": 0, "retries": 0, "tokens": 0}
+        self._stats_lock = threading.Lock()
+
+    def _with_backoff(self, fn, *args):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn(*args)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1)
+                with self._stats_lock:
+                    self.stats["retries"] += 1
+                time.sleep(delay)
+
+    def upload_batch(self, ids, texts, metadatas):
+        """ Embed and upload one batch, chunks already in the checkpoint are skipped """
+        todo = [i for i, chunk_id in enumerate(ids) if chunk_id not in self.checkpoint.done]
+        with self._stats_lock:
+            self.stats["skipped"] += len(ids) - len(todo)
+        if not todo:
+            return
+        ids = [ids[i] for i in todo]
+        texts = [texts[i] for i in todo]
+        metadatas = [metadatas[i] for i in todo]
+
+        tokens = count_tokens(texts)
+        self.bucket.acquire(tokens)
+        vectors = self._with_backoff(self.embed_fn, texts)
+        self._with_backoff(self.upload_fn, ids, texts, vectors, metadatas)
+        if self.on_embedded:
+            self.on_embedded(ids, texts, vectors, metadatas)
+        self.checkpoint.record(ids)
+        with self._stats_lock:
+            self.stats["batches"] += 1
+            self.stats["chunks"] += len(ids)
+            self.stats["tokens"] += tokens
+
+    def upload(self, chunks):
+        """ Embed and upload an iterable of (id, text, metadata) with bounded concurrency """
+        in_flight = threading.BoundedSemaphore(self.max_concurrency)
+        futures = []
+
+        def run(batch):
+            try:
+                return self.upload_batch(*map(list, zip(*batch)))
+            finally:
+                in_flight.release()
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            batch = []
+            for chunk in chunks:
+                batch.append(chunk)
+                if len(batch) == self.batch_size:
+                    in_flight.acquire()
+                    futures.append(executor.submit(run, batch))
+                    batch = []
+            if batch:
+                in_flight.acquire()
+                futures.append(executor.submit(run, batch))
+        for future in futures:
+            future.result()
+        return self.stats
+
+
+def azure_search_upload_fn(endpoint, index_name, key, api_version="2023-11-01", timeout=60):
+    """
+    upload_fn writing straight to the Azure AI Search REST API, in the document layout used by langchain's
+    AzureSearch (id, content, content_vector, metadata). Raises on 429/5xx so the uploader can back off.
+    """
+    session = requests.Session()
+    url = f"{endpoint.rstrip('/')}/indexes/{index_name}/docs/index?api-version={api_version}"
+
+    def upload(ids, texts, vectors, metadatas):
+        body = {"value": [
+            {"@search.action": "mergeOrUpload", "id": i, "content": t, "content_vector": v, "metadata": json.dumps(m)}
+            for i, t, v, m in zip(ids, texts, vectors, metadatas)
+        ]}
+        response = session.post(url, json=body, headers={"api-key": key}, timeout=timeout)
+        response.raise_for_status()
+        failed = [r for r in response.json()["value"] if not r["status"]]
+        if failed:
+            error = requests.HTTPError(f"{len(failed)} documents failed to upload", response=response)
+            error.status_code = max(r["statusCode"] for r in failed)
+            raise error
+
+    return upload
+
+
+def chroma_upload_fn(vector_store):
+    """ upload_fn for a langchain Chroma vector store, with precomputed embeddings """
+    def upload(ids, texts, vectors, metadatas):
+        vector_store._collection.upsert(ids=ids, embeddings=vectors, metadatas=metadatas, documents=texts)
+
+    return upload
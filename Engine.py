@@ -0,0 +1,90 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+from OfflineGeocoder import OfflineGeocoder
+
+log = logging.getLogger(__name__)
+
+
+def load_tools():
+    import AgentTools
+    return AgentTools
+
+
+class Engine:
+    """
+    Process-wide PrecisionFarming engine shared by every Streamlit session.
+
+    Streamlit re-runs the app script for every session and interaction but imports modules once per
+    process, so the instance held here is built once per server. Building it (the Keras models, the
+    retrieval graph with its hub prompts and API clients, the agent) runs in a background thread that starts
+    on the first get(), and the UI can show status() and wait only when a request actually needs the engine.
+    The warmup also runs every classifier once so the first user does not pay for tracing the predict
+    functions, and concurrent sessions never race on building them.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.pf = None
+        self.error = None
+        self.stage = "starting"
+        self.timings = {}
+        self.started = time.perf_counter()
+        # Cheap and thread-safe, available before the warmup finishes
+        self.geocoder = OfflineGeocoder.from_env()
+        self.thread = threading.Thread(target=self.warm, name="engine-warmup", daemon=True)
+
+    @classmethod
+    def get(cls):
+        """ The process's engine, its warmup is started on the first call """
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                cls._instance.thread.start()
+            return cls._instance
+
+    def _stage(self, name, work):
+        self.stage = name
+        start = time.perf_counter()
+        result = work()
+        self.timings[name] = round(time.perf_counter() - start, 2)
+        return result
+
+    def warm(self):
+        try:
+            # Importing AgentTools loads the classifiers and the retrieval graph (hub prompts, LLM, search
+            # and weather clients)
+            tools = self._stage("models and clients", load_tools)
+            import PrecisionFarming
+            pf = self._stage("agent", PrecisionFarming.PrecisionFarming)
+            blank = np.zeros((224, 224, 3), dtype=np.float32)
+            self._stage("classifier warmup", lambda: [tools.inference.predict(name, blank)
+                                                      for name in tools.inference.models])
+            self.pf = pf
+            self.stage = "ready"
+        except Exception as e:
+            self.error = e
+            log.exception("Engine warmup failed in stage %s", self.stage)
+            self.stage = "failed"
+        finally:
+            self.timings["total"] = round(time.perf_counter() - self.started, 2)
+            log.info("Engine warmup: %s %s", self.stage, self.timings)
+            self.ready.set()
+
+    def wait(self, timeout=None):
+        """ The PrecisionFarming instance once warm, raises if the warmup failed or timed out """
+        if not self.ready.wait(timeout):
+            raise TimeoutError(f"Engine still warming up ({self.stage})")
+        if self.error is not None:
+            raise RuntimeError(f"Engine warmup failed: {self.error}") from self.error
+        return self.pf
+
+    def status(self):
+        return {"ready": self.pf is not None, "stage": self.stage, "error": str(self.error) if self.error else None,
+                "seconds": round(time.perf_counter() - self.started, 1), "timings": dict(self.timings)}
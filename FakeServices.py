@@ -0,0 +1,212 @@
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text, dimensions):
+    """ Deterministic unit vector for a text """
+    rng = random.Random(hashlib.sha256(str(text).encode()).digest())
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector]
+
+
+def fake_forecast(latitude, longitude, days=7):
+    """ Deterministic weatherapi.com forecast.json style payload (hourly entries included) for a location """
+    rng = random.Random(f"{latitude:.4f},{longitude:.4f}")
+    condition = lambda: {"text": rng.choice(["Sunny", "Partly cloudy", "Patchy rain possible", "Moderate rain"]),
+                         "icon": "//cdn.weatherapi.com/weather/64x64/day/176.png", "code": 1063}
+    forecastday = []
+    for d in range(days):
+        date = f"2026-10-{19 + d:02d}"
+        hours = []
+        for h in range(24):
+            temp = 55 + 15 * rng.random()
+            hours.append({
+                "time_epoch": 1792360800 + (d * 24 + h) * 3600, "time": f"{date} {h:02d}:00",
+                "temp_c": round((temp - 32) / 1.8, 1), "temp_f": round(temp, 1), "is_day": int(6 <= h < 19),
+                "condition": condition(), "wind_mph": round(15 * rng.random(), 1), "wind_kph": 0.0, "wind_degree": 200,
+                "wind_dir": "SSW", "pressure_mb": 1015.0, "pressure_in": 29.97, "precip_mm": 0.0,
+                "precip_in": round(max(0.0, rng.gauss(0, 0.02)), 2), "snow_cm": 0.0, "humidity": rng.randint(40, 95),
+                "cloud": rng.randint(0, 100), "feelslike_c": 15.0, "feelslike_f": 59.0, "windchill_c": 15.0,
+                "windchill_f": 59.0, "heatindex_c": 15.0, "heatindex_f": 59.0, "dewpoint_c": 10.0,
+                "dewpoint_f": 50.0, "will_it_rain": 0, "chance_of_rain": rng.randint(0, 90), "will_it_snow": 0,
+                "chance_of_snow": 0, "vis_km": 10.0, "vis_miles": 6.0, "gust_mph": 20.0, "gust_kph": 32.0, "uv": 4.0,
+            })
+        forecastday.append({
+            "date": date, "date_epoch": 1792360800 + d * 86400,
+            "day": {"maxtemp_f": max(h["temp_f"] for h in hours), "mintemp_f": min(h["temp_f"] for h in hours),
+                    "avgtemp_f": 62.0, "maxwind_mph": max(h["wind_mph"] for h in hours),
+                    "totalprecip_in": round(sum(h["precip_in"] for h in hours), 2), "avghumidity": 70,
+                    "daily_chance_of_rain": max(h["chance_of_rain"] for h in hours), "condition": condition(),
+                    "uv": 4.0},
+            "astro": {"sunrise": "07:21 AM", "sunset": "06:40 PM", "moonrise": "03:12 PM", "moonset": "01:05 AM",
+                      "moon_phase": "Waxing Gibbous", "moon_illumination": 80},
+            "hour": hours,
+        })
+    return {"location": {"name": "Concord", "region": "North Carolina", "country": "USA", "lat": latitude,
+                         "lon": longitude, "localtime": "2026-10-19 08:00"},
+            "current": {"temp_f": 58.0, "humidity": 80, "wind_mph": 4.0, "precip_in": 0.0,
+                        "condition": {"text": "Overcast"}},
+            "forecast": {"forecastday": forecastday}}
+
+
+class FakeServer:
+    """
+    Local stand-in for the remote services used while ingesting and serving, for offline tests and load runs.
+
+    POST /v1/embeddings                     OpenAI embeddings API (point OpenAIEmbeddings base_url here)
+    POST /v1/chat/completions               OpenAI chat API, answers with an echo of the last message
+    POST /indexes/<index>/docs/index        Azure AI Search document upload
+    GET  /v1/forecast.json?q=<lat>,<long>   weatherapi.com forecast (point WEATHER_API_URL at <url>/v1)
+
+    failure_rate makes that share of requests fail with 429 (Retry-After: 0), latency_seconds delays every
+    response. Received documents are kept in self.indexes and request and connection counts in self.stats.
+    Connections are kept alive (HTTP/1.1), so the connection count shows whether a client pools them.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, dimensions=1536, failure_rate=0.0, latency_seconds=0.0):
+        self.dimensions = dimensions
+        self.failure_rate = failure_rate
+        self.latency_seconds = latency_seconds
+        self.indexes = {}
+        self.stats = {"requests": 0, "failed": 0, "embedded": 0, "uploaded": 0, "forecasts": 0, "completions": 0,
+                      "connections": 0}
+        self.lock = threading.Lock()
+        self.routes = [
+            ("POST", re.compile(r"^/v1/embeddings$"), self.embeddings),
+            ("POST", re.compile(r"^/v1/chat/completions$"), self.chat_completions),
+            ("POST", re.compile(r"^/indexes/(?P<index>[^/]+)/docs/index$"), self.upload_documents),
+            ("GET", re.compile(r"^/v1/forecast\.json$"), self.forecast),
+        ]
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def embeddings(self, body, query, **params):
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        with self.lock:
+            self.stats["embedded"] += len(inputs)
+        data = [{"object": "embedding", "index": i, "embedding": fake_embedding(text, self.dimensions)}
+                for i, text in enumerate(inputs)]
+        tokens = sum(len(t) if isinstance(t, list) else len(str(t)) // 4 for t in inputs)
+        return 200, {"object": "list", "data": data, "model": body.get("model"),
+                     "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    def chat_completions(self, body, query):
+        last = body["messages"][-1]["content"]
+        if isinstance(last, list):
+            last = " ".join(part.get("text", "") for part in last if isinstance(part, dict))
+        content = f"Fake answer to: {last}"
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body["messages"]) // 4
+        with self.lock:
+            self.stats["completions"] += 1
+        return 200, {"id": f"chatcmpl-{hashlib.sha1(content.encode()).hexdigest()[:12]}", "object": "chat.completion",
+                     "created": 0, "model": body.get("model"),
+                     "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                  "finish_reason": "stop"}],
+                     "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                               "total_tokens": prompt_tokens + len(content) // 4}}
+
+    def upload_documents(self, body, query, index):
+        with self.lock:
+            documents = self.indexes.setdefault(index, {})
+            for document in body["value"]:
+                documents[document["id"]] = document
+            self.stats["uploaded"] += len(body["value"])
+        return 200, {"value": [{"key": d["id"], "status": True, "errorMessage": None, "statusCode": 201}
+                               for d in body["value"]]}
+
+    def forecast(self, body, query):
+        params = urllib.parse.parse_qs(query)
+        try:
+            latitude, longitude = (float(v) for v in params["q"][0].split(","))
+        except (KeyError, ValueError):
+            return 400, {"error": {"code": 1006, "message": "No matching location found."}}
+        with self.lock:
+            self.stats["forecasts"] += 1
+        return 200, fake_forecast(latitude, longitude, int(params.get("days", ["7"])[0]))
+
+    def dispatch(self, method, path, body):
+        path, _, query = path.partition("?")
+        with self.lock:
+            self.stats["requests"] += 1
+            fail = random.random() < self.failure_rate
+            if fail:
+                self.stats["failed"] += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if fail:
+            return 429, {"error": {"message": "Rate limit reached", "code": "429"}}, {"Retry-After": "0"}
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if route_method == method and match:
+                status, payload = handler(body, query, **match.groupdict())
+                return status, payload, {}
+        return 404, {"error": {"message": f"No route for {method} {path}"}}, {}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server.lock:
+                    server.stats["connections"] += 1
+
+            def _respond(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else {}
+                status, payload, headers = server.dispatch(method, self.path, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    with FakeServer(port=8765, failure_rate=0.1) as fake:
+        print("Fake services listening on", fake.url)
+        fake.thread.join()
@@ -0,0 +1,225 @@
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+MAGIC = b"PFSNAP01"
+ALIGNMENT = 64
+
+
+def write_snapshot(path, ids, texts, metadatas, vectors, manifest):
+    """
+    Write an index snapshot to a single file:
+
+        MAGIC | uint64 header length | JSON header | padding | float32 embedding matrix (count x dimensions)
+
+    The header holds chunk ids, texts, metadata and the ingestion manifest. The matrix starts on a 64 byte
+    boundary so it can be memory-mapped as is.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2:
+        vectors = vectors.reshape(len(ids), -1) if len(ids) else vectors.reshape(0, 0)
+    header = {"count": len(ids), "dimensions": int(vectors.shape[1]), "ids": list(ids), "texts": list(texts),
+              "metadatas": list(metadatas), "manifest": manifest}
+    header = json.dumps(header, sort_keys=True).encode()
+    offset = len(MAGIC) + 8 + len(header)
+    padding = -offset % ALIGNMENT
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        f.write(b"\0" * padding)
+        f.write(vectors.tobytes())
+    os.replace(tmp_path, path)
+
+
+class IndexSnapshot:
+    """ Read-only view of a snapshot file, the embedding matrix is memory-mapped rather than read """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an index snapshot")
+            (header_length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_length))
+        offset = len(MAGIC) + 8 + header_length
+        offset += -offset % ALIGNMENT
+
+        self.ids = header["ids"]
+        self.texts = header["texts"]
+        self.metadatas = header["metadatas"]
+        self.manifest = header["manifest"]
+        self.dimensions = header["dimensions"]
+        if header["count"]:
+            self.vectors = np.memmap(path, dtype=np.float32, mode="r", offset=offset,
+                                     shape=(header["count"], header["dimensions"]))
+        else:
+            self.vectors = np.empty((0, header["dimensions"]), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self):
+        for i in range(len(self.ids)):
+            yield self.ids[i], self.texts[i], self.metadatas[i], self.vectors[i]
+
+    def restore(self, upload_fn, manifest_path=None, batch_size=256, max_concurrency=4):
+        """
+        Bulk-load the snapshot into a remote store through an EmbeddingUploader upload_fn, reusing the stored
+        embeddings. The manifest is written to manifest_path so later incremental ingestion starts from here.
+        """
+        from EmbeddingUploader import EmbeddingUploader
+
+        row_of_text = {text: i for i, text in enumerate(self.texts)}
+        uploader = EmbeddingUploader(lambda texts: [self.vectors[row_of_text[t]].tolist() for t in texts], upload_fn,
+                                     batch_size=batch_size, max_concurrency=max_concurrency,
+                                     tokens_per_minute=sys.maxsize)
+        stats = uploader.upload(zip(self.ids, self.texts, self.metadatas))
+        if manifest_path:
+            from CropGuideIngestion import IngestionManifest
+            manifest = IngestionManifest(manifest_path)
+            manifest.files, manifest.pages, manifest.chunks = (self.manifest["files"], self.manifest["pages"],
+                                                               self.manifest["chunks"])
+            manifest.save()
+        return stats
+
+
+class SnapshotBuilder:
+    """
+    Collects embedded chunks during ingestion and writes them out as a snapshot.
+
+    Use add() as the EmbeddingUploader on_embedded callback, and pass the builder itself as the vector store
+    so chunk deletions also apply to the snapshot. Rows of an existing snapshot at path are carried over, so
+    an incremental run only embeds what changed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = {}
+        if os.path.exists(path):
+            snapshot = IndexSnapshot(path)
+            for chunk_id, text, metadata, vector in snapshot.rows():
+                self.rows[chunk_id] = (text, metadata, np.array(vector))
+
+    def add(self, ids, texts, vectors, metadatas):
+        for chunk_id, text, vector, metadata in zip(ids, texts, vectors, metadatas):
+            self.rows[chunk_id] = (text, metadata, np.asarray(vector, dtype=np.float32))
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.rows.pop(chunk_id, None)
+
+    def write(self, manifest):
+        """ Write the rows that the manifest still refers to, in manifest order so builds are reproducible """
+        ids = [chunk_id for page_key in sorted(manifest.chunks) for chunk_id in manifest.chunks[page_key]
+               if chunk_id in self.rows]
+        dimensions = len(next(iter(self.rows.values()))[2]) if self.rows else 0
+        vectors = np.stack([self.rows[i][2] for i in ids]) if ids else np.empty((0, dimensions), np.float32)
+        write_snapshot(self.path, ids, [self.rows[i][0] for i in ids], [self.rows[i][1] for i in ids], vectors,
+                       {"files": manifest.files, "pages": manifest.pages, "chunks": manifest.chunks})
+
+
+class SnapshotVectorStore(VectorStore):
+    """
+    Local, read-only vector store over a snapshot, used by the retrieval graph in place of Azure AI Search.
+
+    Scores are cosine similarities. filter is a dict of metadata values that results must match.
+    """
+
+    def __init__(self, snapshot, embedding_function):
+        self.snapshot = snapshot
+        self.embedding_function = embedding_function
+        norms = np.linalg.norm(snapshot.vectors, axis=1) if len(snapshot) else np.empty(0, np.float32)
+        self.inverse_norms = 1.0 / np.maximum(norms, 1e-12)
+
+    @classmethod
+    def load(cls, path, embedding_function):
+        return cls(IndexSnapshot(path), embedding_function)
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, filter=None):
+        if not len(self.snapshot):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        scores = (self.snapshot.vectors @ query) * self.inverse_norms / max(np.linalg.norm(query), 1e-12)
+        if filter:
+            mask = np.array([all(m.get(key) == value for key, value in filter.items())
+                             for m in self.snapshot.metadatas])
+            scores = np.where(mask, scores, -np.inf)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(Document(page_content=self.snapshot.texts[i], metadata=self.snapshot.metadatas[i]), float(scores[i]))
+                for i in top if np.isfinite(scores[i])]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector_with_score(self.embedding_function(query), k=k, filter=filter)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("Snapshots are read-only, rebuild them with IndexSnapshot.py build")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Snapshots are built with IndexSnapshot.py build")
+
+
+def build(snapshot_path):
+    """ Ingest Guides/ into a snapshot file only, no remote vector store is touched """
+    from langchain_openai import OpenAIEmbeddings
+    from langchain_text_splitters import CharacterTextSplitter
+
+    from CropGuideIngestion import CropGuideIngestion
+    from EmbeddingUploader import EmbeddingUploader
+
+    manifest_path = snapshot_path + ".manifest.json"
+    if not os.path.exists(snapshot_path) and os.path.exists(manifest_path):
+        os.remove(manifest_path)  # the manifest is only meaningful together with the rows of the snapshot
+    builder = SnapshotBuilder(snapshot_path)
+    embeddings = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"), model="text-embedding-ada-002")
+    uploader = EmbeddingUploader(embeddings.embed_documents, lambda *args: None, on_embedded=builder.add,
+                                 checkpoint_path=snapshot_path + ".checkpoint")
+    uploader.checkpoint.done &= set(builder.rows)  # only trust checkpointed ids whose vectors we still have
+    ingestion = CropGuideIngestion(CharacterTextSplitter(chunk_size=1000, chunk_overlap=0),
+                                   manifest_path=manifest_path, uploader=uploader)
+    stats = ingestion.sync(builder)
+    builder.write(ingestion.manifest)
+    return stats
+
+
+def restore(snapshot_path):
+    """ Bulk-load a snapshot into the Azure AI Search index configured in the environment """
+    from langchain_community.vectorstores.azuresearch import AzureSearch
+
+    from EmbeddingUploader import azure_search_upload_fn
+
+    snapshot = IndexSnapshot(snapshot_path)
+    endpoint, key = os.getenv("AZURE_SEARCH_ENDPOINT"), os.getenv("AZURE_SEARCH_ADMIN_KEY")
+    # Creates the index with the langchain field layout if it does not exist yet
+    AzureSearch(azure_search_endpoint=endpoint, azure_search_key=key, index_name="crop_guide",
+                embedding_function=lambda text: [0.0] * snapshot.dimensions)
+    return snapshot.restore(azure_search_upload_fn(endpoint, "crop_guide", key),
+                            manifest_path=os.getenv("CROP_GUIDE_MANIFEST", ".cache/crop_guide_manifest.json"))
+
+
+if __name__ == "__main__":
+    # python IndexSnapshot.py build|restore [snapshot path]
+    import pprint
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    path = sys.argv[2] if len(sys.argv) > 2 else os.getenv("CROP_GUIDE_SNAPSHOT", "snapshots/crop_guide.snap")
+    pprint.pprint(build(path) if command == "build" else restore(path))
@@ -0,0 +1,145 @@
+import collections
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+import Telemetry
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+class MicroBatcher:
+    """
+    Request queue and batching worker of one model.
+
+    The worker takes the oldest request, then keeps collecting requests until max_batch_size are waiting or
+    max_wait_ms has passed since the oldest arrived, and runs them as one batch. A lone request therefore
+    waits at most max_wait_ms longer than it would alone, and under load many requests share one call.
+
+    Queue depth, batch sizes, queueing delays and batch durations go to the Telemetry metrics (labelled
+    with the model name) as well as report().
+    """
+
+    def __init__(self, name, predict_batch, max_batch_size=32, max_wait_ms=10):
+        self.name = name
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.batch_sizes = collections.Counter()
+        self.waits = collections.deque(maxlen=10000)  # queueing delay of each request, ms
+        self.inference = collections.deque(maxlen=10000)  # duration of each batch, ms
+        self.stats = {"requests": 0, "batches": 0, "failed": 0}
+        self.thread = threading.Thread(target=self.run, name=f"inference-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, x):
+        future = Future()
+        self.requests.put((x, future, time.perf_counter()))
+        return future
+
+    def predict(self, x):
+        """ Model output for one input (no batch axis), blocks until its batch has run """
+        return self.submit(x).result()
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        metrics = Telemetry.metrics
+        while True:
+            batch = self._collect()
+            metrics.set("inference_queue_depth", self.requests.qsize(), model=self.name)
+            start = time.perf_counter()
+            try:
+                outputs = self.predict_batch(np.stack([x for x, _, _ in batch]))
+                for (_, future, _), output in zip(batch, outputs):
+                    future.set_result(output)
+                failed = 0
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                failed = len(batch)
+            done = time.perf_counter()
+            with self.lock:
+                self.stats["requests"] += len(batch)
+                self.stats["batches"] += 1
+                self.stats["failed"] += failed
+                self.batch_sizes[len(batch)] += 1
+                self.waits.extend((start - arrived) * 1000 for _, _, arrived in batch)
+                self.inference.append((done - start) * 1000)
+            for _, _, arrived in batch:
+                metrics.observe("inference_wait_seconds", start - arrived, model=self.name)
+            metrics.observe("inference_batch_seconds", done - start, model=self.name)
+            metrics.observe("inference_batch_size", len(batch), buckets=BATCH_SIZE_BUCKETS, model=self.name)
+            metrics.inc("inference_requests_total", len(batch) - failed, model=self.name, outcome="ok")
+            if failed:
+                metrics.inc("inference_requests_total", failed, model=self.name, outcome="error")
+
+    def report(self):
+        with self.lock:
+            waits, inference = list(self.waits), list(self.inference)
+            return {**self.stats, "queue_depth": self.requests.qsize(),
+                    "mean_batch_size": round(self.stats["requests"] / self.stats["batches"], 2) if self.stats["batches"] else 0.0,
+                    "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                    "wait_ms": {"p50": round(percentile(waits, 0.5), 2), "p95": round(percentile(waits, 0.95), 2),
+                                "max": round(max(waits, default=0.0), 2)},
+                    "batch_ms": {"p50": round(percentile(inference, 0.5), 2),
+                                 "p95": round(percentile(inference, 0.95), 2)}}
+
+
+class InferenceServer:
+    """
+    In-process inference service for the image classifiers.
+
+    Each registered model gets a MicroBatcher, so concurrent classification requests (Streamlit sessions,
+    BulkAssessment workers) are run as dynamic batches by one worker per model instead of competing
+    batch-of-one predict calls. With batching disabled predict() calls the model directly.
+    """
+
+    def __init__(self, max_batch_size=32, max_wait_ms=10, batching=True):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.batching = batching
+        self.models = {}
+        self.batchers = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(max_batch_size=int(os.getenv("INFERENCE_MAX_BATCH", "32")),
+                   max_wait_ms=float(os.getenv("INFERENCE_MAX_WAIT_MS", "10")),
+                   batching=os.getenv("INFERENCE_BATCHING", "1") == "1")
+
+    def register(self, name, model):
+        """ Serve a Keras model (or anything with predict_on_batch) under a name """
+        self.models[name] = model
+        if self.batching:
+            self.batchers[name] = MicroBatcher(name, lambda batch: np.asarray(model.predict_on_batch(batch)),
+                                               self.max_batch_size, self.max_wait_ms)
+
+    def predict(self, name, x):
+        """ Output of a model for one input without the batch axis, e.g. class probabilities of one image """
+        with Telemetry.span("classifier", model=name):
+            if not self.batching:
+                return np.asarray(self.models[name].predict_on_batch(np.expand_dims(x, axis=0)))[0]
+            return self.batchers[name].predict(x)
+
+    def report(self):
+        return {name: batcher.report() for name, batcher in self.batchers.items()}
@@ -0,0 +1,143 @@
+import os
+import random
+import re
+import threading
+import zlib
+
+import numpy as np
+
+import Telemetry
+
+
+class LocalGroundednessCheck:
+    """
+    First-stage groundedness gate that runs before the remote UpstageGroundednessCheck.
+
+    Every sentence of the generation is broken into word n-grams which are looked up against the n-grams
+    of the context documents. The share of supported sentences decides the outcome:
+
+        support >= grounded_threshold  -> "grounded" (no remote call)
+        otherwise                      -> defer to the remote checker
+
+    Low overlap is never rejected locally: a paraphrased answer can be grounded while sharing few n-grams
+    with the context, and a local "notGrounded" would send it around the rewrite loop for good.
+
+    A fraction of the local decisions (audit_rate) is also sent to the remote checker so that agreement
+    statistics between the two stay measurable.
+    """
+
+    def __init__(self, remote=None, ngram_size=3, sentence_threshold=0.5, grounded_threshold=0.8, audit_rate=0.05):
+        if not 0 <= grounded_threshold <= 1:
+            raise ValueError("Expected 0 <= grounded_threshold <= 1")
+        self.remote = remote
+        self.ngram_size = ngram_size
+        self.sentence_threshold = sentence_threshold
+        self.grounded_threshold = grounded_threshold
+        self.audit_rate = audit_rate
+        self.lock = threading.Lock()
+        self.stats = {"local_grounded": 0, "deferred": 0, "audited": 0, "agreed": 0, "disagreed": 0}
+
+    @classmethod
+    def from_env(cls, remote=None):
+        """ GROUNDEDNESS_GROUNDED_THRESHOLD, _SENTENCE_THRESHOLD, _NGRAM_SIZE and _AUDIT_RATE """
+        return cls(remote=remote,
+                   ngram_size=int(os.getenv("GROUNDEDNESS_NGRAM_SIZE", "3")),
+                   sentence_threshold=float(os.getenv("GROUNDEDNESS_SENTENCE_THRESHOLD", "0.5")),
+                   grounded_threshold=float(os.getenv("GROUNDEDNESS_GROUNDED_THRESHOLD", "0.8")),
+                   audit_rate=float(os.getenv("GROUNDEDNESS_AUDIT_RATE", "0.05")))
+
+    def _count(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.stats[key] += 1
+
+    @staticmethod
+    def _text(document):
+        return getattr(document, "page_content", document if isinstance(document, str) else str(document))
+
+    @staticmethod
+    def _split_sentences(text):
+        return [s for s in re.split(r"(?<=[.!?])\s+|\n+", text) if s.strip()]
+
+    def _ngram_hashes(self, text):
+        """ Hashes of the word n-grams of a text. Short texts fall back to their unigrams. """
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        n = self.ngram_size if len(words) >= self.ngram_size else 1
+        grams = [" ".join(words[i:i + n]) for i in range(len(words) - n + 1)]
+        return np.fromiter((zlib.crc32(g.encode()) for g in grams), dtype=np.uint32, count=len(grams))
+
+    def score(self, context, answer):
+        """ Fraction of the answer's sentences (weighted by length) that are supported by the context. """
+        documents = context if isinstance(context, (list, tuple)) else [context]
+        context_hashes = [self._ngram_hashes(self._text(d)) for d in documents]
+        context_hashes = np.unique(np.concatenate(context_hashes)) if context_hashes else np.empty(0, np.uint32)
+
+        sentence_hashes = [self._ngram_hashes(s) for s in self._split_sentences(answer)]
+        sentence_hashes = [h for h in sentence_hashes if len(h)]
+        if not sentence_hashes or not len(context_hashes):
+            return 0.0
+
+        # One flat array of every answer n-gram tagged with its sentence id, scored in a single pass
+        lengths = np.fromiter((len(h) for h in sentence_hashes), dtype=np.int64, count=len(sentence_hashes))
+        sentence_ids = np.repeat(np.arange(len(sentence_hashes)), lengths)
+        hits = np.isin(np.concatenate(sentence_hashes), context_hashes, assume_unique=False)
+        coverage = np.bincount(sentence_ids, weights=hits, minlength=len(lengths)) / lengths
+        supported = coverage >= self.sentence_threshold
+        return float(np.sum(lengths[supported]) / np.sum(lengths))
+
+    def decide(self, score):
+        """ "grounded" when the overlap is high enough to skip the remote check, otherwise None """
+        if score >= self.grounded_threshold:
+            return "grounded"
+        return None
+
+    def _route(self, request_input):
+        """
+        (decision, ask_remote) for a request, with the stats counted. decision is None when the remote
+        checker decides, ask_remote is also True for an audit of a local decision.
+        """
+        decision = self.decide(self.score(request_input["context"], request_input["answer"]))
+        if decision is None:
+            self._count("deferred")
+            if self.remote is None:
+                return "notSure", False
+        else:
+            self._count("local_grounded")
+            if self.remote is None or not self.audit_rate or random.random() >= self.audit_rate:
+                return decision, False
+        Telemetry.external_call("groundedness_check")
+        return decision, True
+
+    def _settle(self, decision, remote_decision):
+        """ Outcome once the remote checker answered: its own decision, or the audited local one """
+        if decision is None:
+            return remote_decision
+        self._count("audited", "agreed" if remote_decision == decision else "disagreed")
+        return decision
+
+    def invoke(self, request_input):
+        """ Same input and output as UpstageGroundednessCheck.invoke: {"context", "answer"} -> label """
+        decision, ask_remote = self._route(request_input)
+        if not ask_remote:
+            return decision
+        return self._settle(decision, self.remote.invoke(request_input))
+
+    async def ainvoke(self, request_input):
+        """ Async invoke, only the remote check is awaited """
+        decision, ask_remote = self._route(request_input)
+        if not ask_remote:
+            return decision
+        return self._settle(decision, await self.remote.ainvoke(request_input))
+
+    def agreement(self):
+        """ Summary of how often the local gate decided alone and how often it agreed with the remote checker """
+        with self.lock:
+            stats = dict(self.stats)
+        local = stats["local_grounded"]
+        total = local + stats["deferred"]
+        audited = stats["audited"]
+        return {
+            **stats,
+            "local_decision_rate": local / total if total else 0.0,
+            "agreement_rate": stats["agreed"] / audited if audited else None,
+        }
@@ -0,0 +1,196 @@
+import bisect
+import csv
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0
+DEFAULT_GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Gazetteer", "us_places.csv")
+
+log = logging.getLogger(__name__)
+
+
+def normalize_place(text):
+    """ Lower case, no periods, single spaces and ", " between name and state: "Concord,  N.C." -> "concord, nc" """
+    text = re.sub(r"\s*,\s*", ", ", text.lower().replace(".", ""))
+    return re.sub(r"\s+", " ", text).strip(" ,")
+
+
+def unit_vectors(latitude, longitude):
+    """ Points on the unit sphere, so Euclidean nearest neighbours are great-circle nearest neighbours """
+    lat, lon = np.radians(latitude), np.radians(longitude)
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+class Gazetteer:
+    """
+    Place-name table with a sorted prefix index for forward lookups and a KD-tree for reverse lookups.
+
+    Loads the bundled Gazetteer/us_places.csv (name, state, country, latitude, longitude, population) or a
+    GeoNames cities dump (cities500.txt etc., tab separated). Every place is indexed as "name, state" and
+    "name"; prefix matches are ranked by population.
+    """
+
+    def __init__(self, names, states, countries, latitude, longitude, population):
+        self.names, self.states, self.countries = names, states, countries
+        self.latitude = np.asarray(latitude, dtype=np.float64)
+        self.longitude = np.asarray(longitude, dtype=np.float64)
+        self.population = np.asarray(population, dtype=np.int64)
+        self.tree = cKDTree(unit_vectors(self.latitude, self.longitude))
+
+        entries = []
+        for i, (name, state) in enumerate(zip(names, states)):
+            entries.append((normalize_place(f"{name}, {state}"), -self.population[i], i))
+            entries.append((normalize_place(name), -self.population[i], i))
+        entries.sort()
+        self.keys = [key for key, _, _ in entries]
+        self.rows = [i for _, _, i in entries]
+
+    @classmethod
+    def load(cls, path=DEFAULT_GAZETTEER):
+        columns = {"name": [], "state": [], "country": [], "latitude": [], "longitude": [], "population": []}
+        with open(path, newline="", encoding="utf-8") as f:
+            if path.endswith(".csv"):
+                for row in csv.DictReader(f):
+                    for column, values in columns.items():
+                        values.append(row.get(column) or 0)
+            else:
+                for line in f:
+                    row = line.rstrip("\n").split("\t")
+                    for column, index in (("name", 1), ("latitude", 4), ("longitude", 5), ("country", 8),
+                                          ("state", 10), ("population", 14)):
+                        columns[column].append(row[index] or 0)
+        return cls(columns["name"], columns["state"], columns["country"],
+                   np.asarray(columns["latitude"], dtype=np.float64),
+                   np.asarray(columns["longitude"], dtype=np.float64),
+                   np.asarray(columns["population"], dtype=np.float64).astype(np.int64))
+
+    def __len__(self):
+        return len(self.names)
+
+    def label(self, row):
+        return f"{self.names[row]}, {self.states[row]}"
+
+    def prefix(self, text, limit=5):
+        """ Rows of the places whose name or "name, state" starts with text, most populous first """
+        key = normalize_place(text)
+        if not key:
+            return []
+        start = bisect.bisect_left(self.keys, key)
+        end = bisect.bisect_left(self.keys, key + "\uffff", lo=start)
+        rows = sorted(set(self.rows[start:end]), key=lambda row: -self.population[row])
+        return rows[:limit]
+
+    def find(self, text):
+        """ Row of the best match for a place name, exact "name, state" or name first, None without a match """
+        key = normalize_place(text)
+        start = bisect.bisect_left(self.keys, key)
+        if start < len(self.keys) and self.keys[start] == key:
+            return self.rows[start]  # most populous of the exact matches
+        if "," not in key and " " in key:
+            # "Concord NC"
+            name, _, state = key.rpartition(" ")
+            row = self.find(f"{name}, {state}")
+            if row is not None:
+                return row
+        rows = self.prefix(key, limit=1)
+        return rows[0] if rows else None
+
+    def nearest(self, latitude, longitude):
+        """ Row of the nearest place and its distance in km """
+        chord, row = self.tree.query(unit_vectors([latitude], [longitude])[0])
+        return int(row), float(2 * EARTH_RADIUS_KM * np.arcsin(min(1.0, chord / 2)))
+
+
+class OfflineGeocoder:
+    """
+    Forward and reverse geocoding from the local gazetteer with an LRU results cache in front.
+
+    The online geocoder (ArcGIS through the geocoder package) is only asked when the gazetteer has no match,
+    or the nearest place is more than max_distance_km away, and when it fails (offline) the nearest place is
+    used anyway so the app keeps working. Answers that depended on a failed or empty online lookup are not
+    cached, the next request asks again.
+    """
+
+    def __init__(self, gazetteer=None, online=True, max_distance_km=50, cache_size=4096):
+        self.gazetteer = gazetteer or Gazetteer.load()
+        self.online = online
+        self.max_distance_km = max_distance_km
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "online": 0, "online_failed": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(Gazetteer.load(os.getenv("GAZETTEER_PATH", DEFAULT_GAZETTEER)),
+                   online=os.getenv("GEOCODER_ONLINE_FALLBACK", "1") == "1")
+
+    def _cached(self, key, compute):
+        """ compute() returns the value and whether it may be cached """
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return self.cache[key]
+            self.stats["misses"] += 1
+        value, cacheable = compute()
+        if not cacheable:
+            return value
+        with self.lock:
+            self.cache[key] = value
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return value
+
+    def _online(self, lookup):
+        """ Result of an online lookup, or False when it failed (None when online lookups are disabled) """
+        if not self.online:
+            return None
+        with self.lock:
+            self.stats["online"] += 1
+        try:
+            import geocoder
+            return lookup(geocoder)
+        except Exception as e:
+            with self.lock:
+                self.stats["online_failed"] += 1
+            log.warning("Online geocoder failed: %s", e)
+            return False
+
+    def forward(self, location):
+        """ (latitude, longitude) of a place name, None when it is unknown """
+        def compute():
+            row = self.gazetteer.find(location)
+            if row is not None:
+                return (float(self.gazetteer.latitude[row]), float(self.gazetteer.longitude[row])), True
+            latlng = self._online(lambda geocoder: geocoder.arcgis(location).latlng)
+            return (tuple(latlng), True) if latlng else (None, False)
+        return self._cached(("forward", normalize_place(location)), compute)
+
+    def reverse(self, latitude, longitude):
+        """ "City, ST" of the place nearest to a location """
+        def compute():
+            row, distance = self.gazetteer.nearest(latitude, longitude)
+            if distance > self.max_distance_km:
+                arc = self._online(lambda geocoder: geocoder.arcgis([latitude, longitude], method="reverse"))
+                if arc and arc.city:
+                    return f"{arc.city}, {arc.state}", True
+                return self.gazetteer.label(row), arc is None
+            return self.gazetteer.label(row), True
+        # ~100 m, finer than any place the gazetteer can tell apart
+        return self._cached(("reverse", round(float(latitude), 3), round(float(longitude), 3)), compute)
+
+    def suggest(self, text, limit=5):
+        """ "City, ST" completions of a partially typed place name """
+        return [self.gazetteer.label(row) for row in self.gazetteer.prefix(text, limit)]
+
+    def report(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {**self.stats, "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+                "places": len(self.gazetteer)}
@@ -1,26 +1,47 @@
+import asyncio
+import logging
 import os
 import operator
 import pprint
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from typing import TypedDict, Annotated
 
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage
+from langchain_core.messages import AIMessage, AnyMessage, SystemMessage, HumanMessage, ToolMessage
 from langchain_core.output_parsers import JsonOutputParser, MarkdownListOutputParser
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.graph import StateGraph, END
 import AgentTools as tools
+from SensorStore import SensorStore
+import Telemetry
+from TaskPipeline import AsyncTaskPipeline, TaskPipeline
+from ToolMemo import ToolMemo
+from WeatherSummary import WeatherSummary
+
+log = logging.getLogger(__name__)
 
 
 class AgentState(TypedDict):
     messages: Annotated[list[AnyMessage], operator.add]
+    system: str
 
 
 class Agent:
-    def __init__(self, model, tool_list, system=""):
+    def __init__(self, model, tool_list, system="", max_workers=8, tool_timeout=180, tool_timeouts=None):
         self.system = system
+        # Tool calls of one turn are independent, they run concurrently on this pool
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-tool")
+        self.tool_timeout = tool_timeout
+        self.tool_timeouts = tool_timeouts or {}
         graph = StateGraph(AgentState)
-        graph.add_node("llm", self.call_openai)
-        graph.add_node("action", self.take_action)
+        # Nodes have sync and async implementations, used by graph.invoke and graph.ainvoke respectively. Every
+        # pass of the agent loop goes through the llm node.
+        graph.add_node("llm", RunnableLambda(Telemetry.node("agent", "llm", self.call_openai, loop=True),
+                                            afunc=Telemetry.node("agent", "llm", self.acall_openai, loop=True)))
+        graph.add_node("action", RunnableLambda(Telemetry.node("agent", "action", self.take_action),
+                                               afunc=Telemetry.node("agent", "action", self.atake_action)))
         graph.add_conditional_edges("llm", self.exists_action, {True: "action", False: END})
         graph.add_edge("action", "llm")
         graph.set_entry_point("llm")
@@ -32,24 +53,117 @@ class Agent:
 
     def call_openai(self, state: AgentState):
         messages = state['messages']
-        if self.system:
-            messages = [SystemMessage(content=self.system)] + messages
+        # The graph is shared across requests, the system prompt of a request comes in with its state
+        system = state.get('system') or self.system
+        if system:
+            messages = [SystemMessage(content=system)] + messages
         message = self.model.invoke(messages)
         return {'messages': [message]}
 
 
+    async def acall_openai(self, state: AgentState):
+        messages = state['messages']
+        system = state.get('system') or self.system
+        if system:
+            messages = [SystemMessage(content=system)] + messages
+        message = await self.model.ainvoke(messages)
+        return {'messages': [message]}
+
+
     def exists_action(self, state: AgentState):
         result = state['messages'][-1]
         return len(result.tool_calls) > 0
 
 
-    def take_action(self, state: AgentState):
-        tool_calls = state['messages'][-1].tool_calls
+    def run_tool(self, t, caches=None, memo=None):
+        """ Run one tool call, through the request's ToolMemo and the shared AssessmentCaches when given """
+        if t['name'] not in self.tool_list:
+            raise ValueError(f"Unknown tool {t['name']}")
+        invoke = lambda: self.tool_list[t['name']].invoke(t['args'])
+        if caches is not None:
+            invoke_tool, invoke = invoke, lambda: caches.call_tool(t['name'], t['args'], invoke_tool)
+        with Telemetry.span("tool", tool=t['name']):
+            if memo is not None:
+                return memo.call(t['name'], t['args'], invoke)
+            return invoke()
+
+
+    def run_tools(self, tool_calls, caches=None, memo=None):
+        """
+        Run tool calls concurrently. Results come back in call order, a failed or slow tool as an error text.
+
+        A call's timeout starts when it starts running, not while it waits for a thread of the shared pool. A
+        timed-out call cannot be interrupted: it keeps running in the background and holds its thread until
+        it returns, only its answer is replaced by the timeout error.
+        """
+        started = {}
+
+        def run(i, t):
+            started[i] = time.monotonic()
+            return self.run_tool(t, caches, memo)
+
+        futures = [Telemetry.submit(self.executor, run, i, t) for i, t in enumerate(tool_calls)]
         results = []
-        for t in tool_calls:
-            result = self.tool_list[t['name']].invoke(t['args'])
-            results.append(ToolMessage(tool_call_id=t['id'], name=t['name'], content=str(result)))
-        return {'messages': results}
+        for i, (t, future) in enumerate(zip(tool_calls, futures)):
+            timeout = self.tool_timeouts.get(t['name'], self.tool_timeout)
+            while True:
+                start = started.get(i)
+                remaining = timeout if start is None else start + timeout - time.monotonic()
+                try:
+                    results.append(future.result(timeout=max(0, remaining)))
+                except FutureTimeoutError:
+                    if started.get(i) is None:
+                        continue  # still queued behind other calls
+                    log.warning("Tool %s did not finish within %s seconds, it keeps running in the background",
+                                t['name'], timeout)
+                    results.append(f"Error: tool {t['name']} did not finish within {timeout} seconds")
+                except Exception as e:
+                    results.append(f"Error: tool {t['name']} failed with {type(e).__name__}: {e}")
+                break
+        return results
+
+
+    async def arun_tool(self, t, caches=None, memo=None):
+        if t['name'] not in self.tool_list:
+            raise ValueError(f"Unknown tool {t['name']}")
+        ainvoke = lambda: self.tool_list[t['name']].ainvoke(t['args'])
+        if caches is not None:
+            ainvoke_tool, ainvoke = ainvoke, lambda: caches.acall_tool(t['name'], t['args'], ainvoke_tool)
+        with Telemetry.span("tool", tool=t['name']):
+            if memo is not None:
+                return await memo.acall(t['name'], t['args'], ainvoke)
+            return await ainvoke()
+
+
+    async def arun_tools(self, tool_calls, caches=None, memo=None):
+        """ Async run_tools, the tool calls run as concurrent tasks """
+        async def run(t):
+            timeout = self.tool_timeouts.get(t['name'], self.tool_timeout)
+            try:
+                return await asyncio.wait_for(self.arun_tool(t, caches, memo), timeout)
+            except asyncio.TimeoutError:
+                return f"Error: tool {t['name']} did not finish within {timeout} seconds"
+            except Exception as e:
+                return f"Error: tool {t['name']} failed with {type(e).__name__}: {e}"
+        return await asyncio.gather(*(run(t) for t in tool_calls))
+
+
+    def take_action(self, state: AgentState, config: RunnableConfig = None):
+        tool_calls = state['messages'][-1].tool_calls
+        # Caches shared across requests (see AssessmentCaches) and the request's ToolMemo come in through the
+        # invocation config
+        configurable = (config or {}).get('configurable', {})
+        results = self.run_tools(tool_calls, configurable.get('caches'), configurable.get('memo'))
+        return {'messages': [ToolMessage(tool_call_id=t['id'], name=t['name'], content=str(result))
+                             for t, result in zip(tool_calls, results)]}
+
+
+    async def atake_action(self, state: AgentState, config: RunnableConfig = None):
+        tool_calls = state['messages'][-1].tool_calls
+        configurable = (config or {}).get('configurable', {})
+        results = await self.arun_tools(tool_calls, configurable.get('caches'), configurable.get('memo'))
+        return {'messages': [ToolMessage(tool_call_id=t['id'], name=t['name'], content=str(result))
+                             for t, result in zip(tool_calls, results)]}
 
 
     def parse_final_output(self, state: AgentState):
@@ -58,13 +172,37 @@ class Agent:
         return {'messages': [response]}
 
 
+# Targets the prefetch mode feeds into the water and pH calculators. The write-up still gets the crop guide's
+# own pH and moisture guidance from get_crop_info and can correct for it.
+CROP_TARGETS = {
+    "Corn": {"ph": 6.2, "moisture": 60},
+    "Soybean": {"ph": 6.5, "moisture": 60},
+    "Cotton": {"ph": 6.2, "moisture": 60},
+}
+
+
 class PrecisionFarming:
-    def __init__(self):
-        self.model = ChatOpenAI(model='gpt-4o', openai_api_key=os.getenv("OPENAI_API_KEY"), )
+    def __init__(self, mode=None):
+        # "agent": the LLM decides which tools to call. "prefetch": the data gathering tools are called
+        # directly and in parallel, and the LLM is only asked for the final write-up.
+        self.mode = mode or os.getenv("PRECISION_FARMING_MODE", "agent")
+        self.model = ChatOpenAI(model='gpt-4o', openai_api_key=os.getenv("OPENAI_API_KEY"),
+                                callbacks=[Telemetry.token_usage])
         self.tool_list = [tools.decrease_ph, tools.get_weather_data,
                      tools.get_crop_info, tools.calculate_water_needed, tools.tackle_insect, tools.tackle_disease,
                           tools.increase_ph]
-        self.model.bind_tools(self.tool_list)
+        # Compiled once and shared by all requests, see get_insights. TOOL_WORKERS sizes the tool pool shared by
+        # every request's tool calls (agent turns, the weather and crop guide stages, BulkAssessment fields)
+        self.agent = Agent(self.model, self.tool_list, max_workers=int(os.getenv("TOOL_WORKERS", "8")))
+        self.writer_model = self.model.bind_tools(self.tool_list, tool_choice="none")
+        # Stages of the request pipelines. Separate from the agent's tool pool, the weather and crop guide stages
+        # wait on that pool and must not take its threads.
+        self.pipeline_executor = ThreadPoolExecutor(max_workers=int(os.getenv("PIPELINE_WORKERS", "32")),
+                                                    thread_name_prefix="pipeline")
+        # Soil sensor telemetry, when SENSOR_STORE_DIR is set
+        self.sensor_store = SensorStore.from_env()
+        # Request metrics on METRICS_PORT and/or METRICS_FILE, see Telemetry.py
+        Telemetry.start_exporters()
         self.prompt = """
             You are an Expert framing assistant. You will be given the following information
             Soil PH: {soil_ph}
@@ -113,36 +251,231 @@ class PrecisionFarming:
         """
 
 
+    @staticmethod
+    def tool_calls(calls):
+        """ Tool call dicts for (name, args) pairs, with ids as if the LLM had asked for them """
+        return [{"name": name, "args": args, "id": f"prefetch_{uuid.uuid4().hex[:12]}"} for name, args in calls]
+
+
+    @staticmethod
+    def record_round(messages, tool_calls, results):
+        """ Add tool calls that were run directly and their results to the conversation """
+        messages.append(AIMessage(content="", tool_calls=tool_calls))
+        messages.extend(ToolMessage(tool_call_id=t['id'], name=t['name'], content=str(result))
+                        for t, result in zip(tool_calls, results))
+
+
+    @staticmethod
+    def weather_call(latitude, longitude):
+        return ("get_weather_data", {"latitude": str(latitude), "longitude": str(longitude)})
+
+
+    @staticmethod
+    def crop_guide_calls(crop):
+        """ Crop guide lookups the prompt always needs, they only depend on the crop """
+        return [
+            ("get_crop_info", {"crop_question": f"What is the ideal soil pH and soil moisture for {crop}?",
+                               "crop": crop}),
+            ("get_crop_info", {"crop_question": f"What fertilizer is best for {crop}, and in what weather and "
+                                                f"soil moisture should it be applied?", "crop": crop}),
+        ]
+
+
+    @staticmethod
+    def prefetch_round_two(weather, soil_ph, soil_moisture, area_acres, crop, insect, leaf):
+        """ Calculators and insect/disease lookups, they need the forecast and the classifications """
+        targets = CROP_TARGETS.get(crop, CROP_TARGETS["Corn"])
+        # Rain expected over the next 3 days, the weather tool returns a WeatherSummary unless it failed
+        rainfall = weather.rainfall(days=3) if isinstance(weather, WeatherSummary) else 0.0
+        brief = str(weather)
+
+        water = tools.calculate_water_needed.func(soil_moisture, targets["moisture"], rainfall, area_acres)
+        irrigation_plan = (f"{water:.0f} gallons of irrigation needed over the next 3 days" if water > 0
+                           else "no irrigation needed over the next 3 days")
+        ph_tool = "increase_ph" if soil_ph < targets["ph"] else "decrease_ph"
+        calls = [
+            ("calculate_water_needed", {"field_moisture": soil_moisture, "desired_moisture": targets["moisture"],
+                                        "rainfall_expected": rainfall, "field_area": area_acres}),
+            (ph_tool, {"current_ph": soil_ph, "desired_ph": targets["ph"], "soil_area_acres": area_acres}),
+        ]
+        if insect:
+            calls.append(("tackle_insect", {"crop": crop, "insect_name": insect, "moisture": soil_moisture,
+                                            "weather": brief, "irrigation_plan": irrigation_plan}))
+        if leaf and leaf != "Healthy":
+            calls.append(("tackle_disease", {"crop": crop, "disease_name": leaf, "moisture": soil_moisture,
+                                             "weather": brief, "irrigation_plan": irrigation_plan}))
+        return calls
+
+
+    @staticmethod
+    def seed_weather(memo, latitude, longitude, results):
+        """ The agent asks for the forecast with numbers rather than the strings of weather_call """
+        if not (isinstance(results[0], str) and results[0].startswith("Error: tool")):
+            memo.seed("get_weather_data", {"latitude": float(latitude), "longitude": float(longitude)}, results[0])
+        return results
+
+
+    def classify_insect(self, insect, caches=None):
+        """ Insect name from the image """
+        if insect is None:
+            return None
+        if caches is not None:
+            return caches.classify("insect", insect, tools.predict_insect)
+        return tools.predict_insect(insect)
+
+
+    def classify_leaf(self, crop, leaf, caches=None):
+        """ Leaf disease name from the image, with the crop's classifier """
+        predict = {"Corn": ("corn_leaf", tools.predict_corn_leaf_disease),
+                   "Cotton": ("cotton_leaf", tools.predict_cotton_leaf_disease),
+                   "Soybean": ("soybean_leaf", tools.predict_soybean_leaf_disease)}.get(crop)
+        if leaf is None or predict is None:
+            return leaf
+        if caches is not None:
+            return caches.classify(predict[0], leaf, predict[1])
+        return predict[1](leaf)
+
+
+    def sensor_inputs(self, field_id, soil_ph, soil_moisture):
+        """ Latest sensor pH and moisture of a field and its trend text, the given values without telemetry """
+        if self.sensor_store is None or field_id is None:
+            return soil_ph, soil_moisture, None
+        ph, moisture = self.sensor_store.latest(field_id, "ph"), self.sensor_store.latest(field_id, "moisture")
+        return (round(ph[0], 2) if ph else soil_ph, round(moisture[0], 1) if moisture else soil_moisture,
+                self.sensor_store.summary(field_id))
+
+    def format_prompt(self, soil_ph, soil_moisture, latitude, longitude, area_acres, crop, insect, leaf, trends):
+        prompt = self.prompt.format(leaf=leaf, insect=insect, soil_ph=soil_ph, soil_moisture=soil_moisture,
+                                    latitude=latitude, longitude=longitude, area_acres=area_acres, crop=crop)
+        if trends:
+            prompt += f"\n            Soil sensor readings over the last 7 days: {trends}\n"
+        return prompt
+
     def get_insights(self, soil_ph = 6.5, soil_moisture = 30, latitude = 35.41, longitude= -80.58,
-                     area_acres = 10, crop = "Corn", insect = None, leaf = None):
-
-        print("inset-->", insect, type(insect))
-        print("leaf-->", leaf, type(leaf))
-
-        if insect is not None: insect = tools.predict_insect(insect)
-        if leaf is not None:
-            if crop == "Corn":
-                leaf = tools.predict_corn_leaf_disease(leaf)
-            elif crop == "Cotton":
-                leaf = tools.predict_cotton_leaf_disease(leaf)
-            elif crop == "Soybean":
-                leaf = tools.predict_soybean_leaf_disease(leaf)
-
-        prompt = self.prompt.format(leaf=leaf,
-                                    insect=insect,
-                                    soil_ph=soil_ph,
-                                    soil_moisture=soil_moisture,
-                                    latitude=latitude,
-                                    longitude=longitude,
-                                    area_acres=area_acres,
-                                    crop=crop)
-        abot = Agent(self.model, self.tool_list, system=prompt)
-        thread = {"configurable": {"thread_id": uuid.uuid4()}}
-        question = "Give me your precision farming assessment"
-        response = abot.graph.invoke(
-            {"messages": [HumanMessage(content=[{"type": "text", "text": question}])], "thread": thread})
-        return response['messages'][-1].content
+                     area_acres = 10, crop = "Corn", insect = None, leaf = None, mode = None, caches = None,
+                     field_id = None):
+        """
+        caches: optional AssessmentCaches shared with other assessments, see BulkAssessment.py
+        field_id: field in the sensor store, its latest readings replace soil_ph and soil_moisture
+
+        The request runs as a TaskPipeline: the two classifications, the sensor lookup, the weather forecast and
+        the crop guide lookups are independent and start together. The prompt waits for the classifications
+        and sensors only, and the LLM (the agent, or the write-up after the calculator round in prefetch mode)
+        for everything. The forecast and crop guide answers go into the conversation as tool results.
+        """
+
+        log.debug("insect image %s, leaf image %s", type(insect).__name__, type(leaf).__name__)
+        with Telemetry.request("assessment") as telemetry:
+            memo = ToolMemo()
+            thread = {"configurable": {"thread_id": uuid.uuid4(), "caches": caches, "memo": memo}}
+            question = HumanMessage(content=[{"type": "text", "text": "Give me your precision farming assessment"}])
+            weather_calls = self.tool_calls([self.weather_call(latitude, longitude)])
+            guide_calls = self.tool_calls(self.crop_guide_calls(crop))
+            run_tools = lambda calls: self.agent.run_tools(calls, caches, memo)
+
+            def prompt(insect, leaf, sensors):
+                return self.format_prompt(sensors[0], sensors[1], latitude, longitude, area_acres, crop, insect,
+                                          leaf, sensors[2])
+
+            def conversation(weather, guide):
+                messages = [question]
+                self.record_round(messages, weather_calls + guide_calls, weather + guide)
+                return messages
+
+            pipeline = TaskPipeline(self.pipeline_executor)
+            pipeline.add("insect", lambda: self.classify_insect(insect, caches))
+            pipeline.add("leaf", lambda: self.classify_leaf(crop, leaf, caches))
+            pipeline.add("sensors", lambda: self.sensor_inputs(field_id, soil_ph, soil_moisture))
+            pipeline.add("weather", lambda: self.seed_weather(memo, latitude, longitude, run_tools(weather_calls)))
+            pipeline.add("crop_guide", lambda: run_tools(guide_calls))
+            pipeline.add("prompt", prompt, after=("insect", "leaf", "sensors"))
+            if (mode or self.mode) == "prefetch":
+                def calculators(weather, insect, leaf, sensors):
+                    calls = self.tool_calls(self.prefetch_round_two(weather[0], sensors[0], sensors[1], area_acres,
+                                                                    crop, insect, leaf))
+                    return calls, run_tools(calls)
+
+                def write_up(prompt, weather, guide, calculated):
+                    messages = conversation(weather, guide)
+                    self.record_round(messages, *calculated)
+                    return self.writer_model.invoke([SystemMessage(content=prompt)] + messages).content
+
+                pipeline.add("calculators", calculators, after=("weather", "insect", "leaf", "sensors"))
+                pipeline.add("assessment", write_up, after=("prompt", "weather", "crop_guide", "calculators"))
+            else:
+                def assessment(prompt, weather, guide):
+                    response = self.agent.graph.invoke({"messages": conversation(weather, guide), "system": prompt},
+                                                       thread)
+                    return response['messages'][-1].content
+
+                pipeline.add("assessment", assessment, after=("prompt", "weather", "crop_guide"))
+
+            try:
+                return pipeline.result("assessment")
+            finally:
+                telemetry.annotate(mode=mode or self.mode, pipeline=pipeline.report("assessment"),
+                                   memo=memo.report())
+
+
+    async def aget_insights(self, soil_ph = 6.5, soil_moisture = 30, latitude = 35.41, longitude= -80.58,
+                            area_acres = 10, crop = "Corn", insect = None, leaf = None, mode = None, caches = None,
+                            field_id = None):
+        """ Async get_insights. CNN inference runs in an executor so the event loop keeps serving other requests """
+        with Telemetry.request("assessment") as telemetry:
+            memo = ToolMemo()
+            thread = {"configurable": {"thread_id": uuid.uuid4(), "caches": caches, "memo": memo}}
+            question = HumanMessage(content=[{"type": "text", "text": "Give me your precision farming assessment"}])
+            weather_calls = self.tool_calls([self.weather_call(latitude, longitude)])
+            guide_calls = self.tool_calls(self.crop_guide_calls(crop))
+            run_tools = lambda calls: self.agent.arun_tools(calls, caches, memo)
+
+            def prompt(insect, leaf, sensors):
+                return self.format_prompt(sensors[0], sensors[1], latitude, longitude, area_acres, crop, insect,
+                                          leaf, sensors[2])
+
+            def conversation(weather, guide):
+                messages = [question]
+                self.record_round(messages, weather_calls + guide_calls, weather + guide)
+                return messages
+
+            async def weather():
+                return self.seed_weather(memo, latitude, longitude, await run_tools(weather_calls))
+
+            pipeline = AsyncTaskPipeline()
+            pipeline.add("insect", lambda: asyncio.to_thread(self.classify_insect, insect, caches))
+            pipeline.add("leaf", lambda: asyncio.to_thread(self.classify_leaf, crop, leaf, caches))
+            pipeline.add("sensors", lambda: self.sensor_inputs(field_id, soil_ph, soil_moisture))
+            pipeline.add("weather", weather)
+            pipeline.add("crop_guide", lambda: run_tools(guide_calls))
+            pipeline.add("prompt", prompt, after=("insect", "leaf", "sensors"))
+            if (mode or self.mode) == "prefetch":
+                async def calculators(weather, insect, leaf, sensors):
+                    calls = self.tool_calls(self.prefetch_round_two(weather[0], sensors[0], sensors[1], area_acres,
+                                                                    crop, insect, leaf))
+                    return calls, await run_tools(calls)
+
+                async def write_up(prompt, weather, guide, calculated):
+                    messages = conversation(weather, guide)
+                    self.record_round(messages, *calculated)
+                    return (await self.writer_model.ainvoke([SystemMessage(content=prompt)] + messages)).content
+
+                pipeline.add("calculators", calculators, after=("weather", "insect", "leaf", "sensors"))
+                pipeline.add("assessment", write_up, after=("prompt", "weather", "crop_guide", "calculators"))
+            else:
+                async def assessment(prompt, weather, guide):
+                    response = await self.agent.graph.ainvoke({"messages": conversation(weather, guide),
+                                                               "system": prompt}, thread)
+                    return response['messages'][-1].content
+
+                pipeline.add("assessment", assessment, after=("prompt", "weather", "crop_guide"))
+
+            try:
+                return await pipeline.result("assessment")
+            finally:
+                telemetry.annotate(mode=mode or self.mode, pipeline=pipeline.report("assessment"),
+                                   memo=memo.report())
 
 if __name__ == "__main__":
+    Telemetry.configure_logging()
     pf = PrecisionFarming()
     pprint.pprint(pf.get_insights())
\ No newline at end of file
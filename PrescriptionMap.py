@@ -0,0 +1,166 @@
+import argparse
+import csv
+import json
+import pprint
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+import ZoneCalculators
+
+METERS_PER_DEGREE_LAT = 110540.0
+METERS_PER_DEGREE_LON = 111320.0
+SQUARE_METERS_PER_ACRE = 4046.8564224
+SENSOR_COLUMNS = ("moisture", "ph")
+
+
+def load_sensors(path):
+    """
+    Sensor readings from a CSV (with a header row) or JSONL file. Columns: latitude, longitude and any of
+    moisture, ph. A sensor that does not measure one of them leaves it empty.
+    """
+    with open(path, newline="") as f:
+        rows = [json.loads(line) for line in f if line.strip()] if path.endswith(".jsonl") else list(csv.DictReader(f))
+    readings = {"latitude": [], "longitude": [], **{c: [] for c in SENSOR_COLUMNS}}
+    for row in rows:
+        for column, values in readings.items():
+            value = row.get(column)
+            values.append(float(value) if value not in (None, "") else np.nan)
+    return {column: np.asarray(values) for column, values in readings.items()}
+
+
+class LocalProjection:
+    """ Equirectangular projection to meters around an origin, accurate enough at field scale """
+
+    def __init__(self, latitude, longitude):
+        self.latitude, self.longitude = latitude, longitude
+        self.lon_scale = METERS_PER_DEGREE_LON * np.cos(np.radians(latitude))
+
+    def to_xy(self, latitude, longitude):
+        return np.column_stack(((np.asarray(longitude) - self.longitude) * self.lon_scale,
+                                (np.asarray(latitude) - self.latitude) * METERS_PER_DEGREE_LAT))
+
+
+def idw(tree, values, points, k=8, power=2.0, max_distance=np.inf, chunk_size=262144):
+    """
+    Inverse distance weighted interpolation of values (one per point in tree) at points, from the k nearest
+    neighbours. Points with no neighbour within max_distance get NaN. Queried in chunks to bound memory.
+    """
+    k = min(k, tree.n)
+    padded = np.append(np.asarray(values, dtype=np.float64), 0.0)  # index tree.n is "no neighbour"
+    out = np.empty(len(points))
+    for start in range(0, len(points), chunk_size):
+        distances, indices = tree.query(points[start:start + chunk_size], k=k, distance_upper_bound=max_distance,
+                                        workers=-1)
+        if k == 1:
+            distances, indices = distances[:, None], indices[:, None]
+        weights = np.where(np.isfinite(distances), 1.0 / np.maximum(distances, 1e-6) ** power, 0.0)
+        total = weights.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[start:start + chunk_size] = (weights * padded[indices]).sum(axis=1) / total
+    return out
+
+
+class PrescriptionMap:
+    """
+    Variable-rate irrigation and pH prescription for a field from scattered sensor readings.
+
+    Moisture and pH readings are interpolated onto a raster of cell_size_m cells covering the sensors (or the
+    given bounds) with KD-tree IDW, and every cell goes through ZoneCalculators.zone_plan. Grids are rows x
+    cols with row 0 at the north edge; cells beyond max_distance_m of any sensor are NaN and left out of the
+    totals.
+    """
+
+    def __init__(self, sensors, desired_moisture, desired_ph, rainfall_expected=0.0, cell_size_m=10.0, bounds=None,
+                 k=8, power=2.0, max_distance_m=None):
+        start = time.perf_counter()
+        latitude, longitude = np.asarray(sensors["latitude"]), np.asarray(sensors["longitude"])
+        # bounds: (south, west, north, east)
+        self.bounds = bounds or (latitude.min(), longitude.min(), latitude.max(), longitude.max())
+        south, west, north, east = self.bounds
+        self.cell_size_m = cell_size_m
+        projection = LocalProjection((south + north) / 2, (west + east) / 2)
+
+        rows = max(1, int(np.ceil((north - south) * METERS_PER_DEGREE_LAT / cell_size_m)))
+        cols = max(1, int(np.ceil((east - west) * projection.lon_scale / cell_size_m)))
+        self.lat = north - (np.arange(rows) + 0.5) * cell_size_m / METERS_PER_DEGREE_LAT
+        self.lon = west + (np.arange(cols) + 0.5) * cell_size_m / projection.lon_scale
+        self.shape = (rows, cols)
+
+        # Cell centres in meters, y repeats along a row and x along a column
+        cells = np.empty((rows * cols, 2))
+        cells[:, 0] = np.tile((self.lon - projection.longitude) * projection.lon_scale, rows)
+        cells[:, 1] = np.repeat((self.lat - projection.latitude) * METERS_PER_DEGREE_LAT, cols)
+
+        sensor_xy = projection.to_xy(latitude, longitude)
+        max_distance = max_distance_m if max_distance_m is not None else np.inf
+        self.layers = {}
+        for column in SENSOR_COLUMNS:
+            values = np.asarray(sensors[column], dtype=np.float64)
+            measured = ~np.isnan(values)
+            if not measured.any():
+                raise ValueError(f"No sensor reports {column}")
+            # Each layer has its own tree, sensors may measure only moisture or only pH
+            tree = cKDTree(sensor_xy[measured])
+            self.layers[column] = idw(tree, values[measured], cells, k, power, max_distance).reshape(self.shape)
+        self.interpolate_seconds = time.perf_counter() - start
+
+        valid = ~(np.isnan(self.layers["moisture"]) | np.isnan(self.layers["ph"]))
+        zones = {"moisture": self.layers["moisture"][valid], "ph": self.layers["ph"][valid],
+                 "area": np.full(int(valid.sum()), cell_size_m ** 2 / SQUARE_METERS_PER_ACRE)}
+        plan = ZoneCalculators.zone_plan(zones, desired_moisture, desired_ph, rainfall_expected)
+        for name in ("water_gallons", "lime_tons", "aluminum_sulfate_lbs"):
+            grid = np.full(self.shape, np.nan)
+            grid[valid] = plan[name]
+            self.layers[name] = grid
+        self.totals = plan["totals"]
+        self.seconds = time.perf_counter() - start
+
+    def field_means(self):
+        """ Mean interpolated moisture and pH, the single values get_insights takes """
+        return {"soil_moisture": float(np.nanmean(self.layers["moisture"])),
+                "soil_ph": float(np.nanmean(self.layers["ph"]))}
+
+    def report(self):
+        return {"shape": self.shape, "cells": self.shape[0] * self.shape[1], "cell_size_m": self.cell_size_m,
+                "interpolate_seconds": round(self.interpolate_seconds, 3), "seconds": round(self.seconds, 3),
+                **self.field_means(), "totals": self.totals}
+
+    def save(self, path):
+        """ Write the map as .npz (grids and axes) or .geojson (one polygon per cell, for small maps) """
+        if path.endswith(".geojson") or path.endswith(".json"):
+            with open(path, "w") as f:
+                json.dump(self.to_geojson(), f)
+        else:
+            np.savez_compressed(path, lat=self.lat, lon=self.lon, bounds=np.asarray(self.bounds),
+                                cell_size_m=self.cell_size_m, totals=json.dumps(self.totals), **self.layers)
+
+    def to_geojson(self):
+        half_lat = (self.lat[0] - self.lat[1]) / 2 if len(self.lat) > 1 else (self.bounds[2] - self.bounds[0]) / 2
+        half_lon = (self.lon[1] - self.lon[0]) / 2 if len(self.lon) > 1 else (self.bounds[3] - self.bounds[1]) / 2
+        features = []
+        for r, c in zip(*np.nonzero(~np.isnan(self.layers["water_gallons"]))):
+            lat, lon = float(self.lat[r]), float(self.lon[c])
+            ring = [[lon - half_lon, lat - half_lat], [lon + half_lon, lat - half_lat], [lon + half_lon, lat + half_lat],
+                    [lon - half_lon, lat + half_lat], [lon - half_lon, lat - half_lat]]
+            features.append({"type": "Feature", "geometry": {"type": "Polygon", "coordinates": [ring]},
+                             "properties": {name: round(float(grid[r, c]), 3) for name, grid in self.layers.items()}})
+        return {"type": "FeatureCollection", "features": features, "properties": self.totals}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Interpolate sensor readings into an irrigation and pH prescription map")
+    parser.add_argument("sensors", help="CSV or JSONL of latitude, longitude, moisture, ph")
+    parser.add_argument("output", help=".npz for the grids or .geojson for one polygon per cell")
+    parser.add_argument("--desired-moisture", type=float, default=60)
+    parser.add_argument("--desired-ph", type=float, default=6.2)
+    parser.add_argument("--rainfall", type=float, default=0.0, help="Expected rain (inches)")
+    parser.add_argument("--cell-size", type=float, default=10.0, help="Cell size (meters)")
+    parser.add_argument("--neighbours", type=int, default=8)
+    parser.add_argument("--max-distance", type=float, default=None, help="Leave cells farther than this from any sensor empty (meters)")
+    args = parser.parse_args()
+    prescription = PrescriptionMap(load_sensors(args.sensors), args.desired_moisture, args.desired_ph, args.rainfall,
+                                   args.cell_size, k=args.neighbours, max_distance_m=args.max_distance)
+    prescription.save(args.output)
+    pprint.pprint(prescription.report())
@@ -0,0 +1,315 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.parse
+
+log = logging.getLogger(__name__)
+
+# Never part of a key or a recording
+SECRET_PARAMS = {"key", "api_key", "apikey", "api-key", "token", "access_token", "subscription-key"}
+# Response headers that describe the wire encoding rather than the recorded (decoded) body
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie"}
+# Per-request random values that end up in request bodies: our prefetch tool call ids and uuids
+SCRUB = [(re.compile(r"prefetch_[0-9a-f]{12}"), "prefetch_id"),
+         (re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"), "uuid")]
+# Real network in every mode (the fake services, the metrics endpoint)
+PASSTHROUGH_HOSTS = {"127.0.0.1", "localhost", "::1"}
+# Fire-and-forget uploads that are neither recorded nor replayed, answered with an empty 202 (LangSmith tracing)
+IGNORED = [("api.smith.langchain.com", re.compile(r"^/runs"))]
+HTTPX_MODULES = ("httpx", "httpx2")
+
+
+class ReplayMiss(Exception):
+    pass
+
+
+def scrub_url(url):
+    """ URL without secret query parameters, e.g. the weatherapi.com key """
+    parts = urllib.parse.urlsplit(url)
+    query = [(k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+             if k.lower() not in SECRET_PARAMS]
+    return urllib.parse.urlunsplit((parts.scheme, parts.netloc, parts.path, urllib.parse.urlencode(sorted(query)), ""))
+
+
+def body_fingerprint(body):
+    """ Hash of a request body with secret fields removed and per-request ids scrubbed """
+    if not body:
+        return ""
+    if isinstance(body, str):
+        body = body.encode()
+    try:
+        value = json.loads(body)
+        if isinstance(value, dict):
+            value = {k: v for k, v in value.items() if k.lower() not in SECRET_PARAMS}
+        text = json.dumps(value, sort_keys=True)
+    except (ValueError, UnicodeDecodeError):
+        text = body.decode("latin-1")
+    for pattern, replacement in SCRUB:
+        text = pattern.sub(replacement, text)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+class Cassette:
+    """
+    Recorded HTTP exchanges of the remote services, replayed deterministically.
+
+    Requests are keyed by method, URL (without secrets) and a fingerprint of the body, so a replayed run
+    must ask exactly what the recorded run asked; identical requests recorded several times are replayed in
+    recorded order. Recordings are appended to a JSONL file, one exchange per line, without request headers.
+
+    mode "record" calls the real services and appends what they answer, "replay" never touches the network
+    and fails a request that was not recorded with ReplayMiss (a connection error to the client).
+    latency is "recorded" (sleep as long as the recorded call took, times latency_scale), a fixed number of
+    milliseconds, or 0 to answer immediately.
+    """
+
+    def __init__(self, path, mode="replay", latency="recorded", latency_scale=1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.lock = threading.Lock()
+        self.exchanges = {}
+        self.played = {}
+        self.stats = {"recorded": 0, "replayed": 0, "missed": 0, "passthrough": 0, "ignored": 0, "hosts": {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        exchange = json.loads(line)
+                        self.exchanges.setdefault(exchange["key"], []).append(exchange)
+        elif mode == "replay":
+            raise FileNotFoundError(f"No recording at {path}, record it once with mode='record'")
+
+    @classmethod
+    def from_env(cls):
+        """ REPLAY_MODE=record|replay with REPLAY_CASSETTE, None when REPLAY_MODE is not set """
+        mode = os.getenv("REPLAY_MODE")
+        if not mode or mode == "off":
+            return None
+        latency = os.getenv("REPLAY_LATENCY", "recorded")
+        return cls(os.getenv("REPLAY_CASSETTE", "benchmarks/cassettes/end_to_end.jsonl"), mode,
+                   latency if latency == "recorded" else float(latency),
+                   float(os.getenv("REPLAY_LATENCY_SCALE", "1.0")))
+
+    def __len__(self):
+        return sum(len(exchanges) for exchanges in self.exchanges.values())
+
+    @staticmethod
+    def key(method, url, body):
+        return f"{method.upper()} {scrub_url(url)} {body_fingerprint(body)}"
+
+    @staticmethod
+    def route(url):
+        """ "passthrough", "ignored" or None for a request the cassette handles """
+        parts = urllib.parse.urlsplit(url)
+        if parts.hostname in PASSTHROUGH_HOSTS:
+            return "passthrough"
+        if any(parts.hostname == host and pattern.match(parts.path) for host, pattern in IGNORED):
+            return "ignored"
+        return None
+
+    def _count(self, outcome, url):
+        with self.lock:
+            self.stats[outcome] += 1
+            if outcome in ("recorded", "replayed"):
+                host = urllib.parse.urlsplit(url).hostname
+                self.stats["hosts"][host] = self.stats["hosts"].get(host, 0) + 1
+
+    def record(self, method, url, body, status, headers, content, elapsed):
+        key = self.key(method, url, body)
+        try:
+            stored = {"text": content.decode("utf-8")}
+        except UnicodeDecodeError:
+            stored = {"base64": base64.b64encode(content).decode()}
+        exchange = {"key": key, "method": method.upper(), "url": scrub_url(url), "status": status,
+                    "headers": {k: v for k, v in headers.items() if k.lower() not in DROPPED_HEADERS},
+                    "body": stored, "elapsed_ms": round(elapsed * 1000, 1)}
+        with self.lock:
+            self.exchanges.setdefault(key, []).append(exchange)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(exchange) + "\n")
+        self._count("recorded", url)
+
+    def play(self, method, url, body):
+        """ (status, headers, content, delay seconds) of the next recorded answer to a request """
+        key = self.key(method, url, body)
+        with self.lock:
+            exchanges = self.exchanges.get(key)
+            if not exchanges:
+                self.stats["missed"] += 1
+                raise ReplayMiss(f"No recorded response for {key}")
+            index = self.played.get(key, 0)
+            self.played[key] = index + 1
+            exchange = exchanges[index % len(exchanges)]
+        self._count("replayed", url)
+        body = exchange["body"]
+        content = body["text"].encode("utf-8") if "text" in body else base64.b64decode(body["base64"])
+        if self.latency == "recorded":
+            delay = exchange["elapsed_ms"] / 1000 * self.latency_scale
+        else:
+            delay = float(self.latency) / 1000
+        return exchange["status"], exchange["headers"], content, delay
+
+    def report(self):
+        with self.lock:
+            return {**{k: v for k, v in self.stats.items() if k != "hosts"}, "hosts": dict(self.stats["hosts"]),
+                    "exchanges": len(self)}
+
+
+_installed = {"cassette": None, "originals": None}
+
+
+def _requests_hooks(requests, original_send):
+    from requests.structures import CaseInsensitiveDict
+
+    def build(request, status, headers, content):
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = content
+        response._content_consumed = True
+        response.raw = None
+        response.url = request.url
+        response.request = request
+        response.reason = "Recorded"
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+    def send(adapter, request, *args, **kwargs):
+        cassette = _installed["cassette"]
+        route = Cassette.route(request.url)
+        if cassette is None or route == "passthrough":
+            if cassette is not None:
+                cassette._count("passthrough", request.url)
+            return original_send(adapter, request, *args, **kwargs)
+        if route == "ignored":
+            cassette._count("ignored", request.url)
+            return build(request, 202, {"Content-Type": "application/json"}, b"{}")
+        if cassette.mode == "replay":
+            try:
+                status, headers, content, delay = cassette.play(request.method, request.url, request.body)
+            except ReplayMiss as e:
+                raise requests.ConnectionError(str(e), request=request) from e
+            time.sleep(delay)
+            return build(request, status, headers, content)
+        start = time.perf_counter()
+        response = original_send(adapter, request, *args, **kwargs)
+        content = response.content
+        cassette.record(request.method, request.url, request.body, response.status_code, dict(response.headers),
+                        content, time.perf_counter() - start)
+        return response
+
+    return send
+
+
+def _httpx_hooks(httpx, original_handle, original_ahandle):
+    def build(request, status, headers, content):
+        return httpx.Response(status, headers=headers, content=content, request=request)
+
+    def handle(transport, request):
+        cassette = _installed["cassette"]
+        url = str(request.url)
+        route = Cassette.route(url)
+        if cassette is None or route == "passthrough":
+            if cassette is not None:
+                cassette._count("passthrough", url)
+            return original_handle(transport, request)
+        if route == "ignored":
+            cassette._count("ignored", url)
+            return build(request, 202, {"Content-Type": "application/json"}, b"{}")
+        if cassette.mode == "replay":
+            try:
+                status, headers, content, delay = cassette.play(request.method, url, request.read())
+            except ReplayMiss as e:
+                raise httpx.ConnectError(str(e), request=request) from e
+            time.sleep(delay)
+            return build(request, status, headers, content)
+        start = time.perf_counter()
+        response = original_handle(transport, request)
+        content = response.read()
+        cassette.record(request.method, url, request.read(), response.status_code, dict(response.headers), content,
+                        time.perf_counter() - start)
+        return build(request, response.status_code,
+                     {k: v for k, v in response.headers.items() if k.lower() not in DROPPED_HEADERS}, content)
+
+    async def ahandle(transport, request):
+        cassette = _installed["cassette"]
+        url = str(request.url)
+        route = Cassette.route(url)
+        if cassette is None or route == "passthrough":
+            if cassette is not None:
+                cassette._count("passthrough", url)
+            return await original_ahandle(transport, request)
+        if route == "ignored":
+            cassette._count("ignored", url)
+            return build(request, 202, {"Content-Type": "application/json"}, b"{}")
+        if cassette.mode == "replay":
+            try:
+                status, headers, content, delay = cassette.play(request.method, url, await request.aread())
+            except ReplayMiss as e:
+                raise httpx.ConnectError(str(e), request=request) from e
+            await asyncio.sleep(delay)
+            return build(request, status, headers, content)
+        start = time.perf_counter()
+        response = await original_ahandle(transport, request)
+        content = await response.aread()
+        cassette.record(request.method, url, await request.aread(), response.status_code, dict(response.headers),
+                        content, time.perf_counter() - start)
+        return build(request, response.status_code,
+                     {k: v for k, v in response.headers.items() if k.lower() not in DROPPED_HEADERS}, content)
+
+    return handle, ahandle
+
+
+def install(cassette):
+    """
+    Route the HTTP traffic of the process through a cassette: everything sent with requests (weather client,
+    Tavily, Azure SDK, LangChain hub, ArcGIS geocoder) and httpx (OpenAI, Upstage; newer openai releases use
+    the httpx2 fork, which is hooked as well). Install before the first request; install(None) or uninstall()
+    restores the real transports.
+    """
+    import importlib
+    import requests
+    import requests.adapters
+
+    if _installed["originals"] is None:
+        originals = {"requests": requests.adapters.HTTPAdapter.send}
+        requests.adapters.HTTPAdapter.send = _requests_hooks(requests, originals["requests"])
+        for name in HTTPX_MODULES:
+            try:
+                httpx = importlib.import_module(name)
+            except ImportError:
+                continue
+            originals[name] = (httpx.HTTPTransport.handle_request, httpx.AsyncHTTPTransport.handle_async_request)
+            httpx.HTTPTransport.handle_request, httpx.AsyncHTTPTransport.handle_async_request = \
+                _httpx_hooks(httpx, *originals[name])
+        _installed["originals"] = originals
+    _installed["cassette"] = cassette
+    if cassette is not None:
+        log.info("HTTP %s through %s (%d recorded exchanges)", cassette.mode, cassette.path, len(cassette))
+    return cassette
+
+
+def uninstall():
+    import importlib
+    import requests.adapters
+
+    originals = _installed["originals"]
+    if originals is not None:
+        requests.adapters.HTTPAdapter.send = originals.pop("requests")
+        for name, (handle, ahandle) in originals.items():
+            httpx = importlib.import_module(name)
+            httpx.HTTPTransport.handle_request, httpx.AsyncHTTPTransport.handle_async_request = handle, ahandle
+    _installed.update(cassette=None, originals=None)
@@ -1,16 +1,17 @@
+import asyncio
+import logging
 from typing import List
 
 from typing_extensions import TypedDict
-import pprint
 import os
 
 from langchain import hub
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.pydantic_v1 import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain.schema import Document
-from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain_upstage import UpstageGroundednessCheck
 from langchain.chains.query_constructor.base import AttributeInfo
 from langgraph.graph import END, START, StateGraph
@@ -20,6 +21,13 @@ from trulens.providers.openai import OpenAI
 from trulens.apps.langchain import TruChain
 from langchain.load import dumps, loads
 
+from IndexSnapshot import SnapshotVectorStore
+from LocalGroundednessCheck import LocalGroundednessCheck
+import Telemetry
+from WebSearchCache import WebSearchCache
+
+log = logging.getLogger(__name__)
+
 
 class GradeDocuments(BaseModel):
     """Binary score for relevance check on retrieved documents."""
@@ -49,9 +57,9 @@ class RetrievalGraph:
 
 
     def __init__(self):
-        # Initialize Tavily
-        self.web_search_tool = TavilySearchResults(k=3)
-        self.llm = ChatOpenAI(model_name="gpt-4o", temperature=0)
+        # Initialize Tavily (or the local stand-in) behind the web search cache
+        self.web_search_tool = WebSearchCache.from_env()
+        self.llm = ChatOpenAI(model_name="gpt-4o", temperature=0, callbacks=[Telemetry.token_usage])
 
         # Get access to Chroma vector store that has NC state agriculture information
 
@@ -60,23 +68,30 @@ class RetrievalGraph:
         model = "text-embedding-ada-002"
         vector_store_address = os.getenv("AZURE_SEARCH_ENDPOINT")
         vector_store_password = os.getenv("AZURE_SEARCH_ADMIN_KEY")
-        print(vector_store_password)
         embeddings: OpenAIEmbeddings = OpenAIEmbeddings(
             openai_api_key=openai_api_key, openai_api_version=openai_api_version, model=model
         )
         from langchain_community.vectorstores.azuresearch import AzureSearch
         index_name: str = "crop_guide"
 
-        self.vectorstore = AzureSearch(
-            azure_search_endpoint=vector_store_address,
-            azure_search_key=vector_store_password,
-            index_name=index_name,
-            embedding_function=embeddings.embed_query,
-        )
+        # A prebuilt index snapshot (see IndexSnapshot.py) is served locally, otherwise Azure AI Search is used
+        snapshot_path = os.getenv("CROP_GUIDE_SNAPSHOT")
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.vectorstore = SnapshotVectorStore.load(snapshot_path, embeddings.embed_query)
+        else:
+            if snapshot_path:
+                log.warning("CROP_GUIDE_SNAPSHOT=%s does not exist, falling back to Azure AI Search. Build it with "
+                            "'python IndexSnapshot.py build'", snapshot_path)
+            self.vectorstore = AzureSearch(
+                azure_search_endpoint=vector_store_address,
+                azure_search_key=vector_store_password,
+                index_name=index_name,
+                embedding_function=embeddings.embed_query,
+            )
 
         # RAG Chain for checking relevance of retrieved documents
         prompt = hub.pull("rlm/rag-prompt")
-        print(prompt)
+        log.debug("RAG prompt: %s", prompt)
         self.rag_chain = prompt | self.llm | StrOutputParser()
 
         # Prompt
@@ -94,13 +109,20 @@ class RetrievalGraph:
 
         self.question_rewriter = re_write_prompt | self.llm | StrOutputParser()
 
+        # Local groundedness gate, only answers without a clear n-gram overlap go to Upstage
+        self.groundedness_check = LocalGroundednessCheck.from_env(remote=UpstageGroundednessCheck())
+
         workflow = StateGraph(GraphState)
 
-        # Define the nodes
-        workflow.add_node("retrieve", self.retrieve)  # retrieve with content relevance score
-        workflow.add_node("generate", self.generate)  # generate
-        workflow.add_node("transform_query", self.transform_query)  # transform_query
-        workflow.add_node("web_search_node", self.web_search)  # web search
+        # Define the nodes, each with a sync and an async implementation (invoke / ainvoke), timed per node.
+        # Every pass of the rewrite loop starts at retrieve.
+        def node(name, func, afunc, loop=False):
+            return RunnableLambda(Telemetry.node("retrieval", name, func, loop),
+                                  afunc=Telemetry.node("retrieval", name, afunc, loop))
+        workflow.add_node("retrieve", node("retrieve", self.retrieve, self.aretrieve, loop=True))  # retrieve with content relevance score
+        workflow.add_node("generate", node("generate", self.generate, self.agenerate))  # generate
+        workflow.add_node("transform_query", node("transform_query", self.transform_query, self.atransform_query))  # transform_query
+        workflow.add_node("web_search_node", node("web_search_node", self.web_search, self.aweb_search))  # web search
 
         # Build graph
         workflow.add_edge(START, "retrieve")
@@ -130,18 +152,27 @@ class RetrievalGraph:
 
         # Compile
         self.app = workflow.compile()
-        pprint.pprint(self.app.get_graph().draw_ascii())
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Retrieval graph:\n%s", self.app.get_graph().draw_ascii())
 
-    def invoke(self, question, crop):
+    @staticmethod
+    def enable_tracing():
         os.environ["LANGCHAIN_TRACING_V2"] = "True"
         os.environ["LANGCHAIN_PROJECT"] = "RetrievalGraph"
-        return self.app.invoke({"question": question, "crop":"crop"})["generation"]
 
+    def invoke(self, question, crop):
+        self.enable_tracing()
+        return self.app.invoke({"question": question, "crop": crop})["generation"]
 
-    def retrieve(self, state):
 
-        question = state["question"]
-        print(question)
+    async def ainvoke(self, question, crop):
+        self.enable_tracing()
+        state = await self.app.ainvoke({"question": question, "crop": crop})
+        return state["generation"]
+
+
+    def retrieval_chains(self):
+        """ Sub-question generator and relevance filtered retriever used by the retrieve node """
         provider = OpenAI()
         f_context_relevance_score = Feedback(provider.context_relevance)
 
@@ -173,49 +204,67 @@ class RetrievalGraph:
                 """
         prompt_sub_q = ChatPromptTemplate.from_template(template)
 
-        from langchain_core.output_parsers import StrOutputParser
-        from langchain_openai import ChatOpenAI
-
         generate_queries = (
                 prompt_sub_q
-                | ChatOpenAI(temperature=0)
+                | ChatOpenAI(temperature=0, callbacks=[Telemetry.token_usage])
                 | StrOutputParser()
                 | (lambda x: x.split("\n"))
         )
+        return generate_queries, filtered_retriever
+
+
+    def retrieve(self, state):
+
+        question = state["question"]
+        generate_queries, filtered_retriever = self.retrieval_chains()
 
         #retrieval_chain = generate_queries | map(filtered_retriever.get_relevant_documents) | self.get_unique_union
         questions = generate_queries.invoke({"question": question, "crop": state["crop"]})
-        print("questions asked ", questions)
 
         retrieved_docs = []
         for question in questions:
+            Telemetry.external_call("vector_store")
             docs = filtered_retriever.get_relevant_documents(question)
-            print("question", question)
-            print("docs", docs)
+            log.debug("%d documents for sub-question %r", len(docs), question)
             retrieved_docs.append(docs[:])
 
-        print("retrieved documents ...", retrieved_docs)
         docs = self.get_unique_union(retrieved_docs)
-
-        print("documents retrieved from the vector store are", docs)
+        log.info("Retrieved %d unique documents for %d sub-questions", len(docs), len(questions))
         return {"documents": docs}
 
 
+    async def aretrieve(self, state):
+        generate_queries, filtered_retriever = self.retrieval_chains()
+        questions = await generate_queries.ainvoke({"question": state["question"], "crop": state["crop"]})
+        # Sub-questions are looked up concurrently
+        for _ in questions:
+            Telemetry.external_call("vector_store")
+        retrieved_docs = await asyncio.gather(*(filtered_retriever.ainvoke(q) for q in questions))
+        return {"documents": self.get_unique_union(retrieved_docs)}
+
+
     def generate(self, state):
         question = state["question"]
         documents = state["documents"]
         provider = OpenAI()
         generation = self.rag_chain.invoke({"context": documents, "question": question})
 
-        groundedness_check = UpstageGroundednessCheck()
-
         request_input = {
             "context": documents,
             "answer": generation,
         }
 
-        response = groundedness_check.invoke(request_input)
-        print("Groundedness response: ", response)
+        response = self.groundedness_check.invoke(request_input)
+        log.info("Groundedness: %s", response)
+        log.debug("Groundedness gate: %s", self.groundedness_check.agreement())
+        return {"documents": documents, "question": question, "generation": generation, "groundedness": response}
+
+
+    async def agenerate(self, state):
+        question = state["question"]
+        documents = state["documents"]
+        generation = await self.rag_chain.ainvoke({"context": documents, "question": question})
+        response = await self.groundedness_check.ainvoke({"context": documents, "answer": generation})
         return {"documents": documents, "question": question, "generation": generation, "groundedness": response}
 
 
@@ -238,21 +287,22 @@ class RetrievalGraph:
         return {"documents": documents, "question": better_question}
 
 
+    async def atransform_query(self, state):
+        better_question = await self.question_rewriter.ainvoke({"question": state["question"]})
+        return {"documents": state["documents"], "question": better_question}
+
+
     def get_unique_union(self, documents: list[list]):
         """ Unique union of retrieved docs """
         # Flatten list of lists, and convert each Document to string
         flattened_docs = [dumps(doc) for sublist in documents for doc in sublist]
-        # Get unique documents
-        unique_docs = list(set(flattened_docs))
+        # Get unique documents, in first-seen order so prompts (and recorded request bodies) are reproducible
+        unique_docs = list(dict.fromkeys(flattened_docs))
         # Return
         return [loads(doc) for doc in unique_docs]
 
 
-    def web_search(self, state):
-
-        question = state["question"]
-        documents = state["documents"]
-
+    def web_search_queries(self):
         template = """You are an AI language model assistant. Your task is to break down the larger question
         you get into smaller subquestions to do a web search on. 
         
@@ -261,23 +311,25 @@ class RetrievalGraph:
         Original question: {question}"""
         prompt_sub_q = ChatPromptTemplate.from_template(template)
 
-        from langchain_core.output_parsers import StrOutputParser
-        from langchain_openai import ChatOpenAI
-
-        generate_queries = (
+        return (
                 prompt_sub_q
-                | ChatOpenAI(temperature=0)
+                | ChatOpenAI(temperature=0, callbacks=[Telemetry.token_usage])
                 | StrOutputParser()
-                | (lambda x: x.split("\n"))
+                | (lambda x: [q for q in x.split("\n") if q.strip()])
         )
 
-        retrieval_chain = generate_queries | self.web_search_tool.map() | self.get_unique_union
-        docs = retrieval_chain.invoke({"question": question})
+
+    def web_search(self, state):
+
+        question = state["question"]
+        documents = state["documents"]
+
+        questions = self.web_search_queries().invoke({"question": question})
+        docs = self.get_unique_union(self.web_search_tool.batch(questions))
 
         # Web search
-        print("Web search for: ", question)
+        log.info("Web search for %r: %d results from %d queries", question, len(docs), len(questions))
         #docs = self.web_search_tool.invoke({"query": question})
-        print(type(docs), docs)
 
         web_results = "\n".join([d["content"] for d in docs if isinstance(d, dict)])
         web_results = Document(page_content=web_results)
@@ -286,6 +338,14 @@ class RetrievalGraph:
         return {"documents": documents, "question": question}
 
 
+    async def aweb_search(self, state):
+        question = state["question"]
+        questions = await self.web_search_queries().ainvoke({"question": question})
+        docs = self.get_unique_union(await self.web_search_tool.abatch(questions))
+        web_results = Document(page_content="\n".join([d["content"] for d in docs if isinstance(d, dict)]))
+        return {"documents": state["documents"] + [web_results], "question": question}
+
+
     def nothing_retrieved(self, state):
         documents = state["documents"]
         if len(documents) == 0:
@@ -298,6 +358,7 @@ class RetrievalGraph:
 
 
 if __name__ == "__main__":
+    Telemetry.configure_logging()
     graph = RetrievalGraph()
     state = graph.invoke("""
         You are an agricultural pest management expert is a professional with specialized knowledge in entomology, 
@@ -0,0 +1,287 @@
+import argparse
+import csv
+import json
+import os
+import pprint
+import threading
+import time
+
+import numpy as np
+
+METRICS = ("moisture", "ph")
+HOUR, DAY = 3600, 86400
+
+
+def _column(directory, name, dtype, shape, mapped, fill=0):
+    """
+    Fixed-width memory-mapped column, created and filled on first use. The memmap is added to `mapped` for
+    flushing and a plain ndarray view of it is returned, memmap indexing is several times slower.
+    """
+    path = os.path.join(directory, name)
+    exists = os.path.exists(path)
+    column = np.memmap(path, dtype=dtype, mode="r+" if exists else "w+", shape=shape)
+    if fill and not exists:
+        column[:] = fill
+    mapped.append(column)
+    return column.view(np.ndarray)
+
+
+class Rollup:
+    """
+    min / max / sum / count per series for the last `buckets` buckets of `width` seconds, as a ring indexed by
+    bucket number. A reading older than the bucket already in its slot is dropped.
+    """
+
+    def __init__(self, directory, name, series, buckets, width, mapped):
+        self.buckets, self.width = buckets, width
+        shape = (series, buckets)
+        self.bucket = _column(directory, f"{name}.bucket", np.int64, shape, mapped, fill=-1)
+        self.count = _column(directory, f"{name}.count", np.int64, shape, mapped)
+        self.sum = _column(directory, f"{name}.sum", np.float64, shape, mapped)
+        self.min = _column(directory, f"{name}.min", np.float32, shape, mapped, fill=np.inf)
+        self.max = _column(directory, f"{name}.max", np.float32, shape, mapped, fill=-np.inf)
+
+    def add(self, rows, times, values):
+        bucket = times // self.width
+        slot = bucket % self.buckets
+        stale = self.bucket[rows, slot] < bucket
+        if stale.any():
+            r, s = rows[stale], slot[stale]
+            self.bucket[r, s] = bucket[stale]
+            self.count[r, s], self.sum[r, s], self.min[r, s], self.max[r, s] = 0, 0.0, np.inf, -np.inf
+        # Readings for an older bucket than the slot now holds (late, or two buckets of one slot in a batch)
+        current = self.bucket[rows, slot] == bucket
+        if not current.all():
+            rows, slot, values = rows[current], slot[current], values[current]
+        np.add.at(self.count, (rows, slot), 1)
+        np.add.at(self.sum, (rows, slot), values)
+        np.minimum.at(self.min, (rows, slot), values)
+        np.maximum.at(self.max, (rows, slot), values)
+
+    def window(self, rows, last, n):
+        """ Per-bucket (count, sum, min, max) over rows for the n buckets ending at bucket number `last` """
+        wanted = np.arange(last - n + 1, last + 1)
+        index = (rows[:, None], (wanted % self.buckets)[None, :])
+        stale = self.bucket[index] != wanted
+        count = self.count[index]
+        count[stale] = 0
+        total = self.sum[index]
+        total[stale] = 0.0
+        low = self.min[index]
+        low[stale] = np.inf
+        high = self.max[index]
+        high[stale] = -np.inf
+        return count.sum(axis=0), total.sum(axis=0), low.min(axis=0), high.max(axis=0)
+
+
+class SensorStore:
+    """
+    Time-series store for soil sensor telemetry.
+
+    Every (sensor, metric) series gets a row in fixed-width memory-mapped columns: a ring buffer of the last
+    `capacity` raw readings (int64 epoch seconds, float32 value) plus hourly and daily min/max/mean rollups.
+    Batches are appended with array scatter operations, so ingestion does no per-reading Python work beyond
+    parsing. Sensors are registered to a field, and latest()/trend() answer per field for the agent's prompt.
+    Readings of one series are expected in time order.
+
+    One process writes (e.g. the ingest CLI) while others read: the columns are shared through the memory
+    maps, index.json is reloaded when a flush replaced it, and a shared append counter invalidates the
+    cached trends.
+    """
+
+    def __init__(self, directory, max_series=4096, capacity=2016, hours=24 * 8, days=62):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_series, self.capacity = max_series, capacity
+        self.lock = threading.Lock()
+
+        self.mapped = []
+        self.times = _column(directory, "raw.times", np.int64, (max_series, capacity), self.mapped)
+        self.values = _column(directory, "raw.values", np.float32, (max_series, capacity), self.mapped)
+        self.head = _column(directory, "raw.head", np.int64, (max_series,), self.mapped)
+        self.length = _column(directory, "raw.length", np.int64, (max_series,), self.mapped)
+        self.hourly = Rollup(directory, "hourly", max_series, hours, HOUR, self.mapped)
+        self.daily = Rollup(directory, "daily", max_series, days, DAY, self.mapped)
+        self.appends = _column(directory, "raw.appends", np.int64, (1,), self.mapped)
+
+        self.series = {}  # (sensor_id, metric) -> row
+        self.fields = {}  # field_id -> metric -> [rows]
+        self.field_rows = {}
+        self.index_path = os.path.join(directory, "index.json")
+        self.index_version = None
+        self._refresh()
+        self.trends = {}
+        self.trends_version = None
+        self.stats = {"readings": 0, "batches": 0, "ingest_seconds": 0.0}
+
+    @classmethod
+    def from_env(cls):
+        """ Store in SENSOR_STORE_DIR, or None when sensor telemetry is not configured """
+        directory = os.getenv("SENSOR_STORE_DIR")
+        return cls(directory) if directory else None
+
+    def _refresh(self):
+        """ Pick up the series another process registered and flushed since index.json was last read """
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if version == self.index_version:
+            return
+        with self.lock:
+            with open(self.index_path) as f:
+                series = json.load(f)["series"]
+            for sensor_id, field_id, metric, row in series:
+                if (sensor_id, metric) not in self.series:
+                    self._index(sensor_id, field_id, metric, row)
+            self.field_rows = {}
+            self.index_version = version
+
+    def _index(self, sensor_id, field_id, metric, row):
+        self.series[(sensor_id, metric)] = (row, field_id)
+        self.fields.setdefault(field_id, {}).setdefault(metric, []).append(row)
+
+    def register(self, sensor_id, field_id, metric):
+        """ Row of a sensor's metric series, allocated on first use """
+        key = (sensor_id, metric)
+        if key not in self.series:
+            if metric not in METRICS:
+                raise ValueError(f"Unknown metric {metric}, expected one of {METRICS}")
+            if len(self.series) >= self.max_series:
+                raise ValueError(f"Sensor store is full ({self.max_series} series)")
+            self._index(sensor_id, field_id, metric, len(self.series))
+            self.field_rows = {}
+        return self.series[key][0]
+
+    def append(self, rows, times, values):
+        """ Append a batch of readings given as arrays of series row, epoch seconds and value """
+        rows = np.asarray(rows, dtype=np.int64)
+        times = np.asarray(times, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float32)
+        start = time.perf_counter()
+        with self.lock:
+            # Position of each reading within its series' batch, stable so arrival order is kept
+            order = np.argsort(rows, kind="stable")
+            rows_sorted = rows[order]
+            unique, first, counts = np.unique(rows_sorted, return_index=True, return_counts=True)
+            rank = np.arange(len(rows_sorted)) - np.repeat(first, counts)
+            positions = (self.head[rows_sorted] + rank) % self.capacity
+            self.times[rows_sorted, positions] = times[order]
+            self.values[rows_sorted, positions] = values[order]
+            self.head[unique] = (self.head[unique] + counts) % self.capacity
+            self.length[unique] = np.minimum(self.length[unique] + counts, self.capacity)
+
+            self.hourly.add(rows, times, values)
+            self.daily.add(rows, times, values)
+            self.appends[0] += 1
+            self.stats["readings"] += len(rows)
+            self.stats["batches"] += 1
+            self.stats["ingest_seconds"] += time.perf_counter() - start
+
+    def ingest(self, sensor_ids, field_ids, metrics, times, values):
+        """
+        Append readings given as columns. Ids are mapped to series rows once per distinct sensor and metric,
+        not once per reading.
+        """
+        keys = np.char.add(np.char.add(np.asarray(sensor_ids, dtype=str), "\x1f"), np.asarray(metrics, dtype=str))
+        unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        field_ids = np.asarray(field_ids, dtype=str)
+        lookup = np.array([self.register(str(key).split("\x1f")[0], str(field_ids[i]), str(key).split("\x1f")[1])
+                           for key, i in zip(unique, first)], dtype=np.int64)
+        self.append(lookup[inverse], times, values)
+
+    def ingest_csv(self, path, chunk_rows=100000):
+        """ Ingest a CSV with sensor_id, field_id, metric, timestamp (epoch seconds), value columns """
+        with open(path, newline="") as f:
+            reader = csv.DictReader(f)
+            while True:
+                chunk = [row for _, row in zip(range(chunk_rows), reader)]
+                if not chunk:
+                    break
+                self.ingest([r["sensor_id"] for r in chunk], [r["field_id"] for r in chunk],
+                            [r["metric"] for r in chunk], [int(float(r["timestamp"])) for r in chunk],
+                            [float(r["value"]) for r in chunk])
+        self.flush()
+
+    def rows(self, field_id, metric):
+        self._refresh()
+        key = (field_id, metric)
+        if key not in self.field_rows:
+            self.field_rows[key] = np.asarray(self.fields.get(field_id, {}).get(metric, []), dtype=np.int64)
+        return self.field_rows[key]
+
+    def latest(self, field_id, metric):
+        """ Mean of the field's sensors' latest readings and the time of the newest, None without data """
+        rows = self.rows(field_id, metric)
+        rows = rows[self.length[rows] > 0]
+        if not len(rows):
+            return None
+        last = (self.head[rows] - 1) % self.capacity
+        return float(self.values[rows, last].mean()), int(self.times[rows, last].max())
+
+    def trend(self, field_id, metric, days=7):
+        """
+        Latest value and the daily means, range and least squares slope (per day) over the last `days` days
+        of a field, None without data. Results are kept until the next append by any process.
+        """
+        appends = int(self.appends[0])
+        if appends != self.trends_version:
+            self.trends = {}
+            self.trends_version = appends
+        key = (field_id, metric, days)
+        if key in self.trends:
+            return self.trends[key]
+        latest = self.latest(field_id, metric)
+        if latest is None:
+            return None
+        value, at = latest
+        count, total, low, high = self.daily.window(self.rows(field_id, metric), at // DAY, days)
+        measured = count > 0
+        means = np.divide(total, count, out=np.full(days, np.nan), where=measured)
+        x, y = np.flatnonzero(measured).astype(np.float64), means[measured]
+        slope = float(((x - x.mean()) * (y - y.mean())).sum() / ((x - x.mean()) ** 2).sum()) if len(x) > 1 else 0.0
+        self.trends[key] = {"latest": value, "time": at, "daily_mean": [round(float(m), 3) for m in means],
+                            "min": float(low[measured].min()), "max": float(high[measured].max()),
+                            "slope_per_day": slope}
+        return self.trends[key]
+
+    def summary(self, field_id, days=7):
+        """ Latest values and trends of a field as prompt text, None without data """
+        lines = []
+        for metric in METRICS:
+            trend = self.trend(field_id, metric, days)
+            if trend:
+                lines.append(f"{metric}: latest {trend['latest']:.2f}, {days} day range {trend['min']:.2f}-"
+                             f"{trend['max']:.2f}, trend {trend['slope_per_day']:+.2f} per day")
+        return "; ".join(lines) or None
+
+    def report(self):
+        seconds = self.stats["ingest_seconds"]
+        return {**self.stats, "series": len(self.series), "fields": len(self.fields),
+                "readings_per_second": round(self.stats["readings"] / seconds) if seconds else 0}
+
+    def flush(self):
+        with self.lock:
+            for column in self.mapped:
+                column.flush()
+            series = [[sensor_id, field_id, metric, row] for (sensor_id, metric), (row, field_id) in self.series.items()]
+            # Replaced atomically, readers in other processes reload it when it changes
+            temporary = f"{self.index_path}.tmp"
+            with open(temporary, "w") as f:
+                json.dump({"series": sorted(series, key=lambda s: s[3])}, f)
+            os.replace(temporary, self.index_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest soil sensor readings and show a field's trends")
+    parser.add_argument("directory", help="Store directory")
+    parser.add_argument("--ingest", help="CSV of sensor_id, field_id, metric, timestamp, value")
+    parser.add_argument("--field", help="Field to summarize")
+    args = parser.parse_args()
+    store = SensorStore(args.directory)
+    if args.ingest:
+        store.ingest_csv(args.ingest)
+        pprint.pprint(store.report())
+    if args.field:
+        print(store.summary(args.field))
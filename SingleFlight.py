@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller (the owner) runs the computation, callers
+    arriving while it runs wait for its result (or its exception) instead of running it again.
+
+    Used by the caches in front of slow calls (DiskCache, AssessmentCaches, ToolMemo). Sync and async
+    callers share the in-flight calls, async callers await them without blocking the event loop. Nothing is
+    kept once a call has finished: compute functions store their result themselves, and should check the
+    store first, since a call may finish between a caller's lookup and its call().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = {}
+
+    def _join(self, key):
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self.in_flight[key] = Future()
+        return future, owner
+
+    def _done(self, key):
+        with self.lock:
+            self.in_flight.pop(key, None)
+
+    def call(self, key, compute):
+        """ (value, shared): the result of compute(), shared is True when another caller computed it """
+        future, owner = self._join(key)
+        if not owner:
+            return future.result(), True
+        try:
+            value = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._done(key)
+        future.set_result(value)
+        return value, False
+
+    async def acall(self, key, acompute):
+        """ Async call, acompute is a coroutine function """
+        future, owner = self._join(key)
+        if not owner:
+            # Shielded: a waiter being cancelled must not cancel the owner's call
+            return await asyncio.shield(asyncio.wrap_future(future)), True
+        try:
+            value = await acompute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._done(key)
+        future.set_result(value)
+        return value, False
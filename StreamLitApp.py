@@ -1,19 +1,29 @@
-import geocoder
+import os
+
 import streamlit as st
-from keras.preprocessing import image
 
-import PrecisionFarming
+from Engine import Engine
+import Telemetry
+
+Telemetry.configure_logging()
+
+# Shown until the user picks a location, also used when the default place cannot be geocoded
+DEFAULT_LOCATION, DEFAULT_LAT_LONG = "Concord, NC", (35.41, -80.58)
+
+# One engine per server process, shared by all sessions. The first run starts its warmup in the background.
+engine = Engine.get()
 
 
 def update_city(lat, long):
     """Update the city and state based on latitude and longitude."""
-    arc = geocoder.arcgis([lat, long], method="reverse")
-    st.session_state.loc = f"{arc.city}, {arc.state}"
+    st.session_state.loc = engine.geocoder.reverse(lat, long)
 
 
 def update_lat_long(location):
     """Update the latitude and longitude based on the location."""
-    st.session_state.lat, st.session_state.long = geocoder.arcgis(location).latlng
+    latlng = engine.geocoder.forward(location)
+    if latlng:
+        st.session_state.lat, st.session_state.long = latlng
 
 
 # Set up the page configuration
@@ -26,18 +36,12 @@ st.set_page_config(
 
 st.title("Precision Farming")
 
-if "pf" not in st.session_state:
-    pf = PrecisionFarming.PrecisionFarming()
-    st.session_state["pf"] = pf
-else:
-    pf = st.session_state["pf"]
-
 # Setting up layout
 col1, col2 = st.columns([0.2, 0.8])
 
 if "loc" not in st.session_state:
-    st.session_state.loc = "Concord, NC"
-    st.session_state.lat, st.session_state.long = geocoder.arcgis(st.session_state.loc).latlng
+    st.session_state.loc = DEFAULT_LOCATION
+    st.session_state.lat, st.session_state.long = engine.geocoder.forward(DEFAULT_LOCATION) or DEFAULT_LAT_LONG
 
 with col1:
     loc = st.text_input("Location", key="loc", on_change=lambda: update_lat_long(st.session_state.loc))
@@ -51,6 +55,8 @@ with col1:
         moisture = st.number_input("Soil Moisture", value=30, step=1)
         area = st.number_input("Area (acres)", value=10, step=1)
         crop = st.selectbox("What crop do you want to get information for?", ("Corn", "Soybean", "Cotton"))
+        # With sensor telemetry the field's latest readings replace the pH and moisture above
+        field_id = st.text_input("Field ID (sensor readings)") if os.getenv("SENSOR_STORE_DIR") else ""
 
         latitude = st.session_state.lat
         longitude = st.session_state.long
@@ -61,10 +67,21 @@ with col1:
         submitted = st.form_submit_button("Get Insights")
 
 with col2:
+    status = engine.status()
+    if status["error"]:
+        st.error(f"The assessment engine failed to start: {status['error']}")
+    elif not status["ready"]:
+        st.info(f"Loading models and services ({status['stage']}, {status['seconds']:.0f}s)... "
+                "you can fill out the form meanwhile.")
+
     if submitted and insect and leaf:
+        with st.spinner("Waiting for the models to load..."):
+            pf = engine.wait()
+        from keras.preprocessing import image
         insect_img = image.load_img(insect, target_size=(224, 224))
         leaf_img = image.load_img(leaf, target_size=(224, 224))
-        insights = pf.get_insights(ph, moisture, latitude, longitude, area, crop, insect_img, leaf_img)
+        insights = pf.get_insights(ph, moisture, latitude, longitude, area, crop, insect_img, leaf_img,
+                                   field_id=field_id or None)
         st.markdown(insights)
     else:
         st.markdown("Please fill out the form to get insights.")
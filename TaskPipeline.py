@@ -0,0 +1,139 @@
+import asyncio
+import contextvars
+import inspect
+import threading
+import time
+from concurrent.futures import Future
+
+
+class StageTimings:
+    """ Start and end of each stage relative to the pipeline start, and the critical path through them """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.times = {}
+        self.after = {}
+
+    def mark(self, name, event):
+        self.times.setdefault(name, {})[event] = (time.perf_counter() - self.started) * 1000
+
+    def critical_path(self, final):
+        """ Stages that determined when `final` finished: each step back is the dependency that finished last """
+        path = [final]
+        while self.after.get(path[0]):
+            path.insert(0, max(self.after[path[0]], key=lambda d: self.times.get(d, {}).get("end", 0.0)))
+        return path
+
+    def report(self, final=None):
+        stages = {name: {"start_ms": round(t.get("start", 0.0), 1), "end_ms": round(t.get("end", 0.0), 1),
+                         "run_ms": round(t.get("end", 0.0) - t.get("start", 0.0), 1)}
+                  for name, t in self.times.items()}
+        report = {"stages": stages}
+        if final is not None:
+            report["critical_path"] = self.critical_path(final)
+            report["total_ms"] = stages.get(final, {}).get("end_ms", 0.0)
+        return report
+
+
+class TaskPipeline(StageTimings):
+    """
+    Named stages with dependencies for one request, run on an executor as soon as their inputs are ready.
+
+    add(name, fn, after) runs fn with the results of the `after` stages as arguments. Nothing blocks while a
+    stage waits for its inputs, it is only submitted once they are done. A failed stage fails the stages that
+    depend on it.
+    """
+
+    def __init__(self, executor):
+        super().__init__()
+        self.executor = executor
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, fn, after=()):
+        future = Future()
+        deps = [self.tasks[d] for d in after]
+        self.tasks[name] = future
+        self.after[name] = tuple(after)
+        remaining = [len(deps)]
+        # The stage runs in the context of the caller that added it (request telemetry and the like)
+        context = contextvars.copy_context()
+
+        def inputs_done(_):
+            with self.lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                self.executor.submit(context.run, self._run, name, fn, deps, future)
+
+        if not deps:
+            self.executor.submit(context.run, self._run, name, fn, deps, future)
+        for dep in deps:
+            dep.add_done_callback(inputs_done)
+        return future
+
+    def _run(self, name, fn, deps, future):
+        failed = next((d.exception() for d in deps if d.exception() is not None), None)
+        if failed is not None:
+            future.set_exception(failed)
+            return
+        self.mark(name, "start")
+        try:
+            value = fn(*[d.result() for d in deps])
+        except Exception as e:
+            self.mark(name, "end")
+            future.set_exception(e)
+            return
+        self.mark(name, "end")
+        future.set_result(value)
+
+    def result(self, name, timeout=None):
+        return self.tasks[name].result(timeout)
+
+
+class AsyncTaskPipeline(StageTimings):
+    """
+    TaskPipeline for the event loop, stages are coroutine functions or plain functions.
+
+    A stage fails as soon as any of its inputs fails, and once result() returns or raises the stages still
+    pending are cancelled, so a failed request doesn't leave sibling stages running.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.tasks = {}
+
+    def add(self, name, fn, after=()):
+        deps = [self.tasks[d] for d in after]
+        self.after[name] = tuple(after)
+
+        async def run():
+            if deps:
+                await asyncio.wait(deps, return_when=asyncio.FIRST_EXCEPTION)
+            for dep in deps:
+                if dep.done() and (dep.cancelled() or dep.exception() is not None):
+                    dep.result()  # raises the failure of the input
+            inputs = [dep.result() for dep in deps]
+            self.mark(name, "start")
+            try:
+                value = fn(*inputs)
+                if inspect.isawaitable(value):
+                    value = await value
+                return value
+            finally:
+                self.mark(name, "end")
+
+        self.tasks[name] = asyncio.ensure_future(run())
+        return self.tasks[name]
+
+    async def result(self, name):
+        try:
+            return await self.tasks[name]
+        finally:
+            self.cancel()
+
+    def cancel(self):
+        """ Cancel the stages that have not finished """
+        for task in self.tasks.values():
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,320 @@
+import contextvars
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def configure_logging(level=None):
+    """ Leveled logging for the entry points, LOG_LEVEL=DEBUG shows the retrieval details """
+    logging.basicConfig(level=(level or os.getenv("LOG_LEVEL", "INFO")).upper(),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _render(name, labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return name
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return name + "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Metrics:
+    """
+    Process-wide counters, gauges and histograms with labels, rendered in the Prometheus text format.
+    Histograms use the latency buckets unless observe() is given others (e.g. for batch sizes).
+    """
+
+    def __init__(self, prefix="precisionfarming", buckets=LATENCY_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.histogram_buckets = {}
+        self.server = None
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, _labels(labels))] = value
+
+    def observe(self, name, seconds, buckets=None, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            counts = self.histograms.get(key)
+            if counts is None:
+                buckets = self.histogram_buckets.setdefault(name, buckets or self.buckets)
+                counts = self.histograms[key] = [0] * len(buckets) + [0, 0.0]  # buckets, count, sum
+            for i, bound in enumerate(self.histogram_buckets[name]):
+                if seconds <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += seconds
+
+    def prometheus_text(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted((key, list(counts)) for key, counts in self.histograms.items())
+            histogram_buckets = dict(self.histogram_buckets)
+        lines, typed = [], set()
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            for (name, labels), value in values:
+                name = f"{self.prefix}_{name}"
+                if name not in typed:
+                    lines.append(f"# TYPE {name} {kind}")
+                    typed.add(name)
+                lines.append(f"{_render(name, labels)} {value}")
+        for (name, labels), counts in histograms:
+            buckets = histogram_buckets[name]
+            name = f"{self.prefix}_{name}"
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, count in zip(buckets, counts):
+                lines.append(f"{_render(name + '_bucket', labels, [('le', str(bound))])} {count}")
+            lines.append(f"{_render(name + '_bucket', labels, [('le', '+Inf')])} {counts[-2]}")
+            lines.append(f"{_render(name + '_count', labels)} {counts[-2]}")
+            lines.append(f"{_render(name + '_sum', labels)} {round(counts[-1], 6)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """ Write the metrics for the node exporter textfile collector (or any scraper of files) """
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(temporary, path)
+
+    def serve(self, port, host="0.0.0.0"):
+        """ Serve GET /metrics from a background thread """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True).start()
+        log.info("Serving metrics on http://%s:%s/metrics", host, self.server.server_address[1])
+        return self.server
+
+
+metrics = Metrics()
+_current = contextvars.ContextVar("request_telemetry", default=None)
+_exporters = {"started": False, "file": None}
+# Called with the report of every finished request, e.g. by the benchmarks to aggregate them
+listeners = []
+_exporters_lock = threading.Lock()
+
+
+class RequestTelemetry:
+    """
+    What one request spent: wall time per graph node, tool and classifier, LLM calls and tokens, external
+    calls, cache lookups and graph loop iterations. Filled in by whatever runs in the request's context.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.spans = {}
+        self.llm = {"calls": 0, "input_tokens": 0, "output_tokens": 0}
+        self.external_calls = {}
+        self.cache = {}
+        self.iterations = {}
+        self.extra = {}
+
+    def add_span(self, key, seconds):
+        with self.lock:
+            span = self.spans.setdefault(key, {"calls": 0, "seconds": 0.0})
+            span["calls"] += 1
+            span["seconds"] += seconds
+
+    def add(self, group, key, amount=1):
+        with self.lock:
+            group[key] = group.get(key, 0) + amount
+
+    def annotate(self, **values):
+        """ Extra fields for the request's log record, e.g. the pipeline stage report """
+        self.extra.update(values)
+
+    def report(self):
+        with self.lock:
+            return {"request": self.name, "seconds": round(time.perf_counter() - self.started, 3),
+                    "spans": {k: {"calls": v["calls"], "seconds": round(v["seconds"], 3)}
+                              for k, v in sorted(self.spans.items())},
+                    "llm": dict(self.llm), "external_calls": dict(self.external_calls),
+                    "cache": {k: dict(v) for k, v in self.cache.items()}, "iterations": dict(self.iterations),
+                    **self.extra}
+
+
+def current():
+    """ Telemetry of the request running in this context, None outside a request """
+    return _current.get()
+
+
+def start_exporters():
+    """ METRICS_PORT serves /metrics, METRICS_FILE is rewritten after every request. Safe to call repeatedly """
+    with _exporters_lock:
+        if _exporters["started"]:
+            return
+        _exporters["started"] = True
+        _exporters["file"] = os.getenv("METRICS_FILE")
+        if os.getenv("METRICS_PORT"):
+            metrics.serve(int(os.getenv("METRICS_PORT")))
+
+
+@contextmanager
+def request(name):
+    """ Collect the telemetry of everything run in this context (and the threads it hands work to) """
+    telemetry = RequestTelemetry(name)
+    token = _current.set(telemetry)
+    outcome = "ok"
+    try:
+        yield telemetry
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        _current.reset(token)
+        report = telemetry.report()
+        metrics.inc("requests_total", request=name, outcome=outcome)
+        metrics.observe("request_seconds", report["seconds"], request=name)
+        log.info(json.dumps({"event": "request", "outcome": outcome, **report}, default=str))
+        for listener in list(listeners):
+            listener({"outcome": outcome, **report})
+        if _exporters["file"]:
+            try:
+                metrics.write(_exporters["file"])
+            except OSError as e:
+                log.warning("Could not write metrics to %s: %s", _exporters["file"], e)
+
+
+@contextmanager
+def span(kind, **labels):
+    """ Time a node, tool or classifier call into the process metrics and the current request """
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe(f"{kind}_seconds", seconds, **labels)
+        metrics.inc(f"{kind}_calls_total", outcome=outcome, **labels)
+        telemetry = current()
+        if telemetry is not None:
+            telemetry.add_span(f"{kind}:" + "/".join(str(v) for v in labels.values()), seconds)
+
+
+def node(graph, name, fn, loop=False):
+    """
+    Wrap a LangGraph node function (sync or async) in a span. loop=True marks the node every pass of the
+    graph's loop goes through, its calls are counted as iterations.
+    """
+    def enter():
+        if loop:
+            metrics.inc("loop_iterations_total", graph=graph)
+            telemetry = current()
+            if telemetry is not None:
+                telemetry.add(telemetry.iterations, graph)
+
+    if inspect.iscoroutinefunction(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            enter()
+            with span("node", graph=graph, node=name):
+                return await fn(*args, **kwargs)
+    else:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            enter()
+            with span("node", graph=graph, node=name):
+                return fn(*args, **kwargs)
+    return wrapper
+
+
+def external_call(service):
+    """ Count a call leaving the process (weather API, web search, vector store, remote checker) """
+    metrics.inc("external_calls_total", service=service)
+    telemetry = current()
+    if telemetry is not None:
+        telemetry.add(telemetry.external_calls, service)
+
+
+def cache_lookup(cache, hit):
+    metrics.inc("cache_lookups_total", cache=cache, result="hit" if hit else "miss")
+    telemetry = current()
+    if telemetry is not None:
+        with telemetry.lock:
+            counts = telemetry.cache.setdefault(cache, {"hits": 0, "misses": 0})
+            counts["hits" if hit else "misses"] += 1
+
+
+def submit(executor, fn, *args):
+    """ executor.submit that runs fn in a copy of the caller's context, so its telemetry goes to the request """
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+class TokenUsage(BaseCallbackHandler):
+    """ LangChain callback counting LLM calls and tokens, attach it to the chat models with callbacks=[...] """
+
+    run_inline = True
+
+    def on_llm_end(self, response, **kwargs):
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+        llm_output = response.llm_output or {}
+        if not input_tokens and not output_tokens:
+            usage = llm_output.get("token_usage") or {}
+            input_tokens, output_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        model = llm_output.get("model_name", "unknown")
+        metrics.inc("llm_calls_total", model=model)
+        metrics.inc("llm_tokens_total", input_tokens, model=model, direction="input")
+        metrics.inc("llm_tokens_total", output_tokens, model=model, direction="output")
+        telemetry = current()
+        if telemetry is not None:
+            telemetry.add(telemetry.llm, "calls")
+            telemetry.add(telemetry.llm, "input_tokens", input_tokens)
+            telemetry.add(telemetry.llm, "output_tokens", output_tokens)
+
+
+token_usage = TokenUsage()
@@ -0,0 +1,99 @@
+import logging
+import threading
+
+from AssessmentCaches import normalize
+from SingleFlight import SingleFlight
+import Telemetry
+
+log = logging.getLogger(__name__)
+
+
+class ToolMemo:
+    """
+    Memoization of tool calls within one assessment (or session).
+
+    The agent often repeats a tool call with the same or trivially different arguments (case, whitespace,
+    float noise). Calls are keyed on tool name and normalized arguments; a repeat returns the earlier result
+    without running the tool, and a repeat issued while the first call is still running waits for it (sync
+    and async calls alike). Failed calls are not memoized.
+    """
+
+    def __init__(self, name="assessment"):
+        self.name = name
+        self.results = {}
+        self.in_flight = SingleFlight()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.saved = {}
+
+    @staticmethod
+    def key(tool_name, args):
+        return (tool_name,) + tuple(sorted((k, normalize(v)) for k, v in args.items()))
+
+    def _hit(self, tool_name):
+        self.saved[tool_name] = self.saved.get(tool_name, 0) + 1
+        Telemetry.cache_lookup("tool_memo", True)
+        log.debug("[%s] memoized %s call reused", self.name, tool_name)
+
+    def _lookup(self, tool_name, key):
+        """ (hit, value) of an earlier result, every call is counted """
+        with self.lock:
+            self.calls += 1
+            hit = key in self.results
+            if hit:
+                self._hit(tool_name)
+            return hit, self.results.get(key)
+
+    def _store(self, key, value):
+        with self.lock:
+            self.results[key] = value
+        return value
+
+    def _computed(self, tool_name, coalesced):
+        if coalesced:
+            with self.lock:
+                self._hit(tool_name)
+        else:
+            Telemetry.cache_lookup("tool_memo", False)
+
+    def call(self, tool_name, args, invoke):
+        key = self.key(tool_name, args)
+        hit, value = self._lookup(tool_name, key)
+        if hit:
+            return value
+
+        def compute_and_store():
+            with self.lock:
+                if key in self.results:  # finished between our lookup and taking ownership
+                    return self.results[key]
+            return self._store(key, invoke())
+
+        value, coalesced = self.in_flight.call(key, compute_and_store)
+        self._computed(tool_name, coalesced)
+        return value
+
+    async def acall(self, tool_name, args, ainvoke):
+        """ Async call, ainvoke is a coroutine function """
+        key = self.key(tool_name, args)
+        hit, value = self._lookup(tool_name, key)
+        if hit:
+            return value
+
+        async def compute_and_store():
+            with self.lock:
+                if key in self.results:
+                    return self.results[key]
+            return self._store(key, await ainvoke())
+
+        value, coalesced = await self.in_flight.acall(key, compute_and_store)
+        self._computed(tool_name, coalesced)
+        return value
+
+    def seed(self, tool_name, args, value):
+        """ Record a result obtained outside the agent, so the agent's own call for it is a hit """
+        with self.lock:
+            self.results[self.key(tool_name, args)] = value
+
+    def report(self):
+        saved = sum(self.saved.values())
+        return {"tool_calls": self.calls, "saved": saved, "executed": self.calls - saved, "saved_by_tool": dict(self.saved)}
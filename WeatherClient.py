@@ -0,0 +1,108 @@
+import asyncio
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from DiskCache import DiskCache
+import Telemetry
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(latitude, longitude, precision=5):
+    """ Geohash of a location, precision 5 is a ~5 km tile and 4 a ~20-40 km tile """
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    code, bits, bit, even = [], 0, 0, True
+    while len(code) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        if value >= middle:
+            bits = bits * 2 + 1
+            interval[0] = middle
+        else:
+            bits = bits * 2
+            interval[1] = middle
+        even = not even
+        bit += 1
+        if bit == 5:
+            code.append(BASE32[bits])
+            bits, bit = 0, 0
+    return "".join(code)
+
+
+def tile_center(code):
+    """ Latitude and longitude of the centre of a geohash tile """
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in code:
+        bits = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if bits >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+class WeatherClient:
+    """
+    weatherapi.com forecast client with a per-tile cache.
+
+    Locations are snapped to a geohash tile and the forecast of the tile centre is cached on disk with a TTL
+    (DiskCache, shared between processes), so farms a few kilometres apart share one upstream call.
+    Concurrent requests for a tile are coalesced, and upstream calls go through one pooled keep-alive
+    session with a timeout.
+    """
+
+    def __init__(self, base_url="http://api.weatherapi.com/v1", api_key=None, cache_path=".cache/weather.sqlite",
+                 ttl_seconds=1800, precision=5, days=7, timeout=10, pool_size=16):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.precision = precision
+        self.days = days
+        self.timeout = timeout
+        self.cache = DiskCache(cache_path, ttl_seconds=ttl_seconds, namespace=f"weather:{days}d")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = threading.Lock()
+        self.upstream_calls = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(base_url=os.getenv("WEATHER_API_URL", "http://api.weatherapi.com/v1"),
+                   api_key=os.getenv("WEATHER_API_KEY"),
+                   cache_path=os.getenv("WEATHER_CACHE_PATH", ".cache/weather.sqlite"),
+                   ttl_seconds=int(os.getenv("WEATHER_CACHE_TTL", "1800")),
+                   precision=int(os.getenv("WEATHER_GEOHASH_PRECISION", "5")),
+                   timeout=float(os.getenv("WEATHER_API_TIMEOUT", "10")))
+
+    def fetch(self, tile):
+        latitude, longitude = tile_center(tile)
+        with self.lock:
+            self.upstream_calls += 1
+        Telemetry.external_call("weather_api")
+        response = self.session.get(f"{self.base_url}/forecast.json", timeout=self.timeout,
+                                    params={"key": self.api_key, "q": f"{latitude:.4f},{longitude:.4f}",
+                                            "days": self.days})
+        # Errors (bad key, quota) raise instead of being cached for the whole TTL
+        response.raise_for_status()
+        return response.json()
+
+    def forecast(self, latitude, longitude):
+        """ Raw forecast.json payload for the tile of a location """
+        tile = geohash(float(latitude), float(longitude), self.precision)
+        return self.cache.get_or_compute(tile, lambda: self.fetch(tile))
+
+    async def aforecast(self, latitude, longitude):
+        """ Async forecast, runs in a thread so it shares the cache and coalescing with sync callers """
+        return await asyncio.to_thread(self.forecast, latitude, longitude)
+
+    def report(self):
+        return {**self.cache.stats, "hit_rate": round(self.cache.hit_rate(), 3), "upstream_calls": self.upstream_calls}
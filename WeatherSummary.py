@@ -0,0 +1,85 @@
+import time
+
+import numpy as np
+
+HOURLY_FIELDS = ("precip_in", "temp_f", "humidity", "wind_mph", "chance_of_rain")
+
+
+class WeatherSummary:
+    """
+    Compact daily projection of a weatherapi.com forecast.json response.
+
+    The raw response carries 24 hourly entries per day with dozens of fields each, and it ends up in the
+    agent's context on every turn. This keeps one row per day (rain, chance of rain, temperature range,
+    humidity, wind) computed from the hourly data with array operations. str() of the summary is the table
+    the agent sees.
+    """
+
+    def __init__(self, payload):
+        days = payload["forecast"]["forecastday"]
+        location = payload.get("location", {})
+        self.location = ", ".join(v for v in (location.get("name"), location.get("region")) if v)
+        self.current = payload.get("current", {})
+        self.dates = [d["date"] for d in days]
+        self.conditions = [d["day"]["condition"]["text"] for d in days]
+
+        if days and all(len(d.get("hour", [])) == 24 for d in days):
+            # days x 24 x fields, every statistic below is one reduction over the hour axis
+            hourly = np.array([[[h[f] for f in HOURLY_FIELDS] for h in d["hour"]] for d in days], dtype=np.float64)
+            precip, temp, humidity, wind, chance = np.moveaxis(hourly, 2, 0)
+            self.precip_in = precip.sum(axis=1)
+            self.temp_min, self.temp_max = temp.min(axis=1), temp.max(axis=1)
+            self.humidity = humidity.mean(axis=1)
+            self.wind_max = wind.max(axis=1)
+            self.chance_of_rain = chance.max(axis=1)
+            self.rain_hours = (precip > 0.01).sum(axis=1)
+        else:
+            daily = np.array([[d["day"][f] for f in ("totalprecip_in", "mintemp_f", "maxtemp_f", "avghumidity",
+                                                     "maxwind_mph", "daily_chance_of_rain")] for d in days],
+                             dtype=np.float64).reshape(len(days), 6)
+            (self.precip_in, self.temp_min, self.temp_max, self.humidity, self.wind_max,
+             self.chance_of_rain) = daily.T
+            self.rain_hours = np.full(len(days), -1)
+
+    def rainfall(self, days=3):
+        """ Total rain (inches) forecast over the first days of the forecast """
+        return float(self.precip_in[:days].sum())
+
+    def __str__(self):
+        title = f"{len(self.dates)} day forecast"
+        lines = [f"{title} for {self.location}" if self.location else title]
+        if self.current:
+            lines.append(f"Now: {self.current.get('condition', {}).get('text', '')}, {self.current.get('temp_f')} F, "
+                         f"humidity {self.current.get('humidity')}%, wind {self.current.get('wind_mph')} mph")
+        lines.append("date | condition | rain in | rain chance % | rain hours | temp F | humidity % | max wind mph")
+        for i, date in enumerate(self.dates):
+            rain_hours = "" if self.rain_hours[i] < 0 else int(self.rain_hours[i])
+            lines.append(f"{date} | {self.conditions[i]} | {self.precip_in[i]:.2f} | {self.chance_of_rain[i]:.0f} | "
+                         f"{rain_hours} | {self.temp_min[i]:.0f}-{self.temp_max[i]:.0f} | {self.humidity[i]:.0f} | "
+                         f"{self.wind_max[i]:.0f}")
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return str(self)
+
+
+def summarize(payload):
+    """ WeatherSummary of a forecast, or the payload itself when it is not one (e.g. an API error) """
+    try:
+        return WeatherSummary(payload)
+    except (KeyError, TypeError, ValueError):
+        return payload
+
+
+def measure(payload):
+    """ Context size of the raw forecast against its summary, and the time the summary takes """
+    from EmbeddingUploader import count_tokens
+
+    start = time.perf_counter()
+    summary = str(summarize(payload))
+    seconds = time.perf_counter() - start
+    raw = str(payload)
+    raw_tokens, summary_tokens = count_tokens([raw]), count_tokens([summary])
+    return {"raw_chars": len(raw), "summary_chars": len(summary), "raw_tokens": raw_tokens,
+            "summary_tokens": summary_tokens, "token_reduction": round(1 - summary_tokens / max(raw_tokens, 1), 3),
+            "summarize_ms": round(seconds * 1000, 3)}
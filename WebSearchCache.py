@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from DiskCache import DiskCache
+import Telemetry
+
+log = logging.getLogger(__name__)
+
+
+def normalize_query(query):
+    """ Normalize a web search query so near-identical sub-questions share a cache entry """
+    query = query.lower().strip()
+    query = re.sub(r"^\s*(\d+[.)]|[-*•])\s*", "", query)  # list numbering from the sub-question LLM
+    query = re.sub(r"[^\w\s]", " ", query)
+    return re.sub(r"\s+", " ", query).strip()
+
+
+class LocalSearchBackend:
+    """
+    Offline stand-in for TavilySearchResults, used for load testing the web search path.
+
+    Results come from a JSON file of {"query": [{"url": ..., "content": ...}]} when one is given, otherwise
+    a deterministic synthetic result is built from the query. latency_seconds simulates the remote call.
+    """
+
+    def __init__(self, results_path=None, latency_seconds=0.0):
+        self.latency_seconds = latency_seconds
+        self.results = {}
+        self.calls = 0
+        if results_path:
+            with open(results_path) as f:
+                self.results = {normalize_query(q): r for q, r in json.load(f).items()}
+
+    def invoke(self, input):
+        query = input["query"] if isinstance(input, dict) else input
+        self.calls += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        key = normalize_query(query)
+        if key in self.results:
+            return self.results[key]
+        digest = hashlib.sha1(key.encode()).hexdigest()[:8]
+        return [{"url": f"https://local.search/{digest}", "content": f"Local search result for: {query}"}]
+
+
+class WebSearchCache:
+    """
+    TTL cache in front of the web search backend keyed by normalized query.
+
+    Entries are persisted on disk and concurrent identical queries are coalesced into one request. Only
+    non-empty result lists are cached: Tavily reports failures as an error string, and neither those nor
+    empty answers should stick for the whole TTL.
+    """
+
+    def __init__(self, backend, cache_path=None, ttl_seconds=None, max_workers=4):
+        self.backend = backend
+        self.max_workers = max_workers
+        self.cache = DiskCache(
+            cache_path or os.getenv("WEB_SEARCH_CACHE_PATH", ".cache/web_search.sqlite"),
+            ttl_seconds=ttl_seconds or int(os.getenv("WEB_SEARCH_CACHE_TTL", "3600")),
+            namespace="web_search",
+        )
+
+    def search(self, query):
+        key = normalize_query(query)
+        if not key:
+            return []
+        results = self.cache.get_or_compute(key, lambda: self._search(query), cacheable=self.cacheable)
+        if not isinstance(results, list):
+            log.warning("Web search for %r failed: %s", query, results)
+            return []
+        return results
+
+    @staticmethod
+    def cacheable(results):
+        return isinstance(results, list) and len(results) > 0
+
+    def _search(self, query):
+        Telemetry.external_call("web_search")
+        return self.backend.invoke({"query": query})
+
+    def batch(self, queries):
+        """ Search several queries concurrently, results are returned in the order of the queries """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [Telemetry.submit(executor, self.search, q) for q in queries]
+            return [future.result() for future in futures]
+
+    async def abatch(self, queries):
+        """ Async batch. The cache is file backed, so lookups run in threads and still coalesce with sync callers """
+        return await asyncio.gather(*(asyncio.to_thread(self.search, q) for q in queries))
+
+    @classmethod
+    def from_env(cls):
+        """ Tavily by default, the local stand-in when WEB_SEARCH_BACKEND=local """
+        if os.getenv("WEB_SEARCH_BACKEND", "tavily") == "local":
+            backend = LocalSearchBackend(os.getenv("WEB_SEARCH_LOCAL_RESULTS"),
+                                         float(os.getenv("WEB_SEARCH_LOCAL_LATENCY", "0")))
+        else:
+            from langchain_community.tools.tavily_search import TavilySearchResults
+            backend = TavilySearchResults(k=3)
+        return cls(backend)
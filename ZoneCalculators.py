@@ -0,0 +1,70 @@
+import numpy as np
+
+# Gallons of water in one inch of water over one acre
+GALLONS_PER_ACRE_INCH = 27154
+
+
+def water_needed(field_moisture, desired_moisture, rainfall_expected, field_area):
+    """
+    Water (gallons) needed to bring each zone to the desired moisture level, after the expected rain.
+
+    Args are scalars or arrays that broadcast against each other: moisture in % (0-100), rainfall in inches,
+    area in acres. Negative values mean the zone will be wetter than desired.
+    """
+    field_moisture, desired_moisture, rainfall_expected, field_area = (
+        np.asarray(a, dtype=np.float64) for a in (field_moisture, desired_moisture, rainfall_expected, field_area))
+    return ((desired_moisture - field_moisture) / 100 - rainfall_expected) * field_area * GALLONS_PER_ACRE_INCH
+
+
+def lime_needed(current_ph, desired_ph, soil_area_acres):
+    """ Lime (tons) needed to raise the pH of each zone """
+    current_ph, desired_ph, soil_area_acres = (np.asarray(a, dtype=np.float64)
+                                               for a in (current_ph, desired_ph, soil_area_acres))
+    return (desired_ph - current_ph) * soil_area_acres * 4840 / 1000 * 40
+
+
+def aluminum_sulfate_needed(current_ph, desired_ph, soil_area_acres):
+    """ Aluminum sulfate (pounds) needed to lower the pH of each zone """
+    current_ph, desired_ph, soil_area_acres = (np.asarray(a, dtype=np.float64)
+                                               for a in (current_ph, desired_ph, soil_area_acres))
+    return (current_ph - desired_ph) * soil_area_acres * 43560 / 10 * 2
+
+
+def zone_plan(zones, desired_moisture, desired_ph, rainfall_expected=0.0):
+    """
+    Per-zone irrigation and pH amendment plan for a variable-rate prescription.
+
+    zones is a columnar table (dict of arrays, DataFrame, structured array) with "moisture", "ph" and "area"
+    columns and an optional "rainfall" column that overrides rainfall_expected. Targets and rainfall may be
+    scalars or per-zone arrays. Each zone gets water or nothing, and lime or aluminum sulfate depending on
+    which side of the target its pH is. Returns per-zone arrays and the field totals.
+    """
+    moisture = np.asarray(zones["moisture"], dtype=np.float64)
+    ph = np.asarray(zones["ph"], dtype=np.float64)
+    area = np.asarray(zones["area"], dtype=np.float64)
+    if "rainfall" in _columns(zones):
+        rainfall_expected = zones["rainfall"]
+
+    water = np.maximum(water_needed(moisture, desired_moisture, rainfall_expected, area), 0.0)
+    lime = np.maximum(lime_needed(ph, desired_ph, area), 0.0)
+    aluminum_sulfate = np.maximum(aluminum_sulfate_needed(ph, desired_ph, area), 0.0)
+    return {
+        "water_gallons": water,
+        "lime_tons": lime,
+        "aluminum_sulfate_lbs": aluminum_sulfate,
+        "totals": {
+            "zones": int(area.size),
+            "area_acres": float(area.sum()),
+            "water_gallons": float(water.sum()),
+            "lime_tons": float(lime.sum()),
+            "aluminum_sulfate_lbs": float(aluminum_sulfate.sum()),
+            "zones_irrigated": int(np.count_nonzero(water)),
+            "zones_limed": int(np.count_nonzero(lime)),
+            "zones_acidified": int(np.count_nonzero(aluminum_sulfate)),
+        },
+    }
+
+
+def _columns(zones):
+    names = getattr(getattr(zones, "dtype", None), "names", None)
+    return names if names is not None else zones.keys()
@@ -0,0 +1,52 @@
+"""
+Per-request setup overhead of the agent, before and after sharing the compiled graph.
+
+    python benchmarks/agent_setup.py [iterations]
+
+"before" rebuilds the StateGraph, compiles it and binds the tools on every request, as get_insights used
+to. "after" only builds the per-request input state for the shared agent. No LLM or tool is called.
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from langchain_core.messages import HumanMessage
+
+import PrecisionFarming
+
+
+def measure(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"mean_ms": round(statistics.mean(timings), 3), "p50_ms": round(statistics.median(timings), 3),
+            "max_ms": round(max(timings), 3)}
+
+
+def main(iterations=200):
+    pf = PrecisionFarming.PrecisionFarming()
+    prompt = pf.prompt.format(leaf="Healthy", insect="Ant", soil_ph=6.5, soil_moisture=30, latitude=35.41,
+                              longitude=-80.58, area_acres=10, crop="Corn")
+    question = [HumanMessage(content=[{"type": "text", "text": "Give me your precision farming assessment"}])]
+
+    def before():
+        agent = PrecisionFarming.Agent(pf.model, pf.tool_list, system=prompt)
+        agent.executor.shutdown(wait=False)
+        return {"messages": question}
+
+    def after():
+        return pf.agent, {"messages": question, "system": prompt}
+
+    results = {"before": measure(before, iterations), "after": measure(after, iterations)}
+    results["speedup"] = round(results["before"]["mean_ms"] / max(results["after"]["mean_ms"], 1e-6), 1)
+    return results
+
+
+if __name__ == "__main__":
+    print(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
@@ -0,0 +1,205 @@
+"""
+End-to-end assessment and retrieval benchmark on recorded service responses.
+
+    python benchmarks/end_to_end.py --record                      # once, online with the real API keys
+    python benchmarks/end_to_end.py --concurrency 1 4 8           # offline, replays the recording
+    python benchmarks/end_to_end.py --mode prefetch --latency 0 --output prefetch.json
+
+--record runs the scenarios of benchmarks/scenarios.json once against the real services and keeps every
+HTTP exchange (OpenAI, Azure AI Search, Upstage, Tavily, weatherapi.com, LangChain hub) in a cassette, see
+RecordReplay.py. Replays never touch the network; a replayed call sleeps as long as the recorded one took
+(--latency recorded, scaled by --latency-scale), a fixed number of milliseconds, or not at all, so the same
+run shows the cost of this code with realistic or removed service latency.
+
+For every concurrency level the weather and web search disk caches start empty, then
+PrecisionFarming.get_insights runs over the assessment scenarios and RetrievalGraph.invoke over the
+retrieval questions. Reported per level: throughput, request latency, the mean time per request spent in
+each graph node, tool, classifier and pipeline stage, the most common critical path, and LLM calls, tokens,
+external calls and cache hit rates per request (from Telemetry.py).
+"""
+import argparse
+import collections
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import RecordReplay
+import Telemetry
+
+# Non-secret settings the recorded requests depend on, kept next to the cassette and restored for replays
+SETTINGS = ["AZURE_SEARCH_ENDPOINT", "CROP_GUIDE_SNAPSHOT", "WEATHER_API_URL", "WEATHER_GEOHASH_PRECISION",
+            "WEB_SEARCH_BACKEND", "PRECISION_FARMING_MODE"]
+PLACEHOLDER_KEYS = ["OPENAI_API_KEY", "AZURE_SEARCH_ADMIN_KEY", "UPSTAGE_API_KEY", "TAVILY_API_KEY",
+                    "WEATHER_API_KEY"]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+def prepare(cassette_path, record, latency, latency_scale, cache_dir):
+    """ Install the cassette and the environment before anything builds a client """
+    settings_path = cassette_path + ".settings.json"
+    if record:
+        os.makedirs(os.path.dirname(os.path.abspath(cassette_path)), exist_ok=True)
+        with open(settings_path, "w") as f:
+            json.dump({name: os.getenv(name) for name in SETTINGS if os.getenv(name)}, f, indent=1)
+        cassette = RecordReplay.Cassette(cassette_path, "record")
+    else:
+        if os.path.exists(settings_path):
+            with open(settings_path) as f:
+                os.environ.update(json.load(f))
+        for name in PLACEHOLDER_KEYS:
+            os.environ.setdefault(name, "replay")
+        cassette = RecordReplay.Cassette(cassette_path, "replay", latency, latency_scale)
+    os.environ["WEATHER_CACHE_PATH"] = os.path.join(cache_dir, "weather.sqlite")
+    os.environ["WEB_SEARCH_CACHE_PATH"] = os.path.join(cache_dir, "web_search.sqlite")
+    return RecordReplay.install(cassette)
+
+
+def summarize(reports, wall_seconds, errors):
+    count = max(1, len(reports))
+    seconds = [r["seconds"] for r in reports]
+    spans = collections.defaultdict(lambda: [0, 0.0])
+    stages = collections.defaultdict(float)
+    paths = collections.Counter()
+    totals = collections.Counter()
+    cache = collections.defaultdict(lambda: [0, 0])
+    for report in reports:
+        for name, span in report["spans"].items():
+            spans[name][0] += span["calls"]
+            spans[name][1] += span["seconds"]
+        for name, stage in report.get("pipeline", {}).get("stages", {}).items():
+            stages[name] += stage["run_ms"]
+        if report.get("pipeline", {}).get("critical_path"):
+            paths[" > ".join(report["pipeline"]["critical_path"])] += 1
+        totals.update({f"llm_{k}": v for k, v in report["llm"].items()})
+        totals.update({f"external_{k}": v for k, v in report["external_calls"].items()})
+        totals.update({f"iterations_{k}": v for k, v in report["iterations"].items()})
+        for name, counts in report["cache"].items():
+            cache[name][0] += counts["hits"]
+            cache[name][1] += counts["misses"]
+    return {
+        "requests": len(reports), "failed": len(errors), "wall_seconds": round(wall_seconds, 2),
+        "requests_per_minute": round(len(reports) * 60 / wall_seconds, 2) if wall_seconds else 0.0,
+        "latency_s": {"p50": round(percentile(seconds, 0.5), 3), "p95": round(percentile(seconds, 0.95), 3),
+                      "max": round(max(seconds, default=0.0), 3)},
+        "per_request": {name: round(value / count, 2) for name, value in sorted(totals.items())},
+        "spans": {name: {"calls": round(calls / count, 2), "mean_s": round(total / count, 3)}
+                  for name, (calls, total) in sorted(spans.items(), key=lambda item: -item[1][1])},
+        "pipeline_ms": {name: round(total / count, 1) for name, total in stages.items()},
+        "critical_paths": dict(paths.most_common(3)),
+        "cache_hit_rate": {name: round(hits / max(1, hits + misses), 3) for name, (hits, misses) in cache.items()},
+        "errors": errors[:5],
+    }
+
+
+def run_level(work, items, concurrency):
+    """ Run work over items with a thread pool, collecting the Telemetry report of each request """
+    reports, errors = [], []
+    Telemetry.listeners.append(reports.append)
+
+    def run(item):
+        try:
+            work(item)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(run, items))
+    finally:
+        Telemetry.listeners.remove(reports.append)
+    return summarize(reports, time.perf_counter() - start, errors)
+
+
+def main(cassette_path, record=False, concurrency=(1, 4, 8), mode=None, latency="recorded", latency_scale=1.0,
+         only=None, scenarios_path=os.path.join(ROOT, "benchmarks", "scenarios.json")):
+    with open(scenarios_path) as f:
+        scenarios = json.load(f)
+    cache_dir = tempfile.mkdtemp(prefix="pf-benchmark-")
+    cassette = prepare(cassette_path, record, latency, latency_scale, cache_dir)
+    os.chdir(ROOT)  # the classifiers load models/ relative to the repository
+
+    started = time.perf_counter()
+    import AgentTools
+    import PrecisionFarming
+    from BulkAssessment import BulkAssessment
+    pf = PrecisionFarming.PrecisionFarming(mode=mode)
+    results = {"startup_seconds": round(time.perf_counter() - started, 2), "mode": pf.mode,
+               "latency": latency, "levels": {}}
+
+    images = {path: BulkAssessment.load_image(path) for scenario in scenarios["assessments"]
+              for path in (scenario["insect_image"], scenario["leaf_image"]) if path}
+
+    def assess(scenario):
+        pf.get_insights(soil_ph=scenario["soil_ph"], soil_moisture=scenario["soil_moisture"],
+                        latitude=scenario["latitude"], longitude=scenario["longitude"],
+                        area_acres=scenario["area_acres"], crop=scenario["crop"],
+                        insect=images.get(scenario["insect_image"]), leaf=images.get(scenario["leaf_image"]))
+
+    def retrieve(item):
+        with Telemetry.request("retrieval"):
+            AgentTools.retrieval_graph.invoke(item["question"], item["crop"])
+
+    for level in ([1] if record else concurrency):
+        AgentTools.weather_client.cache.clear()
+        AgentTools.retrieval_graph.web_search_tool.cache.clear()
+        before = cassette.report()
+        level_results = {}
+        if only in (None, "assessments"):
+            level_results["assessments"] = run_level(assess, scenarios["assessments"], level)
+        if only in (None, "retrieval"):
+            level_results["retrieval"] = run_level(retrieve, scenarios["retrieval"], level)
+        after = cassette.report()
+        level_results["http"] = {k: after[k] - before[k] for k in ("recorded", "replayed", "missed", "ignored")}
+        results["levels"][level] = level_results
+    return results
+
+
+def print_results(results):
+    print(f"mode {results['mode']}, latency {results['latency']}, startup {results['startup_seconds']}s")
+    for level, level_results in results["levels"].items():
+        print(f"\n== concurrency {level}  http {level_results['http']}")
+        for name in ("assessments", "retrieval"):
+            if name not in level_results:
+                continue
+            summary = level_results[name]
+            print(f"{name}: {summary['requests']} ok, {summary['failed']} failed, "
+                  f"{summary['requests_per_minute']}/min, latency {summary['latency_s']}")
+            print(f"  per request {summary['per_request']}")
+            print(f"  cache hit rate {summary['cache_hit_rate']}")
+            if summary["pipeline_ms"]:
+                print(f"  pipeline ms {summary['pipeline_ms']}  critical {summary['critical_paths']}")
+            for span, values in list(summary["spans"].items())[:12]:
+                print(f"  {span:<40} {values['calls']:>6} calls {values['mean_s']:>8}s")
+            for error in summary["errors"]:
+                print(f"  error: {error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cassette", default=os.path.join(ROOT, "benchmarks", "cassettes", "end_to_end.jsonl"))
+    parser.add_argument("--record", action="store_true", help="Call the real services and record them")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--mode", choices=["agent", "prefetch"], default=None)
+    parser.add_argument("--latency", default="recorded", help="'recorded' or a fixed delay in ms per call")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier of recorded latencies")
+    parser.add_argument("--only", choices=["assessments", "retrieval"], default=None)
+    parser.add_argument("--output", help="Also write the results as JSON")
+    args = parser.parse_args()
+    Telemetry.configure_logging(os.getenv("LOG_LEVEL", "WARNING"))
+    results = main(args.cassette, args.record, args.concurrency, args.mode,
+                   args.latency if args.latency == "recorded" else float(args.latency), args.latency_scale, args.only)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
@@ -0,0 +1,83 @@
+"""
+Classifier throughput and latency under concurrent requests, batch-of-one calls against micro-batching.
+
+    python benchmarks/inference_batching.py [--model models/insect.mobilenetv3large.keras] [--users 32]
+
+Without --model a stand-in with a fixed per-call overhead plus a per-image cost is used, which is the cost
+shape of a CNN predict call on CPU.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from InferenceServer import InferenceServer
+
+
+class StandInModel:
+    """ predict_on_batch costs call_ms plus image_ms per image, one call at a time like a busy CPU """
+
+    def __init__(self, call_ms=15.0, image_ms=1.0, classes=12):
+        self.call_ms, self.image_ms, self.classes = call_ms, image_ms, classes
+        self.lock = threading.Lock()
+
+    def predict_on_batch(self, batch):
+        with self.lock:
+            time.sleep((self.call_ms + self.image_ms * len(batch)) / 1000)
+        return np.tile(np.eye(self.classes)[0], (len(batch), 1))
+
+
+def run(server, users, requests_per_user):
+    image = np.zeros((224, 224, 3), dtype=np.float32)
+    latencies = []
+    lock = threading.Lock()
+
+    def user(_):
+        for _ in range(requests_per_user):
+            start = time.perf_counter()
+            server.predict("insect", image)
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        list(executor.map(user, range(users)))
+    seconds = time.perf_counter() - start
+    ordered = sorted(latencies)
+    return {"images_per_second": round(len(latencies) / seconds, 1),
+            "p50_ms": round(statistics.median(ordered), 1), "p95_ms": round(ordered[int(len(ordered) * 0.95)], 1)}
+
+
+def main(model=None, users=32, requests_per_user=10, max_wait_ms=10, max_batch_size=32):
+    if model is None:
+        model = StandInModel()
+    results = {}
+    for batching in (False, True):
+        server = InferenceServer(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, batching=batching)
+        server.register("insect", model)
+        results["micro-batching" if batching else "batch of one"] = run(server, users, requests_per_user)
+        if batching:
+            results["batcher"] = server.report()["insect"]
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", help="Keras model file, a stand-in is used without it")
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=10, help="Requests per user")
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    args = parser.parse_args()
+    model = None
+    if args.model:
+        import keras
+        model = keras.models.load_model(args.model)
+    for name, result in main(model, args.users, args.requests, args.max_wait_ms).items():
+        print(name, result)
@@ -0,0 +1,39 @@
+"""
+Context size and latency of the weather summary against the raw forecast.
+
+    python benchmarks/weather_summary.py [forecast.json]
+
+Without a file the fake weather service's synthetic 7 day forecast is used.
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import WeatherSummary
+from FakeServices import fake_forecast
+
+
+def load(path=None):
+    if not path:
+        return fake_forecast(35.41, -80.58)
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(path=None, iterations=100):
+    payload = load(path)
+    result = WeatherSummary.measure(payload)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        str(WeatherSummary.summarize(payload))
+    result["mean_summarize_ms"] = round((time.perf_counter() - start) * 1000 / iterations, 3)
+    return result
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    print(main(path))
+    print(WeatherSummary.summarize(load(path)))
@@ -0,0 +1,40 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+PrecisionFarming = pytest.importorskip("PrecisionFarming")
+
+
+def agent(workers, tool_timeout, run_tool):
+    """ The parts of Agent that run_tools uses """
+    return SimpleNamespace(executor=ThreadPoolExecutor(max_workers=workers), tool_timeout=tool_timeout,
+                           tool_timeouts={}, run_tool=run_tool)
+
+
+def test_timeout_starts_when_the_call_starts_running():
+    # One thread, three 0.3 s calls with a 0.5 s timeout: the last one waits 0.6 s in the queue but runs in time
+    def run_tool(t, caches, memo):
+        time.sleep(0.3)
+        return t['name']
+
+    calls = [{"name": f"tool-{i}", "args": {}} for i in range(3)]
+    results = PrecisionFarming.Agent.run_tools(agent(1, 0.5, run_tool), calls)
+    assert results == ["tool-0", "tool-1", "tool-2"]
+
+
+def test_slow_call_times_out_and_keeps_running():
+    finished = threading.Event()
+
+    def run_tool(t, caches, memo):
+        if t['name'] == "slow":
+            time.sleep(0.5)
+            finished.set()
+        return t['name']
+
+    calls = [{"name": "slow", "args": {}}, {"name": "fast", "args": {}}]
+    results = PrecisionFarming.Agent.run_tools(agent(2, 0.1, run_tool), calls)
+    assert results == ["Error: tool slow did not finish within 0.1 seconds", "fast"]
+    assert finished.wait(2)
@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from AssessmentCaches import AssessmentCaches
+
+
+def weather_call(caches, latitude, longitude, raw=None):
+    args = {"latitude": latitude, "longitude": longitude}
+    if raw is not None:
+        args["raw"] = raw
+    answer = "raw forecast" if raw else "summary"
+    return caches.call_tool("get_weather_data", args, lambda: f"{answer} for {latitude}, {longitude}")
+
+
+def test_raw_and_summary_weather_calls_do_not_share_entries():
+    caches = AssessmentCaches()
+    assert weather_call(caches, 35.41, -80.58, raw=True) == "raw forecast for 35.41, -80.58"
+    assert weather_call(caches, 35.42, -80.57) == "summary for 35.42, -80.57"
+    assert weather_call(caches, 35.43, -80.56, raw=False) == "summary for 35.42, -80.57"
+    assert weather_call(caches, 35.44, -80.59, raw=True) == "raw forecast for 35.41, -80.58"
+    assert caches.report()["weather"]["misses"] == 2
+
+
+def test_fields_in_one_region_share_the_forecast_under_concurrency():
+    caches = AssessmentCaches()
+    calls = [(35.41 + i / 1000, -80.58, i % 2 == 0) for i in range(40)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda c: weather_call(caches, *c), calls))
+    for (_, _, raw), result in zip(calls, results):
+        assert result.startswith("raw forecast" if raw else "summary")
+    assert caches.report()["weather"]["misses"] == 2
@@ -0,0 +1,46 @@
+import json
+
+from BulkAssessment import BulkAssessment, load_fields
+
+
+class RecordingInsights:
+    """ Stands in for PrecisionFarming, records the arguments of every assessment """
+
+    def __init__(self):
+        self.calls = []
+
+    def get_insights(self, soil_ph=6.5, soil_moisture=30, latitude=35.41, longitude=-80.58, area_acres=10,
+                     crop="Corn", insect=None, leaf=None, mode=None, caches=None, field_id=None):
+        self.calls.append({"field_id": field_id, "soil_ph": soil_ph, "area_acres": area_acres, "crop": crop})
+        return f"assessment of {field_id}"
+
+
+def test_missing_and_empty_columns_are_left_out(tmp_path):
+    path = tmp_path / "fields.csv"
+    path.write_text("field_id,latitude,longitude,crop,soil_ph,area_acres\n"
+                    "north,35.4,-80.6,Soybean,6.1,\n"
+                    "south,35.5,-80.7, ,,12.5\n")
+    north, south = load_fields(str(path))
+    assert north == {"field_id": "north", "latitude": 35.4, "longitude": -80.6, "crop": "Soybean", "soil_ph": 6.1}
+    assert south == {"field_id": "south", "latitude": 35.5, "longitude": -80.7, "area_acres": 12.5}
+
+
+def test_get_insights_defaults_apply_and_invalid_rows_fail(tmp_path):
+    fields = tmp_path / "fields.jsonl"
+    fields.write_text("\n".join(json.dumps(row) for row in [
+        {"field_id": "a", "soil_ph": 7.0},
+        {"field_id": "b", "area_acres": "lots"},
+        {"field_id": "c", "crop": "Cotton", "area_acres": 4},
+    ]) + "\n")
+    output = tmp_path / "results.jsonl"
+    pf = RecordingInsights()
+
+    report = BulkAssessment(pf=pf, concurrency=2).run(str(fields), str(output))
+
+    assert report["assessed"] == 2 and report["failed"] == 1
+    calls = {call["field_id"]: call for call in pf.calls}
+    assert calls["a"] == {"field_id": "a", "soil_ph": 7.0, "area_acres": 10, "crop": "Corn"}
+    assert calls["c"] == {"field_id": "c", "soil_ph": 6.5, "area_acres": 4.0, "crop": "Cotton"}
+    results = {r["field_id"]: r for r in map(json.loads, output.read_text().splitlines())}
+    assert results["b"]["error"] == "Invalid area_acres: 'lots'"
+    assert "b" not in calls
@@ -0,0 +1,38 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+CropGuideIngestion = pytest.importorskip("CropGuideIngestion")
+
+
+def test_parse_keeps_a_bounded_window_of_guides_in_flight(tmp_path, monkeypatch):
+    lock = threading.Lock()
+    running, submitted = [0, 0], []
+
+    def parse_guide(source, known_hash):
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return source, "hash", [], 0.01
+
+    class Executor(ThreadPoolExecutor):
+        def submit(self, fn, *args):
+            submitted.append(args[0])
+            in_flight = len(submitted) - len(parsed)
+            assert in_flight <= 2 * ingestion.workers
+            return super().submit(fn, *args)
+
+    monkeypatch.setattr(CropGuideIngestion, "parse_guide", parse_guide)
+    ingestion = CropGuideIngestion.CropGuideIngestion(None, str(tmp_path / "manifest.json"), workers=2)
+    guides = [f"guide-{i}.pdf" for i in range(20)]
+    parsed = []
+    with Executor(max_workers=2) as executor:
+        for source, _, _, _ in ingestion._parse(executor, guides):
+            parsed.append(source)
+    assert sorted(parsed) == sorted(guides)
+    assert running[1] <= 2
@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from DiskCache import DiskCache
+from WebSearchCache import LocalSearchBackend, WebSearchCache
+
+
+def test_concurrent_callers_share_one_compute(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"))
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {"value": 42}
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(cache.get_or_compute, "key", compute) for _ in range(8)]
+        time.sleep(0.2)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert results == [{"value": 42}] * 8
+    assert len(calls) == 1
+    assert cache.stats["computed"] == 1
+    assert cache.stats["misses"] + cache.stats["coalesced"] == 8
+    assert cache.get_or_compute("key", compute) == {"value": 42}
+    assert cache.stats["hits"] == 1
+
+
+def test_errors_reach_every_waiter_and_are_not_cached(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"))
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(cache.get_or_compute, "key", fail) for _ in range(4)]
+        time.sleep(0.2)
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result()
+    assert cache.get("key") is None
+    assert cache.get_or_compute("key", lambda: "ok") == "ok"
+
+
+def test_uncacheable_values_are_returned_but_not_stored(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"))
+    assert cache.get_or_compute("key", lambda: [], cacheable=bool) == []
+    assert cache.get("key") is None
+
+
+def test_web_search_does_not_cache_failures_or_empty_results(tmp_path):
+    class Flaky(LocalSearchBackend):
+        def __init__(self, answers):
+            super().__init__()
+            self.answers = answers
+
+        def invoke(self, input):
+            self.calls += 1
+            return self.answers.pop(0)
+
+    backend = Flaky(["HTTPError('429 Too Many Requests')", [], [{"url": "u", "content": "c"}]])
+    search = WebSearchCache(backend, cache_path=str(tmp_path / "web.sqlite"))
+    assert search.search("corn rust") == []
+    assert search.search("corn rust") == []
+    assert search.search("corn rust") == [{"url": "u", "content": "c"}]
+    assert search.search("Corn rust?") == [{"url": "u", "content": "c"}]
+    assert backend.calls == 3
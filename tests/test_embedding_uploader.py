@@ -0,0 +1,73 @@
+import time
+
+import openai
+import pytest
+import requests
+
+from EmbeddingUploader import EmbeddingUploader, azure_search_upload_fn, is_retryable
+from FakeServices import FakeServer
+
+
+def chunks(count):
+    return [(f"chunk-{i}", f"Apply potash before planting, section {i}.", {"page": i}) for i in range(count)]
+
+
+def openai_embed_fn(url):
+    # No client side retries, the uploader does the backing off
+    client = openai.OpenAI(api_key="test", base_url=f"{url}/v1", max_retries=0)
+    return lambda texts: [d.embedding for d in client.embeddings.create(input=texts, model="test").data]
+
+
+@pytest.fixture
+def fake():
+    with FakeServer(dimensions=8) as server:
+        yield server
+
+
+def test_rate_limited_requests_are_retried_honouring_retry_after_zero(fake):
+    fake.failure_rate = 0.3
+    # base_delay is long: the run only finishes quickly if Retry-After: 0 is used as the delay
+    uploader = EmbeddingUploader(openai_embed_fn(fake.url), azure_search_upload_fn(fake.url, "crop_guide", "key"),
+                                 batch_size=4, max_concurrency=3, max_retries=20, base_delay=30.0)
+    start = time.perf_counter()
+    stats = uploader.upload(chunks(40))
+    assert time.perf_counter() - start < 10
+    assert stats["chunks"] == 40 and stats["batches"] == 10
+    assert stats["retries"] == fake.stats["failed"] > 0
+    assert set(fake.indexes["crop_guide"]) == {f"chunk-{i}" for i in range(40)}
+
+
+def test_failed_run_resumes_from_the_checkpoint(fake, tmp_path):
+    checkpoint = str(tmp_path / "upload.checkpoint")
+    upload = azure_search_upload_fn(fake.url, "crop_guide", "key")
+    uploaded = []
+
+    def flaky_upload(ids, texts, vectors, metadatas):
+        if len(uploaded) == 3:
+            raise requests.HTTPError("400 Bad Request")  # not retryable, ends the run
+        uploaded.append(ids)
+        upload(ids, texts, vectors, metadatas)
+
+    first = EmbeddingUploader(openai_embed_fn(fake.url), flaky_upload, batch_size=4, max_concurrency=1,
+                              checkpoint_path=checkpoint)
+    with pytest.raises(requests.HTTPError):
+        first.upload(chunks(20))
+    assert len(fake.indexes["crop_guide"]) == 12
+
+    embedded = fake.stats["embedded"]
+    second = EmbeddingUploader(openai_embed_fn(fake.url), upload, batch_size=4, max_concurrency=2,
+                               checkpoint_path=checkpoint)
+    stats = second.upload(chunks(20))
+    assert stats["skipped"] == 12 and stats["chunks"] == 8
+    assert fake.stats["embedded"] - embedded == 8
+    assert len(fake.indexes["crop_guide"]) == 20
+
+
+def test_connection_errors_and_timeouts_are_retryable():
+    client = openai.OpenAI(api_key="test", base_url="http://127.0.0.1:9/v1", max_retries=0, timeout=2)
+    with pytest.raises(openai.APIConnectionError) as error:
+        client.embeddings.create(input=["x"], model="test")
+    assert is_retryable(error.value)
+    assert is_retryable(TimeoutError())
+    assert is_retryable(requests.ConnectionError())
+    assert not is_retryable(ValueError())
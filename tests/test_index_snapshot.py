@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from IndexSnapshot import IndexSnapshot, SnapshotBuilder, SnapshotVectorStore, write_snapshot
+
+
+def manifest(chunks):
+    # The parts of CropGuideIngestion.IngestionManifest the snapshot keeps
+    return SimpleNamespace(files={"Guides/corn.pdf": "f1"}, pages={page: "p" for page in chunks}, chunks=chunks)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "crop_guide.snap")
+    vectors = np.random.default_rng(0).random((3, 5), dtype=np.float32)
+    metadatas = [{"source": "Guides/corn.pdf", "page": i} for i in range(3)]
+    write_snapshot(path, ["a", "b", "c"], ["one", "two", "three"], metadatas, vectors, {"files": {}})
+
+    snapshot = IndexSnapshot(path)
+    assert len(snapshot) == 3 and snapshot.dimensions == 5
+    assert snapshot.ids == ["a", "b", "c"] and snapshot.texts == ["one", "two", "three"]
+    assert snapshot.metadatas == metadatas and snapshot.manifest == {"files": {}}
+    np.testing.assert_array_equal(snapshot.vectors, vectors)
+
+    store = SnapshotVectorStore(snapshot, embedding_function=lambda text: vectors[1])
+    document, score = store.similarity_search_with_score("two", k=1)[0]
+    assert document.page_content == "two" and abs(score - 1.0) < 1e-6
+    assert [d.page_content for d in store.similarity_search("x", k=3, filter={"page": 2})] == ["three"]
+
+
+def test_builder_carries_rows_over_and_applies_deletes(tmp_path):
+    path = str(tmp_path / "crop_guide.snap")
+    builder = SnapshotBuilder(path)
+    builder.add(["a", "b"], ["one", "two"], [[1.0, 0.0], [0.0, 1.0]], [{"page": 0}, {"page": 1}])
+    builder.write(manifest({"Guides/corn.pdf#0": ["a"], "Guides/corn.pdf#1": ["b"]}))
+
+    builder = SnapshotBuilder(path)
+    builder.delete(["a"])
+    builder.add(["c"], ["three"], [[1.0, 1.0]], [{"page": 0}])
+    builder.write(manifest({"Guides/corn.pdf#0": ["c"], "Guides/corn.pdf#1": ["b"]}))
+
+    snapshot = IndexSnapshot(path)
+    assert snapshot.ids == ["c", "b"] and snapshot.texts == ["three", "two"]
+    np.testing.assert_array_equal(snapshot.vectors, [[1.0, 1.0], [0.0, 1.0]])
+    assert snapshot.manifest["chunks"] == {"Guides/corn.pdf#0": ["c"], "Guides/corn.pdf#1": ["b"]}
+
+
+def test_empty_snapshot(tmp_path):
+    path = str(tmp_path / "crop_guide.snap")
+    SnapshotBuilder(path).write(manifest({}))
+    snapshot = IndexSnapshot(path)
+    assert len(snapshot) == 0 and snapshot.vectors.shape == (0, 0)
+    assert SnapshotVectorStore(snapshot, embedding_function=lambda text: [1.0]).similarity_search("x") == []
+
+    write_snapshot(path, [], [], [], [], {})
+    assert len(IndexSnapshot(path)) == 0
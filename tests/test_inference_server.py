@@ -0,0 +1,73 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import Telemetry
+from InferenceServer import InferenceServer, MicroBatcher
+
+
+class Model:
+    """ Sums each input, records the batch sizes it was called with """
+
+    def __init__(self, gate=None):
+        self.batches = []
+        self.gate = gate
+
+    def predict_on_batch(self, batch):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.batches.append(len(batch))
+        return batch.reshape(len(batch), -1).sum(axis=1, keepdims=True)
+
+
+def test_concurrent_requests_share_batches():
+    gate = threading.Event()
+    model = Model(gate)
+    server = InferenceServer(max_batch_size=8, max_wait_ms=50)
+    server.register("test-batching", model)
+    inputs = [np.full((2, 2), i, dtype=np.float32) for i in range(32)]
+
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        futures = [executor.submit(server.predict, "test-batching", x) for x in inputs]
+        gate.set()
+        outputs = [future.result(timeout=5) for future in futures]
+
+    assert [float(o[0]) for o in outputs] == [4.0 * i for i in range(32)]
+    assert sum(model.batches) == 32 and max(model.batches) <= 8
+    assert len(model.batches) < 32
+    report = server.report()["test-batching"]
+    assert report["requests"] == 32 and report["batches"] == len(model.batches)
+
+
+def test_lone_request_waits_at_most_max_wait():
+    batcher = MicroBatcher("test-lone", Model().predict_on_batch, max_batch_size=8, max_wait_ms=20)
+    assert float(batcher.predict(np.ones(3, dtype=np.float32))[0]) == 3.0
+    assert batcher.report()["wait_ms"]["max"] < 500
+
+
+def test_failures_reach_every_request_of_the_batch():
+    def fail(batch):
+        raise RuntimeError("model failed")
+
+    batcher = MicroBatcher("test-failure", fail, max_wait_ms=50)
+    futures = [batcher.submit(np.zeros(2)) for _ in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    assert batcher.report()["failed"] == 3
+
+
+def test_batching_is_exported_as_metrics():
+    batcher = MicroBatcher("test-metrics", Model().predict_on_batch, max_batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit(np.ones(2)) for _ in range(4)]
+    [future.result(timeout=5) for future in futures]
+
+    batches = batcher.report()["batches"]
+    text = Telemetry.metrics.prometheus_text()
+    assert '# TYPE precisionfarming_inference_queue_depth gauge' in text
+    assert f'precisionfarming_inference_batch_size_bucket{{model="test-metrics",le="4"}} {batches}' in text
+    assert 'precisionfarming_inference_batch_size_sum{model="test-metrics"} 4' in text
+    assert 'precisionfarming_inference_wait_seconds_count{model="test-metrics"} 4' in text
+    assert 'precisionfarming_inference_requests_total{model="test-metrics",outcome="ok"} 4' in text
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+
+from LocalGroundednessCheck import LocalGroundednessCheck
+
+CONTEXT = ("Corn needs about one inch of water per week during the growing season. "
+           "Apply nitrogen at planting and again when the plants are knee high.")
+
+
+class Remote:
+    def __init__(self, answer="grounded"):
+        self.answer = answer
+        self.calls = 0
+
+    def invoke(self, request_input):
+        self.calls += 1
+        return self.answer
+
+    async def ainvoke(self, request_input):
+        return self.invoke(request_input)
+
+
+def test_copied_answer_is_grounded_locally():
+    remote = Remote()
+    check = LocalGroundednessCheck(remote=remote, audit_rate=0.0)
+    answer = "Corn needs about one inch of water per week during the growing season."
+    assert check.score([CONTEXT], answer) == 1.0
+    assert check.invoke({"context": [CONTEXT], "answer": answer}) == "grounded"
+    assert remote.calls == 0
+
+
+def test_low_overlap_is_never_rejected_locally():
+    check = LocalGroundednessCheck(remote=Remote("grounded"), audit_rate=0.0)
+    paraphrase = "Give the crop roughly an inch of irrigation weekly while it grows."
+    assert check.score([CONTEXT], paraphrase) == 0.0
+    assert check.decide(0.0) is None
+    assert check.invoke({"context": [CONTEXT], "answer": paraphrase}) == "grounded"
+    assert check.remote.calls == 1
+    assert check.stats["deferred"] == 1
+
+
+def test_without_remote_uncertain_answers_are_not_sure():
+    check = LocalGroundednessCheck()
+    assert check.invoke({"context": [CONTEXT], "answer": "Something unrelated entirely."}) == "notSure"
+
+
+def test_audits_by_default_and_tracks_agreement():
+    remote = Remote("notGrounded")
+    check = LocalGroundednessCheck(remote=remote)
+    assert check.audit_rate > 0
+    check.audit_rate = 1.0
+    assert asyncio.run(check.ainvoke({"context": [CONTEXT], "answer": CONTEXT})) == "grounded"
+    agreement = check.agreement()
+    assert agreement["audited"] == 1 and agreement["disagreed"] == 1
+    assert agreement["agreement_rate"] == 0.0
+
+
+def test_stats_are_consistent_across_threads():
+    check = LocalGroundednessCheck(remote=Remote(), audit_rate=0.0)
+    request_input = {"context": [CONTEXT], "answer": CONTEXT}
+
+    def run():
+        for _ in range(200):
+            check.invoke(request_input)
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert check.stats["local_grounded"] == 1600
+
+
+def test_sync_and_async_paths_agree():
+    requests = [{"context": [CONTEXT], "answer": CONTEXT},
+                {"context": [CONTEXT], "answer": "Give the crop roughly an inch of irrigation weekly."}]
+    sync_check = LocalGroundednessCheck(remote=Remote("notGrounded"), audit_rate=1.0)
+    async_check = LocalGroundednessCheck(remote=Remote("notGrounded"), audit_rate=1.0)
+    sync_results = [sync_check.invoke(r) for r in requests]
+    async_results = [asyncio.run(async_check.ainvoke(r)) for r in requests]
+    assert sync_results == async_results == ["grounded", "notGrounded"]
+    assert sync_check.stats == async_check.stats
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("GROUNDEDNESS_GROUNDED_THRESHOLD", "0.9")
+    monkeypatch.setenv("GROUNDEDNESS_SENTENCE_THRESHOLD", "0.6")
+    monkeypatch.setenv("GROUNDEDNESS_NGRAM_SIZE", "2")
+    monkeypatch.setenv("GROUNDEDNESS_AUDIT_RATE", "0")
+    remote = Remote()
+    check = LocalGroundednessCheck.from_env(remote=remote)
+    assert check.remote is remote
+    assert (check.grounded_threshold, check.sentence_threshold, check.ngram_size, check.audit_rate) == (0.9, 0.6, 2, 0.0)
@@ -0,0 +1,50 @@
+from OfflineGeocoder import OfflineGeocoder
+
+
+class ArcGIS:
+    """ Stands in for the geocoder package, every lookup lands in Paris """
+    latlng = [48.85, 2.35]
+    city, state = "Paris", "Ile-de-France"
+
+    @staticmethod
+    def arcgis(location, method=None):
+        return ArcGIS()
+
+
+class FlakyOnline(OfflineGeocoder):
+    """ Online fallback that fails the first `failures` lookups, then answers """
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def _online(self, lookup):
+        self.stats["online"] += 1
+        if self.stats["online"] <= self.failures:
+            return False
+        return lookup(ArcGIS)
+
+
+def test_failed_forward_lookups_are_not_cached():
+    geocoder = FlakyOnline(failures=1)
+    assert geocoder.forward("Paris, France") is None
+    assert geocoder.forward("Paris, France") == (48.85, 2.35)
+    assert geocoder.forward("Paris, France") == (48.85, 2.35)
+    assert geocoder.stats["online"] == 2
+
+
+def test_reverse_fallback_after_a_failure_is_not_cached():
+    geocoder = FlakyOnline(failures=1)
+    assert geocoder.reverse(48.85, 2.35) != "Paris, Ile-de-France"  # nearest place of the US gazetteer
+    assert geocoder.reverse(48.85, 2.35) == "Paris, Ile-de-France"
+    assert geocoder.reverse(48.85, 2.35) == "Paris, Ile-de-France"
+    assert geocoder.stats["online"] == 2
+
+
+def test_gazetteer_answers_are_cached():
+    geocoder = OfflineGeocoder(online=False)
+    label = geocoder.reverse(35.41, -80.58)
+    assert geocoder.forward(label) is not None
+    geocoder.forward(label)
+    geocoder.reverse(35.41, -80.58)
+    assert geocoder.stats["hits"] == 2
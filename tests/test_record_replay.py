@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from FakeServices import FakeServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# One assessment-shaped scenario through the real clients: the weather client (requests), sub-question and
+# write-up LLM calls with ChatOpenAI (sync and async, openai's httpx transport), query embeddings, and the
+# cached web search. Services run on the fake server, which the cassette records like any remote host.
+SCENARIO = """
+import asyncio, json, sys
+import RecordReplay, Telemetry
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from WeatherClient import WeatherClient
+from WebSearchCache import LocalSearchBackend, WebSearchCache
+
+mode, cassette_path, url, cache_dir = sys.argv[1:5]
+RecordReplay.PASSTHROUGH_HOSTS.clear()
+cassette = RecordReplay.install(RecordReplay.Cassette(cassette_path, mode, latency=0))
+
+llm = ChatOpenAI(model="gpt-4o", api_key="test", base_url=url + "/v1", max_retries=0,
+                 callbacks=[Telemetry.token_usage])
+embeddings = OpenAIEmbeddings(api_key="test", base_url=url + "/v1", check_embedding_ctx_length=False,
+                              max_retries=0)
+weather = WeatherClient(base_url=url + "/v1", api_key="secret", cache_path=cache_dir + "/weather.sqlite")
+search = WebSearchCache(LocalSearchBackend(), cache_path=cache_dir + "/web.sqlite")
+
+with Telemetry.request("scenario") as telemetry:
+    forecast = weather.forecast(35.41, -80.58)
+    questions = [llm.invoke(f"Sub-questions on {topic} for corn").content for topic in ("rust", "irrigation")]
+    vectors = embeddings.embed_documents(questions)
+    results = search.batch(questions)
+    context = "\\n".join(r["content"] for rs in results for r in rs)
+    answer = asyncio.run(llm.ainvoke(f"Assess the field. Weather: {json.dumps(forecast)[:200]}. {context}"))
+    report = telemetry.report()
+
+print(json.dumps({"answer": answer.content, "questions": questions, "vector": vectors[0][:4],
+                  "llm_calls": report["llm"]["calls"], "http": cassette.report()}))
+"""
+
+
+def run(mode, cassette, url, cache_dir, hash_seed):
+    env = {**os.environ, "PYTHONHASHSEED": str(hash_seed)}
+    output = subprocess.run([sys.executable, "-c", SCENARIO, mode, cassette, url, str(cache_dir)], cwd=ROOT,
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_recorded_scenario_replays_offline_under_another_hash_seed(tmp_path):
+    cassette = str(tmp_path / "scenario.jsonl")
+    with FakeServer(dimensions=8) as fake:
+        url = fake.url
+        recorded = run("record", cassette, url, tmp_path / "record", hash_seed=1)
+    assert recorded["http"]["recorded"] == 5 and recorded["http"]["missed"] == 0
+    assert fake.stats["completions"] == 3 and fake.stats["forecasts"] == 1
+
+    # The fake server is gone: every answer has to come from the cassette
+    replayed = run("replay", cassette, url, tmp_path / "replay", hash_seed=2)
+    assert replayed["http"]["replayed"] == 5 and replayed["http"]["missed"] == 0
+    for key in ("answer", "questions", "vector", "llm_calls"):
+        assert replayed[key] == recorded[key]
+    assert "secret" not in open(cassette).read()
+
+
+def test_replay_miss_is_a_connection_error(tmp_path):
+    cassette = str(tmp_path / "scenario.jsonl")
+    open(cassette, "w").close()
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        subprocess.run([sys.executable, "-c", SCENARIO, "replay", cassette, "http://127.0.0.1:9", str(tmp_path)],
+                       cwd=ROOT, capture_output=True, text=True, check=True)
+    assert "ConnectionError" in error.value.stderr
+
+
+def test_unique_union_keeps_first_seen_order():
+    RetrievalGraph = pytest.importorskip("RetrievalGraph")
+    from langchain_core.documents import Document
+
+    documents = [[Document(page_content=text) for text in batch] for batch in (["b", "a", "c"], ["a", "d", "b"])]
+    union = RetrievalGraph.RetrievalGraph.get_unique_union(None, documents)
+    assert [d.page_content for d in union] == ["b", "a", "c", "d"]
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+from SensorStore import DAY, SensorStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NOW = 1_760_000_000
+
+
+def ingest_in_other_process(directory, sensor_ids, values, start):
+    """ Append readings the way the ingest CLI does, from a separate process """
+    script = textwrap.dedent(f"""
+        from SensorStore import SensorStore
+        store = SensorStore({directory!r}, max_series=16, capacity=64)
+        values = {values!r}
+        times = [{start} + i * 86400 for i in range(len(values))]
+        store.ingest({sensor_ids!r} * len(values), ["north"] * len(values), ["moisture"] * len(values), times,
+                     values)
+        store.flush()
+    """)
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True)
+
+
+def test_reader_sees_sensors_and_readings_from_another_process(tmp_path):
+    directory = str(tmp_path / "sensors")
+    reader = SensorStore(directory, max_series=16, capacity=64)
+    assert reader.summary("north") is None
+
+    ingest_in_other_process(directory, ["s1"], [40.0, 40.0, 40.0], NOW - 3 * DAY)
+    assert reader.latest("north", "moisture")[0] == 40.0
+    assert reader.summary("north") == "moisture: latest 40.00, 7 day range 40.00-40.00, trend +0.00 per day"
+
+    ingest_in_other_process(directory, ["s1"], [99.0], NOW)
+    assert reader.latest("north", "moisture") == (99.0, NOW)
+    assert reader.summary("north").startswith("moisture: latest 99.00, 7 day range 40.00-99.00")
+
+    ingest_in_other_process(directory, ["s2"], [50.0], NOW)
+    assert reader.latest("north", "moisture") == (74.5, NOW)
+
+
+def test_trends_are_cached_until_the_next_append(tmp_path):
+    store = SensorStore(str(tmp_path / "sensors"), max_series=16, capacity=64)
+    store.ingest(["s1", "s1"], ["north", "north"], ["ph", "ph"], [NOW - DAY, NOW], [6.0, 6.5])
+    trend = store.trend("north", "ph")
+    assert trend["latest"] == 6.5 and trend["slope_per_day"] == 0.5
+    assert store.trend("north", "ph") is trend
+    store.ingest(["s1"], ["north"], ["ph"], [NOW + DAY], [7.5])
+    assert store.trend("north", "ph")["latest"] == 7.5
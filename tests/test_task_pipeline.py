@@ -0,0 +1,67 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from TaskPipeline import AsyncTaskPipeline, TaskPipeline
+
+
+def test_independent_stages_run_concurrently():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        pipeline = TaskPipeline(executor)
+        pipeline.add("a", lambda: time.sleep(0.2) or 1)
+        pipeline.add("b", lambda: time.sleep(0.2) or 2)
+        pipeline.add("sum", lambda a, b: a + b, after=("a", "b"))
+        start = time.perf_counter()
+        assert pipeline.result("sum", timeout=5) == 3
+        assert time.perf_counter() - start < 0.35
+    assert pipeline.report("sum")["critical_path"][-1] == "sum"
+
+
+def test_failure_fails_dependent_stages():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pipeline = TaskPipeline(executor)
+        pipeline.add("a", lambda: 1 / 0)
+        pipeline.add("b", lambda a: a, after=("a",))
+        with pytest.raises(ZeroDivisionError):
+            pipeline.result("b", timeout=5)
+
+
+def test_async_failure_cancels_sibling_stages():
+    finished = []
+
+    async def slow():
+        await asyncio.sleep(5)
+        finished.append("slow")
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("classifier failed")
+
+    async def main():
+        pipeline = AsyncTaskPipeline()
+        pipeline.add("slow", slow)
+        pipeline.add("failing", failing)
+        pipeline.add("final", lambda slow, failing: None, after=("slow", "failing"))
+        start = time.perf_counter()
+        with pytest.raises(ValueError):
+            await pipeline.result("final")
+        elapsed = time.perf_counter() - start
+        await asyncio.sleep(0)
+        return elapsed, pipeline.tasks["slow"].cancelled()
+
+    elapsed, cancelled = asyncio.run(main())
+    assert elapsed < 1
+    assert cancelled and not finished
+
+
+def test_async_stages_mix_coroutines_and_functions():
+    async def main():
+        pipeline = AsyncTaskPipeline()
+        pipeline.add("a", lambda: 2)
+        pipeline.add("b", lambda: asyncio.sleep(0.01, result=3))
+        pipeline.add("product", lambda a, b: a * b, after=("a", "b"))
+        return await pipeline.result("product")
+
+    assert asyncio.run(main()) == 6
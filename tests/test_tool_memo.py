@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from AssessmentCaches import AssessmentCaches
+from SingleFlight import SingleFlight
+from ToolMemo import ToolMemo
+
+
+def test_concurrent_async_repeats_run_the_tool_once():
+    memo = ToolMemo()
+    calls = []
+
+    async def retrieval():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "Rotate crops and plant resistant hybrids"
+
+    async def main():
+        return await asyncio.gather(
+            memo.acall("get_crop_info", {"question": "Corn rust?"}, retrieval),
+            memo.acall("get_crop_info", {"question": "  corn RUST? "}, retrieval),
+            memo.acall("get_crop_info", {"question": "Soybean rust?"}, retrieval))
+
+    results = asyncio.run(main())
+    assert results[0] == results[1] == results[2] == "Rotate crops and plant resistant hybrids"
+    assert len(calls) == 2
+    assert memo.report() == {"tool_calls": 3, "saved": 1, "executed": 2, "saved_by_tool": {"get_crop_info": 1}}
+
+
+def test_failed_async_calls_fail_every_waiter_and_are_not_memoized():
+    memo = ToolMemo()
+
+    async def failing():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("vector store down")
+
+    async def main():
+        return await asyncio.gather(*(memo.acall("tackle_insect", {"insect": "aphids"}, failing) for _ in range(3)),
+                                    return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(main()))
+    assert asyncio.run(memo.acall("tackle_insect", {"insect": "aphids"}, lambda: asyncio.sleep(0, result="ok"))) == "ok"
+
+
+def test_async_calls_coalesce_with_a_running_sync_call():
+    caches = AssessmentCaches()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def sync_retrieval():
+        calls.append("sync")
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    async def async_retrieval():
+        calls.append("async")
+        return "other answer"
+
+    args = {"question": "corn rust"}
+    thread = threading.Thread(target=caches.call_tool, args=("get_crop_info", args, sync_retrieval))
+    thread.start()
+    started.wait(5)
+
+    async def main():
+        waiter = asyncio.ensure_future(caches.acall_tool("get_crop_info", args, async_retrieval))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()  # waiting without blocking the event loop
+        release.set()
+        return await waiter
+
+    assert asyncio.run(main()) == "answer"
+    thread.join()
+    assert calls == ["sync"]
+    assert caches.report()["retrieval"]["hits"] == 1
+
+
+def test_cancelled_waiter_does_not_cancel_the_owner():
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        return 42
+
+    async def main():
+        owner = asyncio.ensure_future(flight.acall("key", slow))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.acall("key", slow))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await owner
+
+    assert asyncio.run(main()) == (42, False)
+
+
+def test_sync_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.call("key", compute))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(results) == [("value", False)] + [("value", True)] * 4
+    assert flight.in_flight == {}